@@ -0,0 +1,183 @@
+import calendar
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import ExpenseRollupModel
+
+WEEKDAY_LABELS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+@dataclass
+class ExpenseHistory:
+    """A user's spending as parallel arrays of (day, category code, amount).
+
+    ``day`` counts days from ``start``; ``category`` indexes ``categories``;
+    ``amount`` is in rubles, converted from the stored kopecks.
+    One entry per (day, category) pair, so years of history stay a few
+    thousand elements long.
+    """
+
+    start: date
+    categories: List[str]
+    day: np.ndarray
+    category: np.ndarray
+    amount: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.day.size)
+
+    def daily_totals(self, first: date, last: date) -> np.ndarray:
+        """Total spent on each day from ``first`` to ``last`` inclusive."""
+        length = (last - first).days + 1
+        if length <= 0:
+            return np.zeros(0)
+        index = self.day - (first - self.start).days
+        mask = (index >= 0) & (index < length)
+        return np.bincount(index[mask], weights=self.amount[mask], minlength=length)
+
+    def category_totals(self, first: date, last: date) -> np.ndarray:
+        """Total spent per category code from ``first`` to ``last`` inclusive."""
+        low = (first - self.start).days
+        high = (last - self.start).days
+        mask = (self.day >= low) & (self.day <= high)
+        return np.bincount(
+            self.category[mask], weights=self.amount[mask], minlength=len(self.categories)
+        )
+
+
+async def load_expense_history(
+    db: AsyncSession, user_id: int, since: Optional[date] = None
+) -> ExpenseHistory:
+    """Load a user's per-day category totals from the rollup table in one query."""
+    query = select(
+        ExpenseRollupModel.day, ExpenseRollupModel.category, ExpenseRollupModel.total
+    ).where(ExpenseRollupModel.user_id == user_id, ExpenseRollupModel.total != 0)
+    if since is not None:
+        query = query.where(ExpenseRollupModel.day >= since)
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return ExpenseHistory(
+            start=since or date.today(),
+            categories=[],
+            day=np.zeros(0, dtype=np.int32),
+            category=np.zeros(0, dtype=np.int16),
+            amount=np.zeros(0),
+        )
+    ordinals = np.fromiter((row.day.toordinal() for row in rows), np.int32, len(rows))
+    categories, codes = np.unique([row.category for row in rows], return_inverse=True)
+    start_ordinal = int(ordinals.min())
+    return ExpenseHistory(
+        start=date.fromordinal(start_ordinal),
+        categories=categories.tolist(),
+        day=ordinals - start_ordinal,
+        category=codes.astype(np.int16),
+        amount=np.fromiter((row.total for row in rows), np.int64, len(rows)) / 100,
+    )
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over ``window`` days; the first days average what exists."""
+    if not values.size:
+        return np.zeros(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    index = np.arange(values.size)
+    low = np.maximum(index + 1 - window, 0)
+    return (cumulative[index + 1] - cumulative[low]) / (index + 1 - low)
+
+
+def weekday_averages(daily: np.ndarray, first: date) -> np.ndarray:
+    """Average daily spend per weekday, Monday first, counting days without expenses."""
+    weekday = (first.weekday() + np.arange(daily.size)) % 7
+    sums = np.bincount(weekday, weights=daily, minlength=7)
+    counts = np.bincount(weekday, minlength=7)
+    return sums / np.maximum(counts, 1)
+
+
+@dataclass
+class CategoryDelta:
+    category: str
+    current: float
+    previous: float
+
+    @property
+    def change(self) -> float:
+        return self.current - self.previous
+
+
+@dataclass
+class TrendReport:
+    """Everything the trend charts and the analytics reply need."""
+
+    first_day: date
+    daily: List[float]
+    rolling_7: List[float]
+    rolling_30: List[float]
+    month_to_date: float
+    previous_month_to_date: float
+    projected_month_total: float
+    weekday_averages: List[float]
+    category_deltas: List[CategoryDelta] = field(default_factory=list)
+
+    @property
+    def month_change(self) -> float:
+        return self.month_to_date - self.previous_month_to_date
+
+
+def _previous_month_span(today: date) -> tuple[date, date]:
+    """The same days of the previous month, clipped to its length."""
+    last_of_previous = today.replace(day=1) - timedelta(days=1)
+    first_of_previous = last_of_previous.replace(day=1)
+    return first_of_previous, last_of_previous.replace(
+        day=min(today.day, last_of_previous.day)
+    )
+
+
+def build_trend_report(
+    history: ExpenseHistory, today: Optional[date] = None, window: int = 90
+) -> TrendReport:
+    """Compute rolling averages, month-over-month deltas, weekday pattern and projection.
+
+    Rolling averages and the weekday pattern use the whole history so the
+    first days of the ``window`` shown on the chart are not distorted.
+    """
+    today = today or date.today()
+    first = min(history.start, today)
+    daily = history.daily_totals(first, today)
+    rolling_7 = rolling_mean(daily, 7)
+    rolling_30 = rolling_mean(daily, 30)
+
+    month_start = today.replace(day=1)
+    previous_start, previous_end = _previous_month_span(today)
+    current = history.category_totals(month_start, today)
+    previous = history.category_totals(previous_start, previous_end)
+    month_to_date = float(current.sum())
+
+    # Project the rest of the month at the pace of the last 30 days.
+    days_in_month = calendar.monthrange(today.year, today.month)[1]
+    remaining_days = days_in_month - today.day
+    projected = month_to_date + float(rolling_30[-1]) * remaining_days
+
+    order = np.argsort(-(current + previous), kind="stable")
+    deltas = [
+        CategoryDelta(history.categories[code], float(current[code]), float(previous[code]))
+        for code in order
+        if current[code] or previous[code]
+    ]
+
+    shown = slice(max(daily.size - window, 0), None)
+    return TrendReport(
+        first_day=today - timedelta(days=daily[shown].size - 1),
+        daily=daily[shown].tolist(),
+        rolling_7=rolling_7[shown].tolist(),
+        rolling_30=rolling_30[shown].tolist(),
+        month_to_date=month_to_date,
+        previous_month_to_date=float(previous.sum()),
+        projected_month_total=projected,
+        weekday_averages=weekday_averages(daily, first).tolist(),
+        category_deltas=deltas,
+    )
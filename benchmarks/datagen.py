@@ -0,0 +1,149 @@
+"""Deterministic synthetic expense data.
+
+    python -m benchmarks.datagen --rows 1000000 --users 5000 --database-url sqlite+aiosqlite:///bench.db
+
+A database that already holds rows is refused unless ``--reset`` is given,
+which drops and recreates every table.
+"""
+import argparse
+import asyncio
+import math
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+from sqlalchemy import inspect, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, ExpenseModel
+from schemas import CategoryENUM
+from services import rebuild_expense_rollups
+
+# Relative frequency and median amount (₽) per category.
+CATEGORY_PROFILE = {
+    CategoryENUM.FOOD: (30, 900),
+    CategoryENUM.FASTFOOD: (12, 450),
+    CategoryENUM.EXTRA_SNACKS: (10, 250),
+    CategoryENUM.TRANSPORT: (10, 120),
+    CategoryENUM.SCOOTER: (5, 180),
+    CategoryENUM.CARSHARING: (3, 700),
+    CategoryENUM.RESTAURANTS: (5, 2500),
+    CategoryENUM.ENTERTAINMENT: (4, 1500),
+    CategoryENUM.CHILD: (4, 1200),
+    CategoryENUM.PHARMACY: (4, 600),
+    CategoryENUM.CLOTHING: (2, 3500),
+    CategoryENUM.MEDICINE: (2, 3000),
+    CategoryENUM.SUBSCRIPTIONS: (2, 400),
+    CategoryENUM.KINDERGARTEN: (1, 8000),
+    CategoryENUM.UTILITIES: (1, 6000),
+    CategoryENUM.CREDITS: (1, 15000),
+}
+
+# Relative likelihood of an expense in each hour of the day.
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 12, 10, 8, 9, 14, 12, 9, 8, 9, 12, 15, 14, 10, 6, 3, 2]
+
+
+def generate_rows(
+    rows: int, users: int, days: int = 365, seed: int = 42, now: datetime | None = None
+) -> Iterator[dict]:
+    """Yield expense rows; the same arguments always give the same rows.
+
+    User activity follows a Zipf-like distribution (user 1 is the most
+    active), categories and hours follow fixed weights and amounts are
+    log-normal around each category's median.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    start = (now - timedelta(days=days - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    user_weights = [1 / rank**1.1 for rank in range(1, users + 1)]
+    categories = list(CATEGORY_PROFILE)
+    category_weights = [CATEGORY_PROFILE[category][0] for category in categories]
+    user_ids = rng.choices(range(1, users + 1), weights=user_weights, k=rows)
+    for user_id in user_ids:
+        category = rng.choices(categories, weights=category_weights)[0]
+        median = CATEGORY_PROFILE[category][1]
+        moment = start + timedelta(
+            days=rng.randrange(days),
+            hours=rng.choices(range(24), weights=HOUR_WEIGHTS)[0],
+            seconds=rng.randrange(3600),
+        )
+        if moment > now:
+            moment = now - timedelta(seconds=rng.randrange(3600))
+        yield {
+            "user_id": user_id,
+            "category": category.value,
+            "amount": round(rng.lognormvariate(math.log(median), 0.6) * 100),
+            "date": moment,
+        }
+
+
+def _has_rows(connection: Connection) -> bool:
+    existing = set(inspect(connection).get_table_names())
+    return any(
+        connection.execute(select(table).limit(1)).first() is not None
+        for table in Base.metadata.sorted_tables
+        if table.name in existing
+    )
+
+
+async def populate(
+    engine: AsyncEngine,
+    rows: int,
+    users: int,
+    days: int = 365,
+    seed: int = 42,
+    chunk_size: int = 10000,
+    reset: bool = False,
+) -> None:
+    """Fill an empty database with generated expenses and rollups.
+
+    With ``reset`` every table is dropped and recreated first; without it
+    a database that already holds rows raises ValueError.
+    """
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        elif await conn.run_sync(_has_rows):
+            raise ValueError(
+                f"{engine.url.render_as_string(hide_password=True)} is not empty; "
+                "pass --reset to drop its tables"
+            )
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with session_factory() as db:
+        chunk: List[dict] = []
+        for row in generate_rows(rows, users, days, seed):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                await db.execute(insert(ExpenseModel.__table__), chunk)
+                chunk = []
+        if chunk:
+            await db.execute(insert(ExpenseModel.__table__), chunk)
+        await db.commit()
+        await rebuild_expense_rollups(db)
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(args.database_url)
+    try:
+        await populate(
+            engine, args.rows, args.users, args.days, args.seed, reset=args.reset
+        )
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+    finally:
+        await engine.dispose()
+    print(f"Generated {args.rows} expenses for {args.users} users")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--reset", action="store_true", help="drop existing tables first")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+"""Send a burst of bulk photos plus interactive replies to a local fake Bot API.
+
+    python -m benchmarks.delivery --chats 100 --bulk 300 --mode queue
+    python -m benchmarks.delivery --chats 100 --bulk 300 --mode direct
+
+``direct`` sends everything at once like inline handler replies did;
+``queue`` goes through DeliveryQueue. Both report flood errors seen by the
+server, failed sends, uploads and interactive reply latency.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import BufferedInputFile  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI  # noqa: E402
+from delivery import (DeliveryMiddleware, DeliveryQueue,  # noqa: E402
+                      bulk_delivery)
+
+
+def percentile(samples: list[float], share: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, round(share * (len(ordered) - 1)))]
+
+
+async def main(args: argparse.Namespace) -> None:
+    server = FakeBotAPI()
+    await server.start()
+    bot = Bot(
+        token=os.environ["BOT_TOKEN"],
+        session=AiohttpSession(api=TelegramAPIServer.from_base(server.url)),
+    )
+    queue = None
+    if args.mode == "queue":
+        queue = DeliveryQueue()
+        bot.session.middleware(DeliveryMiddleware(queue))
+
+    charts = [os.urandom(20_000) for _ in range(args.distinct_charts)]
+    rng = random.Random(1)
+    failures = 0
+    latencies: list[float] = []
+
+    async def bulk_send(index: int):
+        nonlocal failures
+        chat_id = 1 + index % args.chats
+        chart = charts[index % len(charts)]
+        with bulk_delivery():
+            try:
+                await bot.send_photo(
+                    chat_id, BufferedInputFile(chart, "digest.png"), caption=f"digest {index}"
+                )
+            except Exception:
+                failures += 1
+
+    async def interactive():
+        nonlocal failures
+        for _ in range(args.interactive):
+            await asyncio.sleep(args.interactive_interval)
+            started = time.perf_counter()
+            try:
+                await bot.send_message(rng.randint(1, args.chats), "Трата добавлена!")
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(interactive(), *(bulk_send(index) for index in range(args.bulk)))
+    elapsed = time.perf_counter() - started
+
+    if queue is not None:
+        await queue.close()
+    await bot.session.close()
+    await server.stop()
+
+    print(f"mode {args.mode}: {elapsed:.1f} s for {args.bulk} bulk + {args.interactive} interactive")
+    print(f"  flood errors from server: {server.flood_errors}, failed sends: {failures}")
+    print(f"  uploads: {server.uploads}, file_id reuses: {server.file_id_sends}")
+    if latencies:
+        print(
+            f"  interactive latency p50 {statistics.median(latencies) * 1000:.0f} ms,"
+            f" p95 {percentile(latencies, 0.95) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["queue", "direct"], default="queue")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--bulk", type=int, default=300)
+    parser.add_argument("--distinct-charts", type=int, default=10)
+    parser.add_argument("--interactive", type=int, default=20)
+    parser.add_argument("--interactive-interval", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""In-process stand-ins for the Telegram Bot API used by the benchmarks."""
+import asyncio
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, AsyncGenerator, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, GetUpdates, TelegramMethod
+from aiogram.types import InputFile, Message, Update, User
+
+
+class FakeSession(BaseSession):
+    """Bot session that records API calls instead of sending them.
+
+    Uploaded files are read to the end so their cost is still paid.
+    ``GetUpdates`` is answered from ``updates`` for polling benchmarks.
+    """
+
+    def __init__(self, latency: float = 0.0, updates: Optional[Iterable[dict]] = None):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.uploaded_bytes = 0
+        self._updates = deque(updates or [])
+        self._message_id = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] += 1
+        for field_name in type(method).model_fields:
+            value = getattr(method, field_name)
+            if isinstance(value, InputFile):
+                async for chunk in value.read(bot):
+                    self.uploaded_bytes += len(chunk)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, GetUpdates):
+            batch = [
+                self._updates.popleft()
+                for _ in range(min(method.limit or 100, len(self._updates)))
+            ]
+            if not batch:
+                await asyncio.sleep(0.01)
+            return [Update.model_validate(update, context={"bot": bot}) for update in batch]
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="Bot", username="finance_bot")
+        if method.__returning__ is Message:
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", 0)
+            return Message.model_validate(
+                {
+                    "message_id": self._message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                },
+                context={"bot": bot},
+            )
+        return True
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: Optional[dict] = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    """Build a private text message update."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now().timestamp()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": _user(user_id),
+            "text": text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """Build an inline button press on a bot message."""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bot"},
+                "text": "Выберите категорию:",
+            },
+        },
+    }
@@ -0,0 +1,152 @@
+"""A local HTTP stand-in for the Telegram Bot API with flood limits.
+
+Point a bot at it with::
+
+    AiohttpSession(api=TelegramAPIServer.from_base(server.url))
+
+Sends beyond ``global_rate`` per second in total, or beyond a burst of
+``chat_burst`` refilled at ``chat_rate`` per second for one chat, get a
+429 answer with ``retry_after`` like the real API.
+"""
+import asyncio
+import json
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from typing import Deque, Dict, Optional
+
+from aiohttp import web
+
+SEND_METHODS = {"sendmessage", "sendphoto", "senddocument", "sendmediagroup"}
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        global_rate: int = 30,
+        chat_rate: int = 1,
+        chat_burst: int = 3,
+        retry_after: int = 1,
+        latency: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.retry_after = retry_after
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.flood_errors = 0
+        self.uploads = 0
+        self.file_id_sends = 0
+        self.delivered: Dict[int, list] = defaultdict(list)
+        self._global: Deque[float] = deque()
+        self._chats: Dict[int, Deque[float]] = defaultdict(deque)
+        self._message_id = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=50 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def _over_limit(self, chat_id: Optional[int]) -> bool:
+        """Sliding one-second windows; a chat may also burst up to ``chat_burst``."""
+        now = time.monotonic()
+        while self._global and now - self._global[0] >= 1:
+            self._global.popleft()
+        if len(self._global) >= self.global_rate:
+            return True
+        if chat_id is not None:
+            window = self._chats[chat_id]
+            span = self.chat_burst / self.chat_rate
+            while window and now - window[0] >= span:
+                window.popleft()
+            if len(window) >= self.chat_burst:
+                return True
+            window.append(now)
+        self._global.append(now)
+        return False
+
+    def _message(self, chat_id: int, extra: Optional[dict] = None) -> dict:
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        message.update(extra or {})
+        return message
+
+    def _file(self, form, field: str) -> str:
+        value = form.get(field)
+        if isinstance(value, str) and value.startswith("attach://"):
+            self.uploads += 1
+            return f"file-{uuid.uuid4().hex}"
+        self.file_id_sends += 1
+        return value
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        form = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = int(form["chat_id"]) if "chat_id" in form else None
+        if method in SEND_METHODS and self._over_limit(chat_id):
+            self.flood_errors += 1
+            return web.json_response(
+                {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                },
+                status=429,
+            )
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "finance_bot"}
+        elif method == "sendmessage":
+            result = self._message(chat_id, {"text": form.get("text", "")})
+            self.delivered[chat_id].append(form.get("text", ""))
+        elif method == "sendphoto":
+            file_id = self._file(form, "photo")
+            photo = [{"file_id": file_id, "file_unique_id": file_id, "width": 1, "height": 1}]
+            result = self._message(chat_id, {"photo": photo, "caption": form.get("caption")})
+            self.delivered[chat_id].append(form.get("caption"))
+        elif method == "senddocument":
+            file_id = self._file(form, "document")
+            document = {"file_id": file_id, "file_unique_id": file_id}
+            result = self._message(chat_id, {"document": document})
+            self.delivered[chat_id].append(form.get("caption"))
+        elif method == "sendmediagroup":
+            result = []
+            for item in json.loads(form["media"]):
+                media = item["media"]
+                if media.startswith("attach://"):
+                    self.uploads += 1
+                    media = f"file-{uuid.uuid4().hex}"
+                else:
+                    self.file_id_sends += 1
+                photo = [{"file_id": media, "file_unique_id": media, "width": 1, "height": 1}]
+                result.append(self._message(chat_id, {"photo": photo}))
+            self.delivered[chat_id].append("media_group")
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
@@ -0,0 +1,64 @@
+"""Measure per-update FSM storage overhead.
+
+Each simulated update does what aiogram does for the amount step:
+get_state, get_data, then set_state and set_data.
+
+    python -m benchmarks.fsm_storage --users 200 --updates 2000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fsm_storage import SQLStorage
+from models import Base
+
+
+async def run_updates(storage, users: int, updates: int) -> float:
+    keys = [StorageKey(bot_id=1, chat_id=user, user_id=user) for user in range(users)]
+    started = time.perf_counter()
+    for index in range(updates):
+        key = keys[index % users]
+        await storage.get_state(key)
+        data = await storage.get_data(key)
+        await storage.set_state(key, "ExpenseState:waiting_for_amount")
+        await storage.set_data(key, {**data, "category": "еда"})
+    return (time.perf_counter() - started) / updates
+
+
+async def main(users: int, updates: int, database_url: str | None) -> None:
+    path = None
+    if database_url is None:
+        descriptor, path = tempfile.mkstemp(suffix=".db")
+        os.close(descriptor)
+        database_url = f"sqlite+aiosqlite:///{path}"
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        candidates = {
+            "memory": MemoryStorage(),
+            "sql, no cache": SQLStorage(engine, cache_ttl=0),
+            "sql, cached": SQLStorage(engine),
+        }
+        for name, storage in candidates.items():
+            per_update = await run_updates(storage, users, updates)
+            print(f"{name:>14}: {per_update * 1000:.3f} ms/update")
+    finally:
+        await engine.dispose()
+        if path is not None:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.updates, args.database_url))
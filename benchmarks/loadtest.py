@@ -0,0 +1,115 @@
+"""Replay full user flows through the dispatcher and report handler latency.
+
+Every virtual user runs "Внести трату" -> category -> amount -> month view ->
+"Скачать отчёт" -> month report, one update after another, while users run
+concurrently. Updates go straight into ``dp.feed_update``; Bot API calls are
+recorded by a fake session instead of hitting the network.
+
+    python -m benchmarks.loadtest --users 500 --concurrency 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+os.environ.setdefault("BOT_TOKEN", "123456:loadtest")
+# Removed with its database when the process exits
+_database_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_database_dir.name}/bench.db")
+
+from aiogram.types import Update  # noqa: E402
+
+from benchmarks.fake_bot import (FakeSession, callback_update,  # noqa: E402
+                                 message_update)
+from schemas import CategoryENUM  # noqa: E402
+
+STEPS = (
+    "add_expense",
+    "category",
+    "amount",
+    "view_month",
+    "download_report",
+    "report_month",
+)
+
+
+def build_flow(user_id: int, first_update_id: int, rng: random.Random) -> list[tuple[str, dict]]:
+    category = rng.choice(list(CategoryENUM)).value
+    amount = f"{rng.uniform(50, 3000):.2f}"
+    payloads = (
+        message_update(first_update_id, user_id, "Внести трату"),
+        callback_update(first_update_id + 1, user_id, f"category_{category}"),
+        message_update(first_update_id + 2, user_id, amount),
+        message_update(first_update_id + 3, user_id, "Посмотреть траты с начала месяца"),
+        message_update(first_update_id + 4, user_id, "Скачать отчёт"),
+        callback_update(first_update_id + 5, user_id, "report_month"),
+    )
+    return list(zip(STEPS, payloads))
+
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+async def main(args: argparse.Namespace) -> None:
+    from bot import bot, dp
+    from database import engine
+    from models import Base
+    from rendering import chart_renderer
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session = FakeSession(latency=args.api_latency)
+    bot.session = session
+    await chart_renderer.wait_until_ready()
+
+    rng = random.Random(args.seed)
+    flows = [
+        build_flow(user_id, user_id * len(STEPS), rng) for user_id in range(1, args.users + 1)
+    ]
+    latencies = defaultdict(list)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_user(flow: list[tuple[str, dict]]) -> None:
+        async with semaphore:
+            for step, payload in flow:
+                update = Update.model_validate(payload, context={"bot": bot})
+                started = time.perf_counter()
+                await dp.feed_update(bot, update)
+                latencies[step].append(time.perf_counter() - started)
+                if args.think_time:
+                    await asyncio.sleep(rng.uniform(0, args.think_time))
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_user(flow) for flow in flows))
+        elapsed = time.perf_counter() - started
+    finally:
+        chart_renderer.shutdown()
+        await engine.dispose()
+
+    everything = sorted(value for values in latencies.values() for value in values)
+    print(f"{len(everything)} updates in {elapsed:.2f}s: {len(everything) / elapsed:.0f} updates/s")
+    print(f"{'step':<16} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for step in (*STEPS, "all"):
+        ordered = everything if step == "all" else sorted(latencies[step])
+        print(
+            f"{step:<16} {statistics.median(ordered) * 1000:9.2f}"
+            f" {percentile(ordered, 0.95) * 1000:9.2f} {percentile(ordered, 0.99) * 1000:9.2f}"
+        )
+    print("Bot API calls:", dict(session.calls))
+    print(f"Uploaded {session.uploaded_bytes} bytes")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--think-time", type=float, default=0.0, help="max pause between steps, s")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="fake Bot API latency, s")
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,156 @@
+"""Measure bot start-up: import time and time to the first handled update.
+
+    python -m benchmarks.startup --runs 5 --output startup.json
+    python -m benchmarks.startup --compare startup.json
+
+Every run is a fresh interpreter with a new SQLite database and a fake Bot
+API session. It times ``import bot``, the ``start_up()`` pipeline (schema
+migrations overlapped with the bot login) and a ``/start`` update through
+the dispatcher, all from the start of the process. The background warm-up
+is timed separately, because it is off the critical path. The run fails
+when ``import bot`` pulls in a module from ``HEAVY_MODULES``, and with
+``--compare`` when a median is more than ``--threshold`` slower than the
+baseline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Modules that must only load in chart workers or on first use.
+HEAVY_MODULES = ("matplotlib", "numpy", "analytics", "charts")
+METRICS = ("import_s", "ready_s", "first_update_s", "warm_up_s")
+
+
+async def handle_first_update(started: float) -> dict:
+    from aiogram.types import Update
+
+    import bot as bot_module
+    from benchmarks.fake_bot import FakeSession, message_update
+    from database import engine
+    from rendering import chart_renderer
+
+    bot_module.bot.session = FakeSession()
+    warm_up_task = await bot_module.start_up()
+    ready = time.perf_counter()
+    update = Update.model_validate(
+        message_update(1, 1, "/start"), context={"bot": bot_module.bot}
+    )
+    await bot_module.dp.feed_update(bot_module.bot, update)
+    handled = time.perf_counter()
+    try:
+        await warm_up_task
+        warmed = time.perf_counter()
+    finally:
+        chart_renderer.shutdown()
+        await engine.dispose()
+    return {
+        "ready_s": ready - started,
+        "first_update_s": handled - started,
+        "warm_up_s": warmed - started,
+    }
+
+
+def run_child() -> None:
+    started = time.perf_counter()
+    import bot  # noqa: F401
+
+    result = {
+        "import_s": time.perf_counter() - started,
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+    result.update(asyncio.run(handle_first_update(started)))
+    print(json.dumps(result))
+
+
+def run_once() -> dict:
+    descriptor, path = tempfile.mkstemp(suffix=".db")
+    os.close(descriptor)
+    env = dict(
+        os.environ,
+        BOT_TOKEN="123456:startup",
+        DATABASE_URL=f"sqlite+aiosqlite:///{path}",
+        DIGESTS_ENABLED="false",
+        METRICS_PORT="0",
+    )
+    try:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child"],
+            env=env,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> int:
+    runs = [run_once() for _ in range(args.runs)]
+    results = {
+        name: {
+            "median_ms": statistics.median(run[name] for run in runs) * 1000,
+            "max_ms": max(run[name] for run in runs) * 1000,
+        }
+        for name in METRICS
+    }
+    heavy = sorted({name for run in runs for name in run["heavy_modules"]})
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "runs": args.runs,
+        },
+        "results": results,
+        "heavy_modules": heavy,
+    }
+    for name, stats in results.items():
+        print(f"{name:<16} median {stats['median_ms']:9.1f} ms  max {stats['max_ms']:9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    failed = False
+    if heavy:
+        print(f"REGRESSION import bot loads {', '.join(heavy)}")
+        failed = True
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["results"]
+        for name, stats in results.items():
+            reference = baseline.get(name)
+            if not reference or not reference["median_ms"]:
+                continue
+            change = stats["median_ms"] / reference["median_ms"] - 1
+            if change > args.threshold:
+                print(
+                    f"REGRESSION {name}: {reference['median_ms']:.1f} -> "
+                    f"{stats['median_ms']:.1f} ms (+{change:.0%})"
+                )
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child()
+    else:
+        raise SystemExit(main(args))
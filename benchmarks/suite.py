@@ -0,0 +1,221 @@
+"""Time the services and chart builders at several data sizes.
+
+    python -m benchmarks.suite --sizes 10000,100000,1000000 --output results.json
+    python -m benchmarks.suite --sizes 10000 --compare baseline.json
+
+Each size gets a freshly generated database: a temporary SQLite file, or
+the scratch database at ``--database-url``, whose tables are dropped only
+when ``--reset`` is given. ``--compare`` exits with status 1 when an operation's median is
+more than ``--threshold`` slower than in the baseline file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from analytics import build_trend_report, load_expense_history
+from benchmarks.datagen import populate
+from cache import get_summary_cache
+from charts import build_category_pie_chart, build_period_snapshot_chart
+from schemas import CategoryENUM, ExpenseCreateSchema
+from services import (add_expense, build_summary_periods,
+                      export_expenses_to_csv, get_month_summary,
+                      get_period_summary, get_summaries, get_today_summary)
+
+HEAVY_USER_ID = 1
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    p95_index = min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))
+    return {
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": ordered[p95_index] * 1000,
+        "runs": len(ordered),
+    }
+
+
+async def measure(repeat: int, func) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+async def bench_size(
+    database_url: str, rows: int, users: int, repeat: int, reset: bool = False
+) -> dict:
+    engine = create_async_engine(database_url)
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    results = {}
+    try:
+        started = time.perf_counter()
+        await populate(engine, rows, users, reset=reset)
+        results["populate_s"] = time.perf_counter() - started
+        cache = get_summary_cache()
+        now = datetime.utcnow()
+
+        async with session_factory() as db:
+            async def period_summary():
+                await get_period_summary(db, HEAVY_USER_ID, now - timedelta(days=30), now)
+
+            async def today_summary():
+                await cache.clear()
+                await get_today_summary(db, HEAVY_USER_ID)
+
+            async def month_summary():
+                await cache.clear()
+                await get_month_summary(db, HEAVY_USER_ID)
+
+            async def all_summaries():
+                await get_summaries(db, HEAVY_USER_ID, build_summary_periods())
+
+            async def export_year():
+                export = await export_expenses_to_csv(
+                    db, HEAVY_USER_ID, now - timedelta(days=365), now
+                )
+                export.file.close()
+
+            async def insert_expense():
+                await add_expense(
+                    db,
+                    ExpenseCreateSchema(
+                        user_id=HEAVY_USER_ID, category=CategoryENUM.FOOD, amount=10000
+                    ),
+                )
+
+            async def trend_report():
+                history = await load_expense_history(db, HEAVY_USER_ID)
+                build_trend_report(history)
+
+            operations = {
+                "get_period_summary": period_summary,
+                "get_today_summary": today_summary,
+                "get_month_summary": month_summary,
+                "get_summaries": all_summaries,
+                "export_expenses_to_csv": export_year,
+                "build_trend_report": trend_report,
+                "add_expense": insert_expense,
+            }
+            for name, func in operations.items():
+                results[name] = await measure(repeat, func)
+
+            await cache.clear()
+            month = await get_month_summary(db, HEAVY_USER_ID)
+            today = await get_today_summary(db, HEAVY_USER_ID)
+
+        category_totals = [
+            (item.category, float(item.total.rubles)) for item in month.category_breakdown
+        ]
+
+        async def pie_chart():
+            build_category_pie_chart(category_totals, "Категории трат за месяц")
+
+        async def snapshot_chart():
+            build_period_snapshot_chart(
+                float(today.total.rubles), float(month.total.rubles)
+            )
+
+        results["build_category_pie_chart"] = await measure(repeat, pie_chart)
+        results["build_period_snapshot_chart"] = await measure(repeat, snapshot_chart)
+    finally:
+        await engine.dispose()
+    return results
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[str]:
+    """List operations whose median got slower than the baseline allows."""
+    regressions = []
+    for size, operations in current["results"].items():
+        for name, stats in operations.items():
+            if not isinstance(stats, dict):
+                continue
+            reference = baseline.get("results", {}).get(size, {}).get(name)
+            if not isinstance(reference, dict) or not reference["median_ms"]:
+                continue
+            change = stats["median_ms"] / reference["median_ms"] - 1
+            if change > threshold:
+                regressions.append(
+                    f"{size} rows, {name}: {reference['median_ms']:.2f} -> "
+                    f"{stats['median_ms']:.2f} ms (+{change:.0%})"
+                )
+    return regressions
+
+
+async def main(args: argparse.Namespace) -> int:
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "database": "postgresql" if args.database_url else "sqlite",
+            "users": args.users,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size in args.sizes:
+        path = None
+        database_url = args.database_url
+        if database_url is None:
+            descriptor, path = tempfile.mkstemp(suffix=".db")
+            os.close(descriptor)
+            database_url = f"sqlite+aiosqlite:///{path}"
+        try:
+            results = await bench_size(
+                database_url, size, args.users, args.repeat, args.reset
+            )
+        finally:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        report["results"][str(size)] = results
+        for name, stats in results.items():
+            if isinstance(stats, dict):
+                print(
+                    f"{size:>9} {name:<28} median {stats['median_ms']:9.2f} ms"
+                    f"  p95 {stats['p95_ms']:9.2f} ms"
+                )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[10000, 100000],
+    )
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument(
+        "--reset", action="store_true", help="drop the tables at --database-url first"
+    )
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,162 @@
+"""Compare update throughput of polling and the webhook update processor.
+
+Synthetic users run "Внести трату" -> category -> amount against a temporary
+SQLite database; Bot API calls go to an in-process fake session. Polling
+handles updates one at a time, the way it has to for a user's steps to stay
+in order, so both runs must save one expense per user.
+
+    python -m benchmarks.webhook_throughput --users 200
+    python -m benchmarks.webhook_throughput --updates recorded.jsonl
+
+With ``--url`` the updates are POSTed to an already running webhook server
+instead, e.g. to try recorded payloads against a local ``BOT_MODE=webhook``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+# Removed with its database when the process exits
+_database_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_database_dir.name}/bench.db")
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+from benchmarks.fake_bot import (FakeSession, callback_update,  # noqa: E402
+                                 message_update)
+from webhook import SECRET_HEADER, UpdateProcessor, create_app  # noqa: E402
+
+
+def synthetic_updates(users: int) -> list[dict]:
+    updates = []
+    update_id = 0
+    for step in range(4):
+        for user_id in range(1, users + 1):
+            update_id += 1
+            if step == 0:
+                updates.append(message_update(update_id, user_id, "/start"))
+            elif step == 1:
+                updates.append(message_update(update_id, user_id, "Внести трату"))
+            elif step == 2:
+                updates.append(callback_update(update_id, user_id, "category_еда"))
+            else:
+                updates.append(message_update(update_id, user_id, "150"))
+    return updates
+
+
+def user_of(update: dict) -> int:
+    event = update.get("message") or update.get("callback_query") or {}
+    return event.get("from", {}).get("id", update["update_id"])
+
+
+async def run_polling(dp, bot, updates: list[dict]) -> float:
+    bot.session = FakeSession(updates=updates)
+    done = asyncio.Event()
+    processed = 0
+
+    async def count(handler, event, data):
+        nonlocal processed
+        try:
+            return await handler(event, data)
+        finally:
+            processed += 1
+            if processed == len(updates):
+                done.set()
+
+    dp.update.outer_middleware(count)
+    started = time.perf_counter()
+    polling = asyncio.create_task(
+        dp.start_polling(
+            bot, handle_signals=False, close_bot_session=False, handle_as_tasks=False
+        )
+    )
+    await done.wait()
+    elapsed = time.perf_counter() - started
+    await dp.stop_polling()
+    await polling
+    dp.update.outer_middleware._middlewares.remove(count)
+    return elapsed
+
+
+async def post_per_user(url: str, updates: list[dict], secret: str) -> None:
+    by_user = defaultdict(list)
+    for update in updates:
+        by_user[user_of(update)].append(update)
+    headers = {SECRET_HEADER: secret} if secret else {}
+
+    async with aiohttp.ClientSession() as client:
+        async def send(user_updates: list[dict]) -> None:
+            for update in user_updates:
+                async with client.post(url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"update {update['update_id']}: HTTP {response.status}")
+
+        await asyncio.gather(*(send(items) for items in by_user.values()))
+
+
+async def run_webhook(dp, bot, updates: list[dict]) -> float:
+    bot.session = FakeSession()
+    processor = UpdateProcessor(dp, bot)
+    runner = web.AppRunner(
+        create_app(dp, bot, secret="benchmark", processor=processor), access_log=None
+    )
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    started = time.perf_counter()
+    await post_per_user(f"http://127.0.0.1:{port}/webhook", updates, "benchmark")
+    await processor.join()
+    elapsed = time.perf_counter() - started
+    await runner.cleanup()
+    return elapsed
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.updates:
+        with open(args.updates, encoding="utf-8") as file:
+            updates = [json.loads(line) for line in file if line.strip()]
+    else:
+        updates = synthetic_updates(args.users)
+
+    if args.url:
+        started = time.perf_counter()
+        await post_per_user(args.url, updates, args.secret)
+        print(f"posted {len(updates)} updates in {time.perf_counter() - started:.2f}s")
+        return
+
+    from sqlalchemy import func, select
+
+    from bot import bot, dp
+    from database import async_session, engine
+    from models import Base, ExpenseModel
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        for name, runner in (("polling", run_polling), ("webhook", run_webhook)):
+            async with async_session() as db:
+                before = await db.scalar(select(func.count(ExpenseModel.id)))
+            elapsed = await runner(dp, bot, updates)
+            async with async_session() as db:
+                saved = await db.scalar(select(func.count(ExpenseModel.id))) - before
+            print(
+                f"{name:>8}: {len(updates) / elapsed:8.0f} updates/s ({elapsed:.2f}s), "
+                f"{saved} expenses saved"
+            )
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", help="JSON lines file with recorded updates")
+    parser.add_argument("--url", help="POST to a running webhook server instead")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    asyncio.run(main(parser.parse_args()))
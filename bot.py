@@ -1,26 +1,96 @@
+import asyncio
+import csv
+import importlib
 import logging
-
-import matplotlib
-
-matplotlib.use("Agg")
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import (TYPE_CHECKING, AsyncGenerator, BinaryIO, Optional,
+                    Tuple)
 
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (InlineKeyboardButton, InlineKeyboardMarkup,
-                           KeyboardButton, ReplyKeyboardMarkup)
-from charts import build_category_pie_chart
-from config import BOT_TOKEN
-from database import async_session
-from schemas import CategoryENUM, ExpenseCreateSchema
-from services import (add_expense, export_expenses_to_csv, get_month_summary,
-                      get_today_summary)
+                           InputMediaPhoto, KeyboardButton, ReplyKeyboardMarkup)
+from cache import get_summary_cache
+from chart_cache import chart_cache
+from config import (BOT_MODE, BOT_TOKEN, DELIVERY_ENABLED, DIGESTS_ENABLED,
+                    EXPENSE_WRITE_BATCHING, METRICS_PORT)
+from database import async_session, engine, pool_snapshots, shard_router
+from delivery import DeliveryMiddleware, DeliveryQueue, bulk_delivery
+from fsm_storage import SQLStorage, build_fsm_storage
+from importer import ImportProgress, import_csv
+from metrics import HandlerMetricsMiddleware, registry, start_metrics_server
+from rendering import ChartRenderError, chart_renderer
+from scheduler import Digest, DigestScheduler
+from schemas import (BudgetStatusSchema, CategoryENUM, ExpenseCreateSchema,
+                     ExpensePageSchema, Money)
+from services import (add_expense, build_summary_periods,
+                      export_expenses_to_csv, get_budgets, get_expense_page,
+                      get_month_summary, get_summaries, get_today_summary,
+                      set_budget)
+from sqlalchemy.exc import SQLAlchemyError
+from webhook import consume_updates, run_webhook
+from write_buffer import ExpenseWriteBuffer, ExpenseWriteError
+
+# analytics pulls in NumPy, so it is imported on first use or by warm_up().
+if TYPE_CHECKING:
+    from analytics import TrendReport
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+delivery_queue = DeliveryQueue() if DELIVERY_ENABLED else None
+if delivery_queue is not None:
+    bot.session.middleware(DeliveryMiddleware(delivery_queue))
+dp = Dispatcher(storage=build_fsm_storage(engine))
+dp.message.middleware(HandlerMetricsMiddleware())
+dp.callback_query.middleware(HandlerMetricsMiddleware())
+expense_write_buffer = ExpenseWriteBuffer() if EXPENSE_WRITE_BATCHING else None
+
+# Minimum seconds between progress message edits during an import
+IMPORT_PROGRESS_INTERVAL = 2.0
+
+registry.gauges("db_pool", "Database connection pool state.", pool_snapshots, label="pool")
+registry.gauges("db_reads", "Read routing to replicas and primaries.", shard_router.read_snapshot)
+registry.gauges(
+    "summary_cache", "Summary cache counters.", lambda: vars(get_summary_cache().stats)
+)
+registry.gauges(
+    "chart_cache",
+    "Rendered chart cache counters.",
+    lambda: {
+        **vars(chart_cache.stats),
+        "hit_rate": chart_cache.stats.hit_rate,
+        "memory_bytes": chart_cache.size,
+    },
+)
+if delivery_queue is not None:
+    registry.gauges(
+        "delivery", "Outbound delivery queue counters.", lambda: vars(delivery_queue.stats)
+    )
+if expense_write_buffer is not None:
+    registry.gauges(
+        "expense_write_buffer",
+        "Group-commit buffer counters.",
+        lambda: vars(expense_write_buffer.stats),
+    )
+
+
+class SpooledInputFile(types.InputFile):
+    """Upload an open binary file in chunks without reading it whole."""
+
+    def __init__(self, file: BinaryIO, filename: str):
+        super().__init__(filename=filename)
+        self.file = file
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self.file.seek(0)
+        while chunk := self.file.read(self.chunk_size):
+            yield chunk
 
 
 class ExpenseState(StatesGroup):
@@ -28,12 +98,20 @@ class ExpenseState(StatesGroup):
     waiting_for_amount = State()
 
 
+class BudgetState(StatesGroup):
+    waiting_for_limit = State()
+
+
 # Main menu keyboard
 main_menu = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="Внести трату")],
         [KeyboardButton(text="Посмотреть траты сегодня")],
         [KeyboardButton(text="Посмотреть траты с начала месяца")],
+        [KeyboardButton(text="История трат")],
+        [KeyboardButton(text="Сравнение периодов")],
+        [KeyboardButton(text="Аналитика трат")],
+        [KeyboardButton(text="Бюджеты")],
         [KeyboardButton(text="Скачать отчёт")],
     ],
     resize_keyboard=True,
@@ -41,7 +119,7 @@ main_menu = ReplyKeyboardMarkup(
 
 
 # Category inline keyboard
-def get_category_keyboard():
+def _build_category_keyboard() -> InlineKeyboardMarkup:
     """Generate inline keyboard with categories in multiple rows."""
     categories = list(CategoryENUM)
     keyboard = []
@@ -62,6 +140,39 @@ def get_category_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+category_keyboard = _build_category_keyboard()
+
+
+def get_category_keyboard() -> InlineKeyboardMarkup:
+    """The category keyboard, built once at import."""
+    return category_keyboard
+
+
+# Budget category inline keyboard
+budget_category_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=category.value, callback_data=f"budget_{category.value}"
+            )
+            for category in list(CategoryENUM)[index : index + 2]
+        ]
+        for index in range(0, len(CategoryENUM), 2)
+    ]
+)
+
+
+# Report period inline keyboard
+report_period_keyboard = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [
+            InlineKeyboardButton(text="За сегодня", callback_data="report_today"),
+            InlineKeyboardButton(text="За месяц", callback_data="report_month"),
+        ]
+    ]
+)
+
+
 @dp.message(Command("start"))
 async def start_handler(message: types.Message):
     """Handle /start command."""
@@ -103,104 +214,351 @@ async def category_callback_handler(
 async def amount_handler(message: types.Message, state: FSMContext):
     """Handle amount input."""
     try:
-        amount = float(message.text)
+        amount = Money.parse(message.text or "")
+        if amount <= 0:
+            raise ValueError("amount must be positive")
         data = await state.get_data()
         category = data["category"]
         user_id = message.from_user.id
         expense_data = ExpenseCreateSchema(
             user_id=user_id, category=category, amount=amount
         )
-        async with async_session() as db:
-            await add_expense(db, expense_data)
-        await message.reply("Трата добавлена!", reply_markup=main_menu)
+        if expense_write_buffer is not None:
+            expense = await expense_write_buffer.add(expense_data)
+        else:
+            async with async_session(user_id) as db:
+                expense = await add_expense(db, expense_data)
+        shard_router.pin_to_primary(user_id)
+        text = "Трата добавлена!"
+        if expense.budget is not None:
+            text += "\n" + format_budget_status(expense.budget)
+        await message.reply(text, reply_markup=main_menu)
         await state.clear()
+    except ExpenseWriteError:
+        await message.reply("Не удалось сохранить трату. Попробуйте ещё раз.")
     except ValueError:
         await message.reply("Введите корректную сумму.")
 
 
+def format_budget_status(budget: BudgetStatusSchema) -> str:
+    """Remaining budget, with a warning when the last expense crossed a threshold."""
+    if budget.remaining >= 0:
+        text = f"Остаток бюджета «{budget.category}»: {budget.remaining:.2f} ₽"
+    else:
+        text = f"Бюджет «{budget.category}» превышен на {Money(-budget.remaining):.2f} ₽"
+    if budget.crossed is not None:
+        text = f"⚠️ Потрачено {budget.crossed:.0%} бюджета «{budget.category}».\n{text}"
+    return text
+
+
+@dp.message(lambda message: message.text == "Бюджеты")
+async def view_budgets_handler(message: types.Message):
+    """List the monthly budgets and offer to set one."""
+    budgets = await shard_router.read(get_budgets, message.from_user.id)
+    lines = [
+        f"{budget.category}: {budget.spent:.2f} из {budget.limit:.2f} ₽"
+        for budget in budgets
+    ]
+    text = "Бюджеты на месяц:\n" + "\n".join(lines) if lines else "Бюджетов пока нет."
+    await message.reply(
+        f"{text}\n\nВыберите категорию, чтобы задать бюджет:",
+        reply_markup=budget_category_keyboard,
+    )
+
+
+@dp.callback_query(lambda c: c.data.startswith("budget_"))
+async def budget_category_callback_handler(
+    callback_query: types.CallbackQuery, state: FSMContext
+):
+    """Ask for the monthly limit of the chosen category."""
+    category_value = callback_query.data.split("_", 1)[1]
+    if category_value not in {category.value for category in CategoryENUM}:
+        await callback_query.answer()
+        return
+    await state.update_data(budget_category=category_value)
+    await state.set_state(BudgetState.waiting_for_limit)
+    await callback_query.message.edit_text(
+        f"Введите бюджет на месяц для «{category_value}» (0 — удалить бюджет):"
+    )
+    await callback_query.answer()
+
+
+@dp.message(BudgetState.waiting_for_limit)
+async def budget_limit_handler(message: types.Message, state: FSMContext):
+    """Save the monthly budget."""
+    category_value = (await state.get_data()).get("budget_category")
+    if category_value not in {category.value for category in CategoryENUM}:
+        # The state outlived its data, e.g. after the FSM row expired.
+        await state.clear()
+        await message.reply(
+            "Выберите категорию, чтобы задать бюджет:", reply_markup=budget_category_keyboard
+        )
+        return
+    try:
+        limit = Money.parse(message.text or "")
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+    except ValueError:
+        await message.reply("Введите корректную сумму.")
+        return
+    category = CategoryENUM(category_value)
+    async with async_session(message.from_user.id) as db:
+        budget = await set_budget(db, message.from_user.id, category, limit)
+    shard_router.pin_to_primary(message.from_user.id)
+    await state.clear()
+    if budget is None:
+        await message.reply(f"Бюджет «{category.value}» удалён.", reply_markup=main_menu)
+    else:
+        await message.reply(
+            f"Бюджет сохранён.\n{format_budget_status(budget)}", reply_markup=main_menu
+        )
+
+
+async def reply_with_category_chart(
+    message: types.Message, summary, text: str, title: str, filename: str
+):
+    """Reply with a category pie chart, falling back to text only."""
+    category_totals = [
+        (item.category, float(item.total.rubles))
+        for item in summary.category_breakdown
+        if item.total > 0
+    ]
+    if category_totals:
+        try:
+            chart = await chart_renderer.render_category_pie(category_totals, title)
+            await message.reply_photo(
+                photo=types.BufferedInputFile(chart, filename=filename),
+                caption=text,
+                reply_markup=main_menu,
+            )
+            return
+        except (ValueError, ChartRenderError):
+            pass
+    await message.reply(text, reply_markup=main_menu)
+
+
 @dp.message(lambda message: message.text == "Посмотреть траты сегодня")
 async def view_today_handler(message: types.Message):
     """View today's expenses."""
-    async with async_session() as db:
-        summary = await get_today_summary(db, message.from_user.id)
+    summary = await shard_router.read(get_today_summary, message.from_user.id)
     if summary.total == 0:
         await message.reply("Сегодня трат нет.", reply_markup=main_menu)
     else:
-        text = f"Траты сегодня: {summary.total:.2f} ₽"
-        category_totals = [
-            (item.category, item.total)
-            for item in summary.category_breakdown
-            if item.total > 0
-        ]
-        if category_totals:
-            try:
-                chart = build_category_pie_chart(
-                    category_totals, "Категории трат за сегодня"
-                )
-                await message.reply_photo(
-                    photo=types.BufferedInputFile(
-                        chart.getvalue(), filename="today_categories.png"
-                    ),
-                    caption=text,
-                    reply_markup=main_menu,
-                )
-            except ValueError:
-                await message.reply(text, reply_markup=main_menu)
-        else:
-            await message.reply(text, reply_markup=main_menu)
+        await reply_with_category_chart(
+            message,
+            summary,
+            f"Траты сегодня: {summary.total:.2f} ₽",
+            "Категории трат за сегодня",
+            "today_categories.png",
+        )
 
 
 @dp.message(lambda message: message.text == "Посмотреть траты с начала месяца")
 async def view_month_handler(message: types.Message):
     """View month's expenses."""
-    async with async_session() as db:
-        summary = await get_month_summary(db, message.from_user.id)
+    summary = await shard_router.read(get_month_summary, message.from_user.id)
     if summary.total == 0:
         await message.reply("В этом месяце трат нет.", reply_markup=main_menu)
     else:
-        text = f"Траты с начала месяца: {summary.total:.2f} ₽"
-        category_totals = [
-            (item.category, item.total)
-            for item in summary.category_breakdown
-            if item.total > 0
+        await reply_with_category_chart(
+            message,
+            summary,
+            f"Траты с начала месяца: {summary.total:.2f} ₽",
+            "Категории трат за месяц",
+            "month_categories.png",
+        )
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def encode_history_cursor(direction: str, expense_date: datetime, expense_id: int) -> str:
+    """Pack a history page cursor into callback data, e.g. ``h:o:ltd7gq8w0:2n9c``.
+
+    ``direction`` is ``o`` for older or ``n`` for newer; the date is sent
+    as base-36 microseconds so the cursor is exact and well under 64 bytes.
+    """
+    micros = (expense_date - _EPOCH) // timedelta(microseconds=1)
+    return f"h:{direction}:{_to_base36(micros)}:{_to_base36(expense_id)}"
+
+
+def decode_history_cursor(data: str) -> Tuple[str, datetime, int]:
+    _, direction, micros, expense_id = data.split(":")
+    expense_date = _EPOCH + timedelta(microseconds=int(micros, 36))
+    return direction, expense_date, int(expense_id, 36)
+
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    encoded = ""
+    while True:
+        value, remainder = divmod(value, 36)
+        encoded = digits[remainder] + encoded
+        if not value:
+            return encoded
+
+
+def format_expense_page(page: ExpensePageSchema) -> str:
+    lines = ["История трат:"]
+    lines.extend(
+        f"{item.date:%d.%m.%Y %H:%M} {item.category}: {item.amount:.2f} ₽"
+        for item in page.items
+    )
+    return "\n".join(lines)
+
+
+def get_history_keyboard(page: ExpensePageSchema) -> Optional[InlineKeyboardMarkup]:
+    """Newer/older buttons carrying the cursor of the page edge they continue from."""
+    buttons = []
+    if page.has_newer:
+        first = page.items[0]
+        buttons.append(
+            InlineKeyboardButton(
+                text="← Новее",
+                callback_data=encode_history_cursor("n", first.date, first.id),
+            )
+        )
+    if page.has_older:
+        last = page.items[-1]
+        buttons.append(
+            InlineKeyboardButton(
+                text="Старее →",
+                callback_data=encode_history_cursor("o", last.date, last.id),
+            )
+        )
+    return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+
+@dp.message(lambda message: message.text == "История трат")
+async def view_history_handler(message: types.Message):
+    """Show the newest page of the expense history."""
+    page = await shard_router.read(get_expense_page, message.from_user.id)
+    if not page.items:
+        await message.reply("Трат пока нет.", reply_markup=main_menu)
+        return
+    await message.reply(format_expense_page(page), reply_markup=get_history_keyboard(page))
+
+
+@dp.callback_query(lambda c: c.data.startswith("h:"))
+async def history_page_callback_handler(callback_query: types.CallbackQuery):
+    """Turn the history to the older or newer page."""
+    try:
+        direction, expense_date, expense_id = decode_history_cursor(callback_query.data)
+    except ValueError:
+        await callback_query.answer()
+        return
+    cursor = (expense_date, expense_id)
+    user_id = callback_query.from_user.id
+    if direction == "n":
+        page = await shard_router.read(get_expense_page, user_id, after=cursor)
+    else:
+        page = await shard_router.read(get_expense_page, user_id, before=cursor)
+    if page.items:
+        await callback_query.message.edit_text(
+            format_expense_page(page), reply_markup=get_history_keyboard(page)
+        )
+    await callback_query.answer()
+
+
+# Period captions for the snapshot view, in display order
+SNAPSHOT_PERIODS = {
+    "today": "Сегодня",
+    "week": "С начала недели",
+    "month": "С начала месяца",
+    "last_month": "За прошлый месяц",
+    "year": "С начала года",
+}
+
+
+@dp.message(lambda message: message.text == "Сравнение периодов")
+async def view_snapshot_handler(message: types.Message):
+    """Compare spending over several periods with a single summaries query."""
+    summaries = await shard_router.read(
+        get_summaries, message.from_user.id, build_summary_periods()
+    )
+    if not any(summary.total for summary in summaries.values()):
+        await message.reply("Пока нет трат для сравнения.", reply_markup=main_menu)
+        return
+
+    text = "\n".join(
+        f"{caption}: {summaries[period].total:.2f} ₽"
+        for period, caption in SNAPSHOT_PERIODS.items()
+    )
+    try:
+        chart = await chart_renderer.render_period_snapshot(
+            float(summaries["today"].total.rubles),
+            float(summaries["month"].total.rubles),
+        )
+    except ChartRenderError:
+        await message.reply(text, reply_markup=main_menu)
+        return
+    await message.reply_photo(
+        photo=types.BufferedInputFile(chart, filename="period_snapshot.png"),
+        caption=text,
+        reply_markup=main_menu,
+    )
+
+
+def format_trend_report(report: "TrendReport") -> str:
+    """Describe a trend report in a few lines of text."""
+    lines = [
+        f"С начала месяца: {report.month_to_date:.2f} ₽",
+        f"За те же дни прошлого месяца: {report.previous_month_to_date:.2f} ₽ "
+        f"({report.month_change:+.2f} ₽)",
+        f"Прогноз на конец месяца: {report.projected_month_total:.2f} ₽",
+        f"Среднее в день: {report.rolling_7[-1]:.2f} ₽ за 7 дней, "
+        f"{report.rolling_30[-1]:.2f} ₽ за 30 дней",
+    ]
+    growth = max(report.category_deltas, key=lambda item: item.change, default=None)
+    if growth is not None and growth.change > 0:
+        lines.append(f"Сильнее всего выросло: {growth.category} ({growth.change:+.2f} ₽)")
+    return "\n".join(lines)
+
+
+@dp.message(lambda message: message.text == "Аналитика трат")
+async def view_analytics_handler(message: types.Message):
+    """Show spending trends, month-over-month deltas and weekday pattern."""
+    from analytics import (WEEKDAY_LABELS, build_trend_report,
+                           load_expense_history)
+
+    history = await shard_router.read(load_expense_history, message.from_user.id)
+    if not len(history):
+        await message.reply("Пока нет трат для анализа.", reply_markup=main_menu)
+        return
+
+    report = build_trend_report(history)
+    text = format_trend_report(report)
+    try:
+        charts = await asyncio.gather(
+            chart_renderer.render_trend(
+                report.first_day, report.daily, report.rolling_7, report.rolling_30
+            ),
+            chart_renderer.render_month_over_month(
+                [(item.category, item.current, item.previous) for item in report.category_deltas]
+            ),
+            chart_renderer.render_weekday(report.weekday_averages, WEEKDAY_LABELS),
+        )
+    except (ValueError, ChartRenderError):
+        await message.reply(text, reply_markup=main_menu)
+        return
+    filenames = ["trend.png", "month_over_month.png", "weekdays.png"]
+    await message.reply_media_group(
+        media=[
+            InputMediaPhoto(
+                media=types.BufferedInputFile(chart, filename=filename),
+                caption=text if index == 0 else None,
+            )
+            for index, (chart, filename) in enumerate(zip(charts, filenames))
         ]
-        if category_totals:
-            try:
-                chart = build_category_pie_chart(
-                    category_totals, "Категории трат за месяц"
-                )
-                await message.reply_photo(
-                    photo=types.BufferedInputFile(
-                        chart.getvalue(), filename="month_categories.png"
-                    ),
-                    caption=text,
-                    reply_markup=main_menu,
-                )
-            except ValueError:
-                await message.reply(text, reply_markup=main_menu)
-        else:
-            await message.reply(text, reply_markup=main_menu)
+    )
 
 
 @dp.message(lambda message: message.text == "Скачать отчёт")
 async def download_report_handler(message: types.Message):
     """Download financial report as CSV."""
-    # Create inline keyboard for period selection
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="За сегодня", callback_data="report_today"
-                ),
-                InlineKeyboardButton(
-                    text="За месяц", callback_data="report_month"
-                ),
-            ]
-        ]
-    )
     await message.reply(
         "Выберите период для отчёта:",
-        reply_markup=keyboard,
+        reply_markup=report_period_keyboard,
     )
 
 
@@ -223,38 +581,170 @@ async def report_period_callback_handler(callback_query: types.CallbackQuery):
         end = datetime.combine(today, datetime.max.time())
         filename = f"expenses_month_{today.strftime('%Y%m')}.csv"
 
-    async with async_session() as db:
-        csv_content = await export_expenses_to_csv(db, user_id, start, end)
+    export = await shard_router.read(export_expenses_to_csv, user_id, start, end)
 
-    if not csv_content or csv_content == "Date,Category,Amount\n":
-        await callback_query.message.edit_text("Нет данных для выгрузки.")
-        await callback_query.answer()
-        return
+    with export.file:
+        if export.rows == 0:
+            await callback_query.message.edit_text("Нет данных для выгрузки.")
+            await callback_query.answer()
+            return
 
-    # Send CSV file
-    await callback_query.message.reply_document(
-        document=types.BufferedInputFile(
-            csv_content.encode("utf-8-sig"), filename=filename
-        ),
-        caption="Ваш финансовый отчёт",
-        reply_markup=main_menu,
-    )
+        # Send CSV file
+        await callback_query.message.reply_document(
+            document=SpooledInputFile(export.file, filename=filename),
+            caption="Ваш финансовый отчёт",
+            reply_markup=main_menu,
+        )
     await callback_query.message.delete()
     await callback_query.answer()
 
 
-async def main():
-    """Start the bot."""
-    # Create tables
-    from database import engine
-    from models import Base
+@dp.message(lambda message: message.document is not None)
+async def import_document_handler(message: types.Message):
+    """Import expenses from an uploaded CSV report."""
+    document = message.document
+    if not (document.file_name or "").lower().endswith(".csv"):
+        await message.reply(
+            "Для импорта пришлите CSV-файл в формате отчёта.", reply_markup=main_menu
+        )
+        return
+
+    status = await message.reply("Импортирую траты...")
+    last_update = time.monotonic()
 
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-    await dp.start_polling(bot)
+    async def report_progress(progress: ImportProgress):
+        nonlocal last_update
+        if time.monotonic() - last_update < IMPORT_PROGRESS_INTERVAL:
+            return
+        last_update = time.monotonic()
+        await status.edit_text(f"Импортирую траты... обработано строк: {progress.processed}")
 
+    try:
+        with tempfile.TemporaryFile() as file:
+            await bot.download(document, destination=file)
+            file.seek(0)
+            async with async_session(message.from_user.id) as db:
+                progress = await import_csv(
+                    db, message.from_user.id, file, on_progress=report_progress
+                )
+    except (UnicodeDecodeError, csv.Error):
+        await status.edit_text("Не удалось прочитать файл: нужен CSV в кодировке UTF-8.")
+        return
+    except SQLAlchemyError:
+        logger.exception("Import failed for user %s", message.from_user.id)
+        await status.edit_text(
+            "Не удалось сохранить траты. Попробуйте ещё раз: "
+            "уже сохранённые строки будут пропущены как дубликаты."
+        )
+        return
+    finally:
+        shard_router.pin_to_primary(message.from_user.id)
+
+    lines = [
+        f"Импортировано трат: {progress.imported}",
+        f"Пропущено дубликатов: {progress.duplicates}",
+        f"Строк с ошибками: {progress.invalid}",
+    ]
+    lines.extend(progress.errors)
+    await status.edit_text("\n".join(lines))
+
+
+async def send_digest(digest: Digest):
+    """Send a scheduled digest, with its chart when one was rendered."""
+    with bulk_delivery():
+        if digest.chart is not None:
+            await bot.send_photo(
+                digest.user_id,
+                types.BufferedInputFile(digest.chart, filename=f"{digest.kind}_digest.png"),
+                caption=digest.text,
+            )
+        else:
+            await bot.send_message(digest.user_id, digest.text)
 
-if __name__ == "__main__":
-    import asyncio
 
+async def prepare_database() -> None:
+    """Bring every shard's schema up to date, which also proves they are reachable."""
+    from migrations import run_migrations
+    from partitioning import ensure_expense_partitions
+
+    for shard in shard_router.shards.values():
+        logger.info(
+            "Using database %s for shard %s",
+            shard.engine.url.render_as_string(hide_password=True),
+            shard.name,
+        )
+    await shard_router.run_sync(run_migrations)
+    await shard_router.run_sync(ensure_expense_partitions)
+
+
+async def warm_up() -> None:
+    """Load what the first analytics request needs, off the startup path."""
+    await asyncio.to_thread(importlib.import_module, "analytics")
+    await chart_renderer.wait_until_ready()
+
+
+def _log_warm_up_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            "Warm-up failed; analytics and charts load on first use",
+            exc_info=task.exception(),
+        )
+
+
+async def start_up() -> asyncio.Task:
+    """Prepare the database and log in to Telegram concurrently.
+
+    Chart workers start spawning first; the returned task finishes their
+    warm-up and the heavy imports in the background while updates are
+    already being handled.
+    """
+    chart_renderer.start()
+    await asyncio.gather(prepare_database(), bot.me())
+    task = asyncio.create_task(warm_up())
+    task.add_done_callback(_log_warm_up_failure)
+    return task
+
+
+async def main(register_webhook: bool = True, updates=None, worker: int = 0):
+    """Start the bot.
+
+    ``updates`` is the queue a webhook worker process reads forwarded
+    updates from; without it the bot polls or serves the webhook itself.
+    Worker ``worker`` serves its metrics on METRICS_PORT + ``worker``.
+    """
+    warm_up_task = None
+    metrics_runner = None
+    cleanup_task = None
+    digest_task = None
+    try:
+        warm_up_task = await start_up()
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(port=METRICS_PORT + worker)
+        if isinstance(dp.storage, SQLStorage):
+            cleanup_task = asyncio.create_task(dp.storage.run_cleanup())
+        if DIGESTS_ENABLED:
+            digest_task = asyncio.create_task(DigestScheduler(send_digest).run())
+        if updates is not None:
+            await consume_updates(dp, bot, updates, register=register_webhook)
+        elif BOT_MODE == "webhook":
+            await run_webhook(dp, bot, register=register_webhook)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if warm_up_task is not None:
+            warm_up_task.cancel()
+        if cleanup_task is not None:
+            cleanup_task.cancel()
+        if digest_task is not None:
+            digest_task.cancel()
+        if expense_write_buffer is not None:
+            await expense_write_buffer.close()
+        chart_renderer.shutdown()
+        if delivery_queue is not None:
+            await delivery_queue.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+if __name__ == "__main__":
     asyncio.run(main())
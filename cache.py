@@ -0,0 +1,134 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+from config import SUMMARY_CACHE_SIZE, SUMMARY_CACHE_TTL
+from schemas import ExpensePeriodSummarySchema
+
+SummaryKey = Tuple[int, str, Hashable]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    stale_sets: int = 0
+
+
+class SummaryCacheBackend(ABC):
+    """Storage for period summaries keyed by (user_id, period, period_id)."""
+
+    def __init__(self):
+        self.stats = CacheStats()
+
+    @abstractmethod
+    async def get(self, key: SummaryKey) -> Optional[ExpensePeriodSummarySchema]:
+        """Return a cached summary or None when missing or expired."""
+
+    @abstractmethod
+    async def generation(self, user_id: int) -> int:
+        """A number that changes whenever the user's summaries are invalidated."""
+
+    @abstractmethod
+    async def set(
+        self,
+        key: SummaryKey,
+        summary: ExpensePeriodSummarySchema,
+        generation: Optional[int] = None,
+    ) -> None:
+        """Store a summary, unless the user's generation moved past ``generation``.
+
+        Pass the generation read before computing the summary, so a summary
+        that raced a write and its invalidation is not cached.
+        """
+
+    @abstractmethod
+    async def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached summary of a user and bump their generation."""
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """Drop every cached summary."""
+
+
+class InMemorySummaryCache(SummaryCacheBackend):
+    """Process-local LRU cache with a per-entry time to live."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 60.0):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[SummaryKey, Tuple[float, ExpensePeriodSummarySchema]] = (
+            OrderedDict()
+        )
+        # Bumped by clear(); per-user counters are bumped by invalidate_user().
+        self._epoch = 0
+        self._generations: Dict[int, int] = {}
+
+    async def get(self, key: SummaryKey) -> Optional[ExpensePeriodSummarySchema]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, summary = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.stats.misses += 1
+            self.stats.evictions += 1
+            return None
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return summary
+
+    async def generation(self, user_id: int) -> int:
+        return self._epoch + self._generations.get(user_id, 0)
+
+    async def set(
+        self,
+        key: SummaryKey,
+        summary: ExpensePeriodSummarySchema,
+        generation: Optional[int] = None,
+    ) -> None:
+        if self.max_entries <= 0:
+            return
+        if generation is not None and generation != await self.generation(key[0]):
+            self.stats.stale_sets += 1
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    async def invalidate_user(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        for key in [key for key in self._entries if key[0] == user_id]:
+            del self._entries[key]
+            self.stats.invalidations += 1
+
+    async def clear(self) -> None:
+        self._entries.clear()
+        self._epoch += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_summary_cache: SummaryCacheBackend = InMemorySummaryCache(
+    max_entries=SUMMARY_CACHE_SIZE, ttl=SUMMARY_CACHE_TTL
+)
+
+
+def get_summary_cache() -> SummaryCacheBackend:
+    """Return the summary cache used by services."""
+    return _summary_cache
+
+
+def set_summary_cache(backend: SummaryCacheBackend) -> None:
+    """Replace the summary cache, e.g. with a backend shared between workers."""
+    global _summary_cache
+    _summary_cache = backend
@@ -0,0 +1,137 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from config import CHART_CACHE_DIR, CHART_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever charts.py changes how an image looks so stale PNGs are ignored.
+CHART_STYLE_VERSION = 1
+
+
+@dataclass
+class ChartCacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    bytes_saved: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        if not lookups:
+            return 0.0
+        return (self.memory_hits + self.disk_hits) / lookups
+
+
+def normalize_totals(totals: list[tuple[str, float]]) -> list[tuple[str, float]]:
+    """Round amounts to kopecks so equal-looking inputs share one image."""
+    return [(str(label), round(float(value), 2)) for label, value in totals]
+
+
+def chart_cache_key(
+    kind: str, title: str, totals: list[tuple[str, float]], params: Optional[dict] = None
+) -> str:
+    """Hash everything that affects the rendered image."""
+    payload = json.dumps(
+        {
+            "kind": kind,
+            "title": title,
+            "totals": normalize_totals(totals),
+            "params": params or {},
+            "version": CHART_STYLE_VERSION,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ChartCache:
+    """Two-tier PNG cache: an in-memory LRU bounded by bytes and an optional directory."""
+
+    def __init__(self, max_bytes: int = CHART_CACHE_MAX_BYTES, directory: str = CHART_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.directory = directory or None
+        self.stats = ChartCacheStats()
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def size(self) -> int:
+        """Bytes currently held in memory."""
+        return self._size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def _remember(self, key: str, png: bytes) -> None:
+        if len(png) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._entries[key] = png
+        self._size += len(png)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.stats.evictions += 1
+
+    def _read_file(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_file(self, key: str, png: bytes) -> None:
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(png)
+        os.replace(temp_path, path)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return cached PNG bytes, promoting disk hits into memory."""
+        png = self._entries.get(key)
+        if png is not None:
+            self._entries.move_to_end(key)
+            self.stats.memory_hits += 1
+            self.stats.bytes_saved += len(png)
+            return png
+        if self.directory:
+            png = await asyncio.to_thread(self._read_file, key)
+            if png is not None:
+                self._remember(key, png)
+                self.stats.disk_hits += 1
+                self.stats.bytes_saved += len(png)
+                return png
+        self.stats.misses += 1
+        return None
+
+    async def put(self, key: str, png: bytes) -> None:
+        """Store PNG bytes in memory and, when configured, on disk."""
+        self._remember(key, png)
+        if self.directory:
+            try:
+                await asyncio.to_thread(self._write_file, key, png)
+            except OSError:
+                logger.warning("Could not write chart %s to disk cache", key, exc_info=True)
+
+    def clear(self) -> None:
+        """Drop the in-memory tier."""
+        self._entries.clear()
+        self._size = 0
+
+
+chart_cache = ChartCache()
@@ -2,8 +2,10 @@ import matplotlib
 
 matplotlib.use("Agg")
 
+from datetime import date, timedelta
 from io import BytesIO
 
+import numpy as np
 from matplotlib import pyplot as plt
 
 
@@ -63,3 +65,62 @@ def build_category_pie_chart(category_totals: list[tuple[str, float]], title: st
     buffer.seek(0)
     plt.close(fig)
     return buffer
+
+
+def build_trend_chart(
+    first_day: date, daily: list[float], rolling_7: list[float], rolling_30: list[float]
+) -> BytesIO:
+    """Plot daily spending with its 7- and 30-day rolling averages."""
+    days = [first_day + timedelta(days=offset) for offset in range(len(daily))]
+    fig, ax = plt.subplots(figsize=(9, 4))
+    ax.bar(days, daily, color="#B0BEC5", label="За день")
+    ax.plot(days, rolling_7, color="#FF9800", linewidth=2, label="Среднее за 7 дней")
+    ax.plot(days, rolling_30, color="#2196F3", linewidth=2, label="Среднее за 30 дней")
+    ax.set_title("Динамика трат")
+    ax.set_ylabel("Сумма, ₽")
+    ax.legend(loc="upper left")
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    plt.close(fig)
+    return buffer
+
+
+def build_month_over_month_chart(deltas: list[tuple[str, float, float]]) -> BytesIO:
+    """Compare month-to-date spending per category with the same days last month."""
+    if not deltas:
+        raise ValueError("Month-over-month deltas must not be empty")
+    labels = [item[0] for item in deltas]
+    positions = np.arange(len(deltas))
+    fig, ax = plt.subplots(figsize=(8, max(3, 0.5 * len(deltas) + 1)))
+    ax.barh(positions + 0.2, [item[2] for item in deltas], height=0.4,
+            color="#B0BEC5", label="Прошлый месяц")
+    ax.barh(positions - 0.2, [item[1] for item in deltas], height=0.4,
+            color="#2196F3", label="Этот месяц")
+    ax.set_yticks(positions, labels)
+    ax.invert_yaxis()
+    ax.set_title("Месяц к месяцу по категориям")
+    ax.set_xlabel("Сумма, ₽")
+    ax.legend(loc="lower right")
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    plt.close(fig)
+    return buffer
+
+
+def build_weekday_chart(averages: list[float], labels: list[str]) -> BytesIO:
+    """Bar image of the average spend per weekday."""
+    fig, ax = plt.subplots(figsize=(6, 4))
+    ax.bar(labels, averages, color="#4CAF50")
+    ax.set_title("Средние траты по дням недели")
+    ax.set_ylabel("Сумма, ₽")
+    fig.tight_layout()
+    buffer = BytesIO()
+    fig.savefig(buffer, format="png")
+    buffer.seek(0)
+    plt.close(fig)
+    return buffer
@@ -12,4 +12,134 @@ DB_NAME = os.getenv("DB_NAME", "finance_db")
 DB_USER = os.getenv("DB_USER", "finance_user")
 DB_PASS = os.getenv("DB_PASS", "finance_pass")
 
-DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
+)
+
+# Database sharding configuration
+# Comma-separated name=url pairs, e.g. "a=postgresql+asyncpg://...,b=...".
+# Users are hashed onto shard names; empty keeps everything in DATABASE_URL.
+DATABASE_SHARDS = dict(
+    item.strip().split("=", 1)
+    for item in os.getenv("DATABASE_SHARDS", "").split(",")
+    if item.strip()
+)
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "64"))
+
+# Read replica configuration
+# Comma-separated shard=url pairs; repeat a shard name for several replicas.
+# Without DATABASE_SHARDS the only shard is called "default".
+_REPLICA_PAIRS = [
+    item.strip().split("=", 1)
+    for item in os.getenv("DATABASE_REPLICAS", "").split(",")
+    if item.strip()
+]
+DATABASE_REPLICAS = {
+    shard: [url for name, url in _REPLICA_PAIRS if name == shard]
+    for shard, _ in _REPLICA_PAIRS
+}
+# Seconds a user's reads stay on the primary after they write, covering replica lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+# Seconds a failed replica is skipped before reads try it again
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+
+# Database engine profile
+DB_ECHO = os.getenv("DB_ECHO", "false").lower()  # "false", "true" or "debug"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Summary cache configuration
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1024"))
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", "60"))
+
+# Chart rendering pool configuration
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_QUEUE_SIZE = int(os.getenv("CHART_QUEUE_SIZE", "8"))
+CHART_QUEUE_WAIT = float(os.getenv("CHART_QUEUE_WAIT", "0.5"))
+CHART_TIMEOUT = float(os.getenv("CHART_TIMEOUT", "10"))
+
+# Rendered chart cache configuration
+CHART_CACHE_MAX_BYTES = int(os.getenv("CHART_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", "")
+
+# CSV export configuration
+CSV_EXPORT_BATCH_SIZE = int(os.getenv("CSV_EXPORT_BATCH_SIZE", "1000"))
+CSV_SPOOL_THRESHOLD = int(os.getenv("CSV_SPOOL_THRESHOLD", str(1024 * 1024)))
+
+# Expense history configuration
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+
+# Expense partitioning and archival configuration
+# Monthly partitions created ahead of time on a partitioned PostgreSQL table
+EXPENSE_PARTITION_MONTHS_AHEAD = int(os.getenv("EXPENSE_PARTITION_MONTHS_AHEAD", "3"))
+# Months kept in the hot table before archive-expenses moves them out
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "12"))
+
+# Budget configuration
+# Shares of a budget that trigger a warning when an expense crosses them
+BUDGET_WARNING_THRESHOLDS = tuple(
+    float(value) for value in os.getenv("BUDGET_WARNING_THRESHOLDS", "0.8,1.0").split(",")
+)
+
+# Group-commit expense writes configuration
+EXPENSE_WRITE_BATCHING = os.getenv("EXPENSE_WRITE_BATCHING", "false").lower() == "true"
+EXPENSE_WRITE_BATCH_SIZE = int(os.getenv("EXPENSE_WRITE_BATCH_SIZE", "100"))
+EXPENSE_WRITE_BATCH_DELAY = float(os.getenv("EXPENSE_WRITE_BATCH_DELAY", "0.01"))
+
+# Bulk import configuration
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+# FSM storage configuration
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")  # "memory" or "sql"
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", str(24 * 60 * 60)))
+FSM_CACHE_TTL = float(os.getenv("FSM_CACHE_TTL", "2"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
+FSM_CLEANUP_INTERVAL = int(os.getenv("FSM_CLEANUP_INTERVAL", "600"))
+
+# Update intake configuration
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # "polling" or "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public https://host, without the path
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_LANES = int(os.getenv("WEBHOOK_LANES", "32"))
+WEBHOOK_LANE_SIZE = int(os.getenv("WEBHOOK_LANE_SIZE", "100"))
+# Updates waiting for each worker process when WEBHOOK_WORKERS > 1
+WEBHOOK_WORKER_QUEUE_SIZE = int(os.getenv("WEBHOOK_WORKER_QUEUE_SIZE", "1000"))
+
+# Metrics endpoint configuration
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 disables the endpoint; webhook worker N serves on METRICS_PORT + N
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_PROFILER = os.getenv("METRICS_PROFILER", "false").lower() == "true"
+
+# Scheduled digest configuration
+DIGESTS_ENABLED = os.getenv("DIGESTS_ENABLED", "false").lower() == "true"
+DIGEST_SEND_HOUR = int(os.getenv("DIGEST_SEND_HOUR", "9"))  # server local time
+DIGEST_CHUNK_SIZE = int(os.getenv("DIGEST_CHUNK_SIZE", "200"))
+DIGEST_RENDER_CONCURRENCY = int(os.getenv("DIGEST_RENDER_CONCURRENCY", "2"))
+DIGEST_CHECK_INTERVAL = int(os.getenv("DIGEST_CHECK_INTERVAL", "60"))
+DIGEST_LEASE_SECONDS = int(os.getenv("DIGEST_LEASE_SECONDS", "300"))
+# Days into a month during which last month's digest is still sent if it was missed
+DIGEST_MONTHLY_CATCH_UP_DAYS = int(os.getenv("DIGEST_MONTHLY_CATCH_UP_DAYS", "3"))
+
+# Outbound message delivery configuration
+DELIVERY_ENABLED = os.getenv("DELIVERY_ENABLED", "true").lower() == "true"
+# Rate plus burst is what can go out within one second; Telegram allows ~30
+# messages per second overall and about one per second to a single chat.
+DELIVERY_GLOBAL_RATE = float(os.getenv("DELIVERY_GLOBAL_RATE", "25"))  # messages/s
+DELIVERY_GLOBAL_BURST = float(os.getenv("DELIVERY_GLOBAL_BURST", "3"))
+DELIVERY_CHAT_RATE = float(os.getenv("DELIVERY_CHAT_RATE", "1"))  # messages/s per chat
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "3"))
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "16"))
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "1000"))
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))
+DELIVERY_FILE_ID_CACHE_SIZE = int(os.getenv("DELIVERY_FILE_ID_CACHE_SIZE", "4096"))
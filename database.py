@@ -1,16 +1,387 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import (DATABASE_REPLICAS, DATABASE_SHARDS, DATABASE_URL,
+                    DB_ECHO, DB_MAX_OVERFLOW, DB_POOL_PRE_PING,
+                    DB_POOL_RECYCLE, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+                    DB_STATEMENT_CACHE_SIZE, DB_STATEMENT_TIMEOUT_MS,
+                    READ_YOUR_WRITES_SECONDS, REPLICA_RETRY_SECONDS,
+                    SHARD_VIRTUAL_NODES)
+from metrics import instrument_engine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass
+class EngineProfile:
+    """Connection pool and driver settings for an engine."""
+
+    echo: str = DB_ECHO
+    pool_size: int = DB_POOL_SIZE
+    max_overflow: int = DB_MAX_OVERFLOW
+    pool_timeout: float = DB_POOL_TIMEOUT
+    pool_recycle: int = DB_POOL_RECYCLE
+    pool_pre_ping: bool = DB_POOL_PRE_PING
+    statement_cache_size: int = DB_STATEMENT_CACHE_SIZE
+    statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS
+
+
+class PoolMetrics:
+    """Connection pool counters of one engine, fed by pool events and checkout timing."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        self.overflow_connects = 0
+        self.timeouts = 0
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def snapshot(self) -> dict:
+        """Return current pool state and cumulative counters."""
+        pool = self.pool
+        queue_pool = isinstance(pool, AsyncAdaptedQueuePool)
+        return {
+            "size": pool.size() if queue_pool else 0,
+            "checked_out": pool.checkedout() if queue_pool else 0,
+            "overflow": max(pool.overflow(), 0) if queue_pool else 0,
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+            "overflow_connects": self.overflow_connects,
+            "timeouts": self.timeouts,
+            "wait_avg": self.wait_total / self.wait_count if self.wait_count else 0.0,
+            "wait_max": self.wait_max,
+        }
+
+
+# Metrics of every engine's pool, keyed by the engine's label
+pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def pool_snapshots() -> Dict[str, dict]:
+    """Pool state and counters per engine label."""
+    return {label: metrics.snapshot() for label, metrics in pool_metrics.items()}
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records connection waits and connections opened past pool_size."""
+
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.timeouts += 1
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_wait(time.perf_counter() - started)
+
+    def _create_connection(self):
+        # Called for new connections only, after the overflow counter went up.
+        if self.metrics is not None and self.overflow() > 0:
+            self.metrics.overflow_connects += 1
+        return super()._create_connection()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        if self.metrics is not None:
+            self.metrics.pool = pool
+        return pool
+
+
+def _instrument_pool(pool, label: str) -> None:
+    metrics = pool_metrics[label] = PoolMetrics(pool)
+    if isinstance(pool, TimedQueuePool):
+        pool.metrics = metrics
+
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        metrics.checkins += 1
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.invalidations += 1
+
+
+def create_profiled_engine(
+    url: str, profile: Optional[EngineProfile] = None, label: str = "default"
+) -> AsyncEngine:
+    """Create an engine with the given pool/driver profile and pool metrics under ``label``."""
+    profile = profile or EngineProfile()
+    echo = "debug" if profile.echo == "debug" else profile.echo == "true"
+    options = {"echo": echo, "pool_pre_ping": profile.pool_pre_ping}
+    backend = make_url(url).get_backend_name()
+    if backend == "postgresql":
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=profile.pool_size,
+            max_overflow=profile.max_overflow,
+            pool_timeout=profile.pool_timeout,
+            pool_recycle=profile.pool_recycle,
+            connect_args={
+                "prepared_statement_cache_size": profile.statement_cache_size,
+                "server_settings": {
+                    "statement_timeout": str(profile.statement_timeout_ms),
+                },
+            },
+        )
+    new_engine = create_async_engine(url, **options)
+    _instrument_pool(new_engine.sync_engine.pool, label)
+    instrument_engine(new_engine)
+    return new_engine
+
+
+class HashRing:
+    """Consistent hashing of user ids onto shard names.
+
+    Every shard owns ``vnodes`` points on the ring, so adding or removing a
+    shard only moves the users between its points and their neighbours.
+    """
+
+    def __init__(self, names: List[str], vnodes: int = SHARD_VIRTUAL_NODES):
+        if not names:
+            raise ValueError("A hash ring needs at least one shard")
+        points = sorted(
+            (self._hash(f"{name}#{index}"), name)
+            for name in names
+            for index in range(max(vnodes, 1))
+        )
+        self._hashes = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def shard_for(self, user_id: int) -> str:
+        index = bisect.bisect(self._hashes, self._hash(str(user_id)))
+        return self._names[index % len(self._names)]
+
+
+def _session_factory(bind: AsyncEngine, replica: bool = False) -> sessionmaker:
+    # Queries can check db.info["replica"] to avoid caching lagging data.
+    return sessionmaker(
+        bind, class_=AsyncSession, expire_on_commit=False, info={"replica": replica}
+    )
+
+
+@dataclass
+class Replica:
+    engine: AsyncEngine
+    session_factory: sessionmaker
+    down_until: float = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+
+@dataclass(frozen=True)
+class Shard:
+    name: str
+    engine: AsyncEngine
+    session_factory: sessionmaker
+    replicas: List[Replica] = field(default_factory=list)
+
+
+class ShardRouter:
+    """Hand out sessions on the database that stores a user's data.
+
+    Shards are keyed by name, so a shard's URL can change without moving
+    users. The first shard is the home shard: it also keeps data that
+    belongs to no user, such as digest runs and FSM state. Sessions from
+    ``session`` go to a shard's primary; ``read`` sends read-only queries
+    to its replicas.
+    """
+
+    def __init__(
+        self,
+        urls: Dict[str, str],
+        replica_urls: Optional[Dict[str, List[str]]] = None,
+        vnodes: int = SHARD_VIRTUAL_NODES,
+        pin_seconds: float = READ_YOUR_WRITES_SECONDS,
+        retry_seconds: float = REPLICA_RETRY_SECONDS,
+    ):
+        replica_urls = replica_urls or {}
+        unknown = replica_urls.keys() - urls.keys()
+        if unknown:
+            raise ValueError(f"Replicas for unknown shards: {', '.join(sorted(unknown))}")
+        self.shards: Dict[str, Shard] = {}
+        for name, url in urls.items():
+            shard_engine = create_profiled_engine(url, label=name)
+            replicas = []
+            for index, replica_url in enumerate(replica_urls.get(name, [])):
+                replica_engine = create_profiled_engine(
+                    replica_url, label=f"{name}-replica{index}"
+                )
+                replicas.append(Replica(replica_engine, _session_factory(replica_engine, True)))
+            self.shards[name] = Shard(
+                name, shard_engine, _session_factory(shard_engine), replicas
+            )
+        self.ring = HashRing(list(self.shards), vnodes)
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self.read_stats = {"replica": 0, "primary": 0, "pinned": 0, "replica_failures": 0}
+        self._pinned: Dict[int, float] = {}
+        self._prune_pins_at = 1024
+        self._next_replica = 0
+
+    @property
+    def home(self) -> Shard:
+        return next(iter(self.shards.values()))
+
+    def shard_for(self, user_id: int) -> Shard:
+        return self.shards[self.ring.shard_for(user_id)]
+
+    def session(self, user_id: Optional[int] = None) -> AsyncSession:
+        """Open a session on ``user_id``'s shard, or on the home shard."""
+        shard = self.home if user_id is None else self.shard_for(user_id)
+        return shard.session_factory()
+
+    def pin_to_primary(self, user_id: int) -> None:
+        """Read ``user_id``'s data from the primary for the read-your-writes window.
+
+        Call it after every write of a user, so their next screens do not
+        miss what a lagging replica has not received yet. Pins are kept per
+        process, which holds because every update of a user is handled by
+        the same process: there is one in polling mode, and with
+        WEBHOOK_WORKERS > 1 the ingress routes each user to one worker.
+        Writes made elsewhere, such as manage.py import-csv, do not pin.
+        """
+        now = time.monotonic()
+        self._pinned[user_id] = now + self.pin_seconds
+        if len(self._pinned) >= self._prune_pins_at:
+            self._pinned = {user: until for user, until in self._pinned.items() if until > now}
+            self._prune_pins_at = max(1024, len(self._pinned) * 2)
+
+    def _pick_replica(self, shard: Shard, user_id: int) -> Optional[Replica]:
+        if self._pinned.get(user_id, 0.0) > time.monotonic():
+            if shard.replicas:
+                self.read_stats["pinned"] += 1
+            return None
+        healthy = [replica for replica in shard.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next_replica += 1
+        return healthy[self._next_replica % len(healthy)]
+
+    async def read(
+        self, query: Callable[..., Awaitable[T]], user_id: int, *args: Any, **kwargs: Any
+    ) -> T:
+        """Run the read-only ``query(db, user_id, *args, **kwargs)`` on a replica.
+
+        Uses the user's primary while they are pinned after a write, when
+        their shard has no healthy replica, or when the replica fails. A
+        failed replica is skipped for ``retry_seconds``.
+        """
+        shard = self.shard_for(user_id)
+        replica = self._pick_replica(shard, user_id)
+        if replica is not None:
+            try:
+                async with replica.session_factory() as db:
+                    result = await query(db, user_id, *args, **kwargs)
+                self.read_stats["replica"] += 1
+                return result
+            except (DBAPIError, PoolTimeoutError, OSError):
+                replica.down_until = time.monotonic() + self.retry_seconds
+                self.read_stats["replica_failures"] += 1
+                logger.warning(
+                    "Replica %s of shard %s failed, reading from the primary",
+                    replica.engine.url.render_as_string(hide_password=True),
+                    shard.name,
+                    exc_info=True,
+                )
+        self.read_stats["primary"] += 1
+        async with shard.session_factory() as db:
+            return await query(db, user_id, *args, **kwargs)
+
+    def read_snapshot(self) -> dict:
+        """Read routing counters and the number of replicas currently skipped."""
+        replicas = [replica for shard in self.shards.values() for replica in shard.replicas]
+        return {
+            **self.read_stats,
+            "replicas": len(replicas),
+            "replicas_down": sum(not replica.healthy for replica in replicas),
+        }
+
+    async def fan_out(
+        self, query: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any
+    ) -> Dict[str, T]:
+        """Run ``query(db, *args, **kwargs)`` on every shard concurrently."""
+
+        async def run(shard: Shard) -> T:
+            async with shard.session_factory() as db:
+                return await query(db, *args, **kwargs)
+
+        results = await asyncio.gather(*(run(shard) for shard in self.shards.values()))
+        return dict(zip(self.shards, results))
+
+    async def run_sync(self, function: Callable[..., T]) -> Dict[str, T]:
+        """Run ``function(connection)`` in a transaction on every shard, in order."""
+        results = {}
+        for name, shard in self.shards.items():
+            async with shard.engine.begin() as conn:
+                results[name] = await conn.run_sync(function)
+        return results
+
+    async def dispose(self) -> None:
+        engines = [shard.engine for shard in self.shards.values()]
+        engines.extend(
+            replica.engine for shard in self.shards.values() for replica in shard.replicas
+        )
+        await asyncio.gather(*(item.dispose() for item in engines))
+
 
-from config import DATABASE_URL
+# Route every user to a shard; without DATABASE_SHARDS there is only DATABASE_URL.
+shard_router = ShardRouter(DATABASE_SHARDS or {"default": DATABASE_URL}, DATABASE_REPLICAS)
 
-# Create async engine
-engine = create_async_engine(DATABASE_URL, echo=True)
+# The home shard's engine, for data that belongs to no user
+engine = shard_router.home.engine
 
-# Create session factory
-async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# async_session(user_id) opens a session on that user's shard
+async_session = shard_router.session
 
 
-async def get_db() -> AsyncSession:
+async def get_db(user_id: Optional[int] = None) -> AsyncSession:
     """Get database session."""
-    async with async_session() as session:
+    async with async_session(user_id) as session:
         yield session
@@ -0,0 +1,418 @@
+import asyncio
+import hashlib
+import itertools
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (BaseRequestMiddleware,
+                                                     NextRequestMiddlewareType)
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import (CopyMessage, EditMessageCaption,
+                             EditMessageText, ForwardMessage, SendDocument,
+                             SendMediaGroup, SendMessage, SendPhoto,
+                             TelegramMethod)
+from aiogram.types import BufferedInputFile, Message
+
+from config import (DELIVERY_CHAT_BURST, DELIVERY_CHAT_RATE,
+                    DELIVERY_CONCURRENCY, DELIVERY_FILE_ID_CACHE_SIZE,
+                    DELIVERY_GLOBAL_BURST, DELIVERY_GLOBAL_RATE,
+                    DELIVERY_MAX_RETRIES, DELIVERY_QUEUE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BULK = 1
+
+# Methods that count towards Telegram's flood limits.
+RATE_LIMITED_METHODS = (
+    SendMessage,
+    SendPhoto,
+    SendDocument,
+    SendMediaGroup,
+    CopyMessage,
+    ForwardMessage,
+    EditMessageText,
+    EditMessageCaption,
+)
+
+delivery_priority: ContextVar[int] = ContextVar("delivery_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def bulk_delivery():
+    """Send everything inside the block behind interactive replies."""
+    token = delivery_priority.set(BULK)
+    try:
+        yield
+    finally:
+        delivery_priority.reset(token)
+
+
+class TokenBucket:
+    """Allow ``rate`` sends per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds to wait before using it."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate, self.blocked_until - now)
+
+    def delay(self) -> float:
+        """Seconds until a token is free, without taking it."""
+        now = time.monotonic()
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate, self.blocked_until - now)
+
+    def block(self, seconds: float) -> None:
+        """Hold every send for ``seconds``, as asked by a retry-after answer."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self, now: float) -> bool:
+        return now >= self.blocked_until and (
+            self.tokens + (now - self.updated) * self.rate >= self.capacity
+        )
+
+
+@dataclass
+class DeliveryStats:
+    sent: int = 0
+    failed: int = 0
+    retried: int = 0
+    uploads_reused: int = 0
+    queued: int = 0
+
+
+@dataclass
+class _Job:
+    make_request: NextRequestMiddlewareType
+    bot: Bot
+    method: TelegramMethod
+    future: asyncio.Future
+    priority: int
+    order: int
+    attempts: int = 0
+
+    @property
+    def chat_id(self) -> Any:
+        return getattr(self.method, "chat_id", None)
+
+    def entry(self) -> tuple:
+        return self.priority, self.order, self
+
+
+class FileIdCache:
+    """Map uploaded file contents to the file_id Telegram assigned them."""
+
+    def __init__(self, max_entries: int = DELIVERY_FILE_ID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        file_id = self._entries.get(key)
+        if file_id is not None:
+            self._entries.move_to_end(key)
+        return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        self._entries[key] = file_id
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+def _upload_key(kind: str, value: Any) -> Optional[str]:
+    if isinstance(value, BufferedInputFile):
+        return f"{kind}:{hashlib.sha256(value.data).hexdigest()}"
+    return None
+
+
+def _sent_file_id(message: Message) -> Optional[str]:
+    if message.photo:
+        return message.photo[-1].file_id
+    if message.document is not None:
+        return message.document.file_id
+    return None
+
+
+class DeliveryQueue:
+    """Send outgoing Bot API calls under global and per-chat rate limits.
+
+    Calls are queued by priority, interactive replies before bulk sends,
+    and run by ``concurrency`` workers. Each chat has at most one call in
+    the ready queue; the rest wait in the chat's own queue, so calls to one
+    chat go out in the order they were queued. A call whose chat is out of
+    tokens, or paused by a ``TelegramRetryAfter``, is put back into the
+    ready queue once the chat may send again instead of holding a worker,
+    so a burst to one chat never delays other chats. A retry-after answer
+    is retried up to ``max_retries`` times. Photos and documents sent from
+    memory are uploaded once; repeats reuse the returned file_id.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = DELIVERY_GLOBAL_RATE,
+        global_burst: float = DELIVERY_GLOBAL_BURST,
+        chat_rate: float = DELIVERY_CHAT_RATE,
+        chat_burst: float = DELIVERY_CHAT_BURST,
+        concurrency: int = DELIVERY_CONCURRENCY,
+        queue_size: int = DELIVERY_QUEUE_SIZE,
+        max_retries: int = DELIVERY_MAX_RETRIES,
+        file_ids: Optional[FileIdCache] = None,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.concurrency = max(concurrency, 1)
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.file_ids = file_ids if file_ids is not None else FileIdCache()
+        self.stats = DeliveryStats()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._room: Optional[asyncio.Semaphore] = None
+        self._workers: list[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        # Calls waiting behind the one a chat has in the ready queue or in flight
+        self._chat_waiting: Dict[Any, Deque[_Job]] = {}
+        self._delayed: Dict[int, tuple] = {}
+
+    def start(self) -> None:
+        """Start the workers; called on the first submit if needed."""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._room = asyncio.Semaphore(max(self.queue_size, 1))
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def close(self) -> None:
+        """Stop the workers and fail calls that were still queued."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        jobs = [job for _, job in self._delayed.values()]
+        for handle, _ in self._delayed.values():
+            handle.cancel()
+        for waiting in self._chat_waiting.values():
+            jobs.extend(waiting)
+        if self._queue is not None:
+            while not self._queue.empty():
+                jobs.append(self._queue.get_nowait()[-1])
+        for job in jobs:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Delivery queue closed"))
+        self._queue = None
+        self._room = None
+        self._workers = []
+        self._chat_waiting = {}
+        self._delayed = {}
+
+    async def submit(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+        priority: int = INTERACTIVE,
+    ) -> Any:
+        """Queue a call and wait for its result.
+
+        Waits for room first when ``queue_size`` calls are already pending.
+        """
+        self.start()
+        room = self._room
+        await room.acquire()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: room.release())
+        job = _Job(make_request, bot, method, future, priority, next(self._sequence))
+        chat_id = job.chat_id
+        if chat_id is None:
+            self._queue.put_nowait(job.entry())
+        elif chat_id in self._chat_waiting:
+            self._chat_waiting[chat_id].append(job)
+        else:
+            self._chat_waiting[chat_id] = deque()
+            self._queue.put_nowait(job.entry())
+        self._count_queued()
+        return await future
+
+    def _count_queued(self) -> None:
+        self.stats.queued = (
+            self._queue.qsize()
+            + len(self._delayed)
+            + sum(len(waiting) for waiting in self._chat_waiting.values())
+        )
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value
+                    for key, value in self._chat_buckets.items()
+                    if not value.idle(now) or key in self._chat_waiting
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst
+            )
+        return bucket
+
+    def _requeue_later(self, job: _Job, delay: float) -> None:
+        """Put ``job`` back into the ready queue after ``delay`` seconds."""
+        queue = self._queue
+
+        def requeue() -> None:
+            self._delayed.pop(job.order, None)
+            if self._queue is queue:
+                queue.put_nowait(job.entry())
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._delayed[job.order] = (handle, job)
+
+    def _finish_chat_call(self, chat_id: Any) -> None:
+        """Let the chat's next waiting call into the ready queue."""
+        if chat_id is None:
+            return
+        waiting = self._chat_waiting.get(chat_id)
+        if not waiting:
+            self._chat_waiting.pop(chat_id, None)
+            return
+        self._queue.put_nowait(waiting.popleft().entry())
+
+    async def _work(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            bucket = None if job.chat_id is None else self._chat_bucket(job.chat_id)
+            if job.future.done():
+                self._finish_chat_call(job.chat_id)
+                continue
+            wait = bucket.delay() if bucket is not None else 0.0
+            if wait > 0:
+                self._requeue_later(job, wait)
+                self._count_queued()
+                continue
+            if bucket is not None:
+                bucket.reserve()
+            if await self._deliver(job, bucket):
+                self._finish_chat_call(job.chat_id)
+            self._count_queued()
+
+    async def _deliver(self, job: _Job, bucket: Optional[TokenBucket]) -> bool:
+        """Send one call; False when it was scheduled for a retry instead."""
+        while True:
+            await asyncio.sleep(self.global_bucket.reserve())
+            method, upload_keys = self._reuse_uploads(job.method)
+            try:
+                result = await job.make_request(job.bot, method)
+            except TelegramRetryAfter as exc:
+                job.attempts += 1
+                self.stats.retried += 1
+                if job.attempts > self.max_retries:
+                    self._fail(job, exc)
+                    return True
+                (bucket or self.global_bucket).block(exc.retry_after)
+                logger.warning("Flood limit hit, retrying in %ss", exc.retry_after)
+                # The chat keeps its place, so its later calls stay behind this one.
+                self._requeue_later(job, exc.retry_after)
+                return False
+            except TelegramBadRequest as exc:
+                if method is not job.method and "file" in exc.message.lower():
+                    # A cached file_id went stale: forget it and upload again.
+                    for key in upload_keys:
+                        self.file_ids.discard(key)
+                    continue
+                self._fail(job, exc)
+                return True
+            except Exception as exc:
+                self._fail(job, exc)
+                return True
+            self._remember_uploads(upload_keys, result)
+            self.stats.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+            return True
+
+    def _fail(self, job: _Job, exc: BaseException) -> None:
+        self.stats.failed += 1
+        if not job.future.done():
+            job.future.set_exception(exc)
+
+    def _reuse_uploads(self, method: TelegramMethod):
+        """Swap in-memory uploads for known file_ids; return the method and upload keys."""
+        if isinstance(method, SendPhoto):
+            key = _upload_key("photo", method.photo)
+            file_id = self.file_ids.get(key) if key else None
+            if file_id is not None:
+                self.stats.uploads_reused += 1
+                return method.model_copy(update={"photo": file_id}), [key]
+            return method, [key] if key else []
+        if isinstance(method, SendDocument):
+            key = _upload_key("document", method.document)
+            file_id = self.file_ids.get(key) if key else None
+            if file_id is not None:
+                self.stats.uploads_reused += 1
+                return method.model_copy(update={"document": file_id}), [key]
+            return method, [key] if key else []
+        if isinstance(method, SendMediaGroup):
+            keys, media, reused = [], [], False
+            for item in method.media:
+                key = _upload_key(getattr(item.type, "value", item.type), item.media)
+                file_id = self.file_ids.get(key) if key else None
+                keys.append(key)
+                if file_id is not None:
+                    reused = True
+                    self.stats.uploads_reused += 1
+                    item = item.model_copy(update={"media": file_id})
+                media.append(item)
+            if reused:
+                return method.model_copy(update={"media": media}), keys
+            return method, keys
+        return method, []
+
+    def _remember_uploads(self, keys: list, result: Any) -> None:
+        messages = result if isinstance(result, list) else [result]
+        for key, message in zip(keys, messages):
+            if key is None or not isinstance(message, Message):
+                continue
+            file_id = _sent_file_id(message)
+            if file_id is not None:
+                self.file_ids.put(key, file_id)
+
+
+class DeliveryMiddleware(BaseRequestMiddleware):
+    """Route rate-limited Bot API calls through a ``DeliveryQueue``."""
+
+    def __init__(self, queue: DeliveryQueue):
+        self.queue = queue
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ):
+        if not isinstance(method, RATE_LIMITED_METHODS):
+            return await make_request(bot, method)
+        return await self.queue.submit(make_request, bot, method, delivery_priority.get())
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Mapping, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (BaseStorage, DefaultKeyBuilder,
+                                      StateType, StorageKey)
+from aiogram.fsm.storage.memory import MemoryStorage
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import (FSM_CACHE_SIZE, FSM_CACHE_TTL, FSM_CLEANUP_INTERVAL,
+                    FSM_STATE_TTL, FSM_STORAGE)
+from models import FSMStateModel
+
+logger = logging.getLogger(__name__)
+
+
+class SQLStorage(BaseStorage):
+    """FSM storage keeping one row per conversation in the bot database.
+
+    Rows expire ``state_ttl`` seconds after their last write. Reads are served
+    from a small in-process cache for ``cache_ttl`` seconds; writes go to the
+    database first and then refresh the cache. Keep ``cache_ttl`` short when
+    several workers may handle updates of the same user.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        state_ttl: int = FSM_STATE_TTL,
+        cache_ttl: float = FSM_CACHE_TTL,
+        cache_size: int = FSM_CACHE_SIZE,
+    ):
+        self.engine = engine
+        self.state_ttl = state_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.key_builder = DefaultKeyBuilder(
+            with_bot_id=True, with_business_connection_id=True, with_destiny=True
+        )
+        self._cache: OrderedDict[str, Tuple[float, Optional[str], dict]] = OrderedDict()
+
+    def _insert(self):
+        if self.engine.dialect.name == "postgresql":
+            return pg_insert(FSMStateModel)
+        return sqlite_insert(FSMStateModel)
+
+    def _remember(self, key: str, state: Optional[str], data: dict) -> None:
+        if self.cache_ttl <= 0 or self.cache_size <= 0:
+            return
+        self._cache[key] = (time.monotonic() + self.cache_ttl, state, data)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _load(self, key: str) -> Tuple[Optional[str], dict]:
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], cached[2]
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(FSMStateModel.state, FSMStateModel.data).where(
+                    FSMStateModel.key == key,
+                    FSMStateModel.expires_at > datetime.utcnow(),
+                )
+            )
+            row = result.first()
+        state, data = (row.state, json.loads(row.data)) if row is not None else (None, {})
+        self._remember(key, state, data)
+        return state, data
+
+    async def _save(self, key: str, values: dict) -> None:
+        now = datetime.utcnow()
+        statement = self._insert().values(
+            key=key,
+            state=values.get("state"),
+            data=values.get("data", "{}"),
+            expires_at=now + timedelta(seconds=self.state_ttl),
+        )
+        # Columns this write leaves alone start over when the row had expired,
+        # as if cleanup had already deleted it.
+        expired = FSMStateModel.expires_at <= now
+        kept = {
+            column: case(
+                (expired, getattr(statement.excluded, column)),
+                else_=getattr(FSMStateModel, column),
+            )
+            for column in ("state", "data")
+            if column not in values
+        }
+        statement = statement.on_conflict_do_update(
+            index_elements=[FSMStateModel.key],
+            set_={
+                **kept,
+                **{column: getattr(statement.excluded, column) for column in values},
+                "expires_at": statement.excluded.expires_at,
+            },
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(statement)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key = self.key_builder.build(key)
+        state_name = state.state if isinstance(state, State) else state
+        cached = self._cache.pop(storage_key, None)
+        await self._save(storage_key, {"state": state_name})
+        if cached is not None:
+            self._remember(storage_key, state_name, cached[2])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        storage_key = self.key_builder.build(key)
+        cached = self._cache.pop(storage_key, None)
+        await self._save(storage_key, {"data": json.dumps(dict(data), ensure_ascii=False)})
+        if cached is not None:
+            self._remember(storage_key, cached[1], dict(data))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return dict(data)
+
+    async def cleanup(self) -> int:
+        """Delete expired rows and return how many were removed."""
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                delete(FSMStateModel).where(FSMStateModel.expires_at <= datetime.utcnow())
+            )
+        return result.rowcount
+
+    async def run_cleanup(self, interval: int = FSM_CLEANUP_INTERVAL) -> None:
+        """Periodically delete expired rows until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.cleanup()
+                if removed:
+                    logger.info("Removed %d expired FSM states", removed)
+            except Exception:
+                logger.exception("FSM state cleanup failed")
+
+    async def close(self) -> None:
+        self._cache.clear()
+
+
+def build_fsm_storage(engine: AsyncEngine) -> BaseStorage:
+    """Create the FSM storage selected by FSM_STORAGE."""
+    if FSM_STORAGE == "sql":
+        return SQLStorage(engine)
+    return MemoryStorage()
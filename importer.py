@@ -0,0 +1,159 @@
+import csv
+import io
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import (Awaitable, BinaryIO, Callable, Dict, Iterator, List,
+                    Optional)
+
+from config import IMPORT_BATCH_SIZE
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import get_existing_expense_keys, import_expenses
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ColumnMapping:
+    """Where expense fields live in an uploaded CSV file.
+
+    The defaults match the files written by export_expenses_to_csv.
+    """
+
+    date: str = "Date"
+    category: str = "Category"
+    amount: str = "Amount"
+    date_format: str = "%Y-%m-%d %H:%M:%S"
+    delimiter: str = ","
+    decimal_comma: bool = False
+    category_aliases: dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class ImportProgress:
+    processed: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+def _parse_amount(value: str, mapping: ColumnMapping) -> Money:
+    value = value.replace("\xa0", "").replace(" ", "")
+    if mapping.decimal_comma:
+        value = value.replace(".", "").replace(",", ".")
+    amount = Money.parse(value)
+    if amount <= 0:
+        raise ValueError(f"amount must be positive: {value}")
+    return amount
+
+
+def _parse_category(value: str, mapping: ColumnMapping) -> CategoryENUM:
+    value = value.strip()
+    value = mapping.category_aliases.get(value, value)
+    try:
+        return CategoryENUM(value)
+    except ValueError:
+        raise ValueError(f"unknown category: {value}") from None
+
+
+def parse_row(row: dict, mapping: ColumnMapping, user_id: int) -> ExpenseCreateSchema:
+    """Validate one CSV row and turn it into an expense."""
+    try:
+        raw_date = row[mapping.date]
+        raw_category = row[mapping.category]
+        raw_amount = row[mapping.amount]
+    except KeyError as exc:
+        raise ValueError(f"missing column {exc.args[0]}") from None
+    if raw_date is None or raw_category is None or raw_amount is None:
+        raise ValueError("row has too few columns")
+    return ExpenseCreateSchema(
+        user_id=user_id,
+        category=_parse_category(raw_category, mapping),
+        amount=_parse_amount(raw_amount, mapping),
+        date=datetime.strptime(raw_date.strip(), mapping.date_format),
+    )
+
+
+def iter_csv_rows(file: BinaryIO, mapping: ColumnMapping) -> Iterator[tuple[int, dict]]:
+    """Yield (line number, row) pairs, reading the file incrementally."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text, delimiter=mapping.delimiter)
+        for row in reader:
+            yield reader.line_num, row
+    finally:
+        text.detach()
+
+
+async def import_csv(
+    db: AsyncSession,
+    user_id: int,
+    file: BinaryIO,
+    mapping: Optional[ColumnMapping] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_progress: Optional[Callable[[ImportProgress], Awaitable[None]]] = None,
+) -> ImportProgress:
+    """Import expenses from a CSV stream, skipping rows that already exist.
+
+    Rows are validated against CategoryENUM, de-duplicated on
+    (date, category, amount) against the database and committed in batches
+    of ``batch_size``. A key that appears n times in the file is imported
+    as often as it exceeds the rows the database already had, so identical
+    expenses on the same day survive and re-importing a file adds nothing.
+    """
+    mapping = mapping or ColumnMapping()
+    progress = ImportProgress()
+    # Rows per key in the database before this import wrote any of them
+    stored: Dict[tuple, int] = {}
+    occurrences: Counter = Counter()
+    batch: List[ExpenseCreateSchema] = []
+
+    async def flush() -> None:
+        existing = await get_existing_expense_keys(
+            db, user_id, [expense.date for expense in batch]
+        )
+        fresh = []
+        for expense in batch:
+            key = (
+                expense.date.replace(microsecond=0),
+                expense.category.value,
+                expense.amount,
+            )
+            stored.setdefault(key, existing[key])
+            occurrences[key] += 1
+            if occurrences[key] <= stored[key]:
+                progress.duplicates += 1
+                continue
+            fresh.append(expense)
+        progress.imported += await import_expenses(db, fresh)
+        batch.clear()
+        if on_progress is not None:
+            await on_progress(progress)
+
+    for line_number, row in iter_csv_rows(file, mapping):
+        progress.processed += 1
+        try:
+            batch.append(parse_row(row, mapping, user_id))
+        except ValueError as exc:
+            progress.invalid += 1
+            if len(progress.errors) < MAX_REPORTED_ERRORS:
+                progress.errors.append(f"line {line_number}: {exc}")
+            continue
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+    logger.info(
+        "Imported %d of %d rows for user %d (%d duplicates, %d invalid)",
+        progress.imported,
+        progress.processed,
+        user_id,
+        progress.duplicates,
+        progress.invalid,
+    )
+    return progress
@@ -1,8 +1,17 @@
 import asyncio
 
 from bot import main
-from config import DATABASE_URL
+from config import BOT_MODE, WEBHOOK_WORKERS
+from webhook import run_worker_processes
+
+
+def run_worker(index: int, updates) -> None:
+    """Run one webhook worker; only the first one registers the webhook."""
+    asyncio.run(main(register_webhook=index == 0, updates=updates, worker=index))
+
 
 if __name__ == "__main__":
-    print(DATABASE_URL)
-    asyncio.run(main())
+    if BOT_MODE == "webhook" and WEBHOOK_WORKERS > 1:
+        run_worker_processes(run_worker, WEBHOOK_WORKERS)
+    else:
+        asyncio.run(main())
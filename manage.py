@@ -0,0 +1,214 @@
+import argparse
+import asyncio
+
+from config import ARCHIVE_AFTER_MONTHS
+from database import async_session, shard_router
+from importer import ColumnMapping, ImportProgress, import_csv
+from migrations import run_migrations
+from partitioning import ensure_expense_partitions, partition_expenses
+from query_plans import explain_hot_paths
+from schemas import Money
+from services import (archive_cutoff, archive_expenses, check_expense_rollups,
+                      get_usage_totals, rebuild_expense_rollups)
+from sharding import UserMoveConflict, rebalance_shards
+
+
+async def rebuild_rollups(user_id: int | None) -> None:
+    """Backfill the rollup table from raw expenses."""
+    await shard_router.run_sync(run_migrations)
+    if user_id is not None:
+        async with async_session(user_id) as db:
+            rows = await rebuild_expense_rollups(db, user_id)
+    else:
+        rows = sum((await shard_router.fan_out(rebuild_expense_rollups)).values())
+    print(f"Rebuilt {rows} rollup rows")
+
+
+async def check_rollups(user_id: int | None) -> int:
+    """Report rollup rows that disagree with raw expenses."""
+    if user_id is not None:
+        async with async_session(user_id) as db:
+            mismatches = await check_expense_rollups(db, user_id)
+    else:
+        results = await shard_router.fan_out(check_expense_rollups)
+        mismatches = [item for items in results.values() for item in items]
+    for item in mismatches:
+        print(
+            f"user={item.user_id} day={item.day} category={item.category} "
+            f"expected={item.expected_total:.2f}/{item.expected_count} "
+            f"actual={item.actual_total:.2f}/{item.actual_count}"
+        )
+    print(f"{len(mismatches)} mismatched rollup rows")
+    return 1 if mismatches else 0
+
+
+async def migrate() -> None:
+    """Apply pending schema migrations on every shard."""
+    results = await shard_router.run_sync(run_migrations)
+    await shard_router.run_sync(ensure_expense_partitions)
+    for name, applied in results.items():
+        for migration in applied:
+            print(f"[{name}] Applied {migration.version}: {migration.description}")
+        print(f"[{name}] {len(applied)} migrations applied")
+
+
+async def partition_table() -> None:
+    """Convert expenses to monthly partitions on every shard (PostgreSQL only)."""
+    await shard_router.run_sync(run_migrations)
+    results = await shard_router.run_sync(partition_expenses)
+    for name, created in results.items():
+        print(f"[{name}] Created {len(created)} partitions")
+
+
+async def archive(months: int) -> None:
+    """Move expenses older than ``months`` full months to the archive table."""
+    await shard_router.run_sync(run_migrations)
+    before = archive_cutoff(months)
+    moved = sum((await shard_router.fan_out(archive_expenses, before)).values())
+    print(f"Archived {moved} expenses dated before {before}")
+
+
+async def rebalance(dry_run: bool, force: bool) -> int:
+    """Move users to the shard the hash ring maps them to."""
+    await shard_router.run_sync(run_migrations)
+    try:
+        moves = await rebalance_shards(shard_router, dry_run, force)
+    except UserMoveConflict as exc:
+        print(f"{exc}; rerun with --force to overwrite them")
+        return 1
+    for move in moves:
+        print(f"user={move.user_id} {move.source} -> {move.target}")
+    verb = "would move" if dry_run else "moved"
+    print(f"{len(moves)} users {verb}")
+    return 0
+
+
+async def shard_stats() -> None:
+    """Print users, expenses and money per shard and in total."""
+    results = await shard_router.fan_out(get_usage_totals)
+    for name, totals in results.items():
+        print(
+            f"{name:<16} users={totals.users} expenses={totals.expenses} "
+            f"total={totals.total:.2f}"
+        )
+    print(
+        f"{'total':<16} users={sum(item.users for item in results.values())} "
+        f"expenses={sum(item.expenses for item in results.values())} "
+        f"total={Money(sum(item.total for item in results.values())):.2f}"
+    )
+
+
+async def check_query_plans(user_id: int) -> int:
+    """Fail when a per-user hot-path query reads a hot table in full."""
+    async with async_session(user_id) as db:
+        plans = await explain_hot_paths(db, user_id)
+    for plan in plans:
+        status = "FULL SCAN" if plan.full_scans else "ok"
+        print(f"[{status}] {plan.name}")
+        for line in plan.plan:
+            print(f"    {line}")
+    failures = [plan for plan in plans if plan.full_scans]
+    print(f"{len(plans)} queries checked, {len(failures)} with full scans")
+    return 1 if failures else 0
+
+
+async def import_file(args: argparse.Namespace) -> int:
+    """Import a CSV file of expenses for one user."""
+    mapping = ColumnMapping(
+        date=args.date_column,
+        category=args.category_column,
+        amount=args.amount_column,
+        date_format=args.date_format,
+        delimiter=args.delimiter,
+        decimal_comma=args.decimal_comma,
+        category_aliases=dict(alias.split("=", 1) for alias in args.category_alias),
+    )
+
+    async def report_progress(progress: ImportProgress) -> None:
+        print(f"processed={progress.processed} imported={progress.imported}")
+
+    await shard_router.run_sync(run_migrations)
+    with open(args.path, "rb") as file:
+        async with async_session(args.user_id) as db:
+            progress = await import_csv(
+                db, args.user_id, file, mapping, on_progress=report_progress
+            )
+    print(
+        f"Imported {progress.imported} of {progress.processed} rows "
+        f"({progress.duplicates} duplicates, {progress.invalid} invalid)"
+    )
+    for error in progress.errors:
+        print(error)
+    return 1 if progress.invalid else 0
+
+
+async def run_command(args: argparse.Namespace) -> int:
+    try:
+        if args.command == "rebuild-rollups":
+            await rebuild_rollups(args.user_id)
+            return 0
+        if args.command == "import-csv":
+            return await import_file(args)
+        if args.command == "migrate":
+            await migrate()
+            return 0
+        if args.command == "partition-expenses":
+            await partition_table()
+            return 0
+        if args.command == "archive-expenses":
+            await archive(args.months)
+            return 0
+        if args.command == "check-query-plans":
+            return await check_query_plans(args.user_id)
+        if args.command == "rebalance-shards":
+            return await rebalance(args.dry_run, args.force)
+        if args.command == "shard-stats":
+            await shard_stats()
+            return 0
+        return await check_rollups(args.user_id)
+    finally:
+        await shard_router.dispose()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Finance bot maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name in ("rebuild-rollups", "check-rollups"):
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--user-id", type=int, default=None)
+
+    subparsers.add_parser("migrate")
+    subparsers.add_parser("partition-expenses")
+    archive_parser = subparsers.add_parser("archive-expenses")
+    archive_parser.add_argument("--months", type=int, default=ARCHIVE_AFTER_MONTHS)
+    plans_parser = subparsers.add_parser("check-query-plans")
+    plans_parser.add_argument("--user-id", type=int, default=1)
+    rebalance_parser = subparsers.add_parser("rebalance-shards")
+    rebalance_parser.add_argument("--dry-run", action="store_true")
+    rebalance_parser.add_argument(
+        "--force", action="store_true", help="overwrite rows a target shard already holds"
+    )
+    subparsers.add_parser("shard-stats")
+
+    defaults = ColumnMapping()
+    import_parser = subparsers.add_parser("import-csv")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--user-id", type=int, required=True)
+    import_parser.add_argument("--date-column", default=defaults.date)
+    import_parser.add_argument("--category-column", default=defaults.category)
+    import_parser.add_argument("--amount-column", default=defaults.amount)
+    import_parser.add_argument("--date-format", default=defaults.date_format)
+    import_parser.add_argument("--delimiter", default=defaults.delimiter)
+    import_parser.add_argument("--decimal-comma", action="store_true")
+    import_parser.add_argument(
+        "--category-alias",
+        action="append",
+        default=[],
+        metavar="SOURCE=CATEGORY",
+        help="map a category name from the file to a bot category",
+    )
+    return asyncio.run(run_command(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,279 @@
+import logging
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from sqlalchemy import event
+
+from config import METRICS_HOST, METRICS_PORT, METRICS_PROFILER
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = buckets
+        self._counts: Dict[LabelValues, list] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self._counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[labels] = self._sums.get(labels, 0) + value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.label_names, labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            plain_labels = _format_labels(self.label_names, labels)
+            yield f"{self.name}_sum{plain_labels} {self._sums[labels]}"
+            yield f"{self.name}_count{plain_labels} {cumulative}"
+
+
+class Registry:
+    """Metrics plus gauge callbacks that are read at scrape time."""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._gauges: list[Tuple[str, str, str, Callable[[], dict]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def gauges(
+        self, prefix: str, help_text: str, collect: Callable[[], dict], label: str = ""
+    ) -> None:
+        """Expose every numeric value returned by ``collect`` as ``prefix_<key>``.
+
+        With ``label``, ``collect`` returns such values per label value, and
+        each one becomes ``prefix_<key>{label="<value>"}``.
+        """
+        self._gauges.append((prefix, help_text, label, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, help_text, label, collect in self._gauges:
+            try:
+                collected = collect()
+            except Exception:
+                logger.exception("Metrics collector %s failed", prefix)
+                continue
+            series = collected.items() if label else [(None, collected)]
+            samples: Dict[str, list] = {}
+            for label_value, values in series:
+                labels = _format_labels((label,), (label_value,)) if label else ""
+                for key, value in values.items():
+                    if isinstance(value, (int, float)):
+                        samples.setdefault(key, []).append(f"{prefix}_{key}{labels} {value}")
+            for key, key_lines in samples.items():
+                lines.append(f"# HELP {prefix}_{key} {help_text}")
+                lines.append(f"# TYPE {prefix}_{key} gauge")
+                lines.extend(key_lines)
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_LATENCY = registry.register(
+    Histogram("bot_handler_seconds", "Handler latency.", ("handler",))
+)
+HANDLER_ERRORS = registry.register(
+    Counter("bot_handler_errors_total", "Handler exceptions.", ("handler",))
+)
+QUERY_LATENCY = registry.register(
+    Histogram("db_query_seconds", "SQL statement latency.", ("operation", "table"))
+)
+QUERY_ROWS = registry.register(
+    Counter("db_query_rows_total", "Rows reported by the driver.", ("operation", "table"))
+)
+CHART_RENDER_LATENCY = registry.register(
+    Histogram("chart_render_seconds", "Chart render time in the worker pool.", ("kind",))
+)
+CHART_PNG_BYTES = registry.register(
+    Histogram("chart_png_bytes", "Rendered PNG size.", ("kind",), SIZE_BUCKETS)
+)
+CSV_EXPORT_BYTES = registry.register(
+    Histogram("csv_export_bytes", "CSV export size.", buckets=SIZE_BUCKETS)
+)
+CSV_EXPORT_ROWS = registry.register(Counter("csv_export_rows_total", "Exported CSV rows."))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Record latency and failures of every matched handler."""
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, name)
+
+
+def _statement_labels(context) -> Tuple[str, str]:
+    statement = getattr(getattr(context, "compiled", None), "statement", None)
+    operation = (context.statement or "").lstrip().split(" ", 1)[0].upper() or "UNKNOWN"
+    if hasattr(statement, "selects"):
+        statement = statement.selects[0]
+    table = getattr(getattr(statement, "table", None), "name", None)
+    if table is None and hasattr(statement, "get_final_froms"):
+        froms = statement.get_final_froms()
+        table = getattr(froms[0], "name", None) if froms else None
+    return operation, table or "unknown"
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement executed through a (sync or async) engine."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        labels = _statement_labels(context)
+        QUERY_LATENCY.observe(time.perf_counter() - started, *labels)
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount is not None and rowcount >= 0:
+            QUERY_ROWS.inc(*labels, amount=rowcount)
+
+
+class SamplingProfiler:
+    """Periodically sample the event loop thread's stack in a background thread.
+
+    Samples are aggregated as collapsed stacks ("a;b;c count"), ready for
+    flamegraph tools.
+    """
+
+    def __init__(self):
+        self.samples: StackCounter[str] = StackCounter()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval: float = 0.005) -> None:
+        if self._thread is not None:
+            return
+        self.samples.clear()
+        self._stop.clear()
+        target_id = threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._run, args=(target_id, interval), name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def _run(self, target_id: int, interval: float) -> None:
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(target_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_filename}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
+
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """Serve /metrics (and the profiler switch when enabled); returns the runner."""
+    from aiohttp import web
+
+    async def metrics_handler(request: web.Request) -> web.Response:
+        return web.Response(
+            text=registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def profiler_start(request: web.Request) -> web.Response:
+        profiler.start(float(request.query.get("interval", "0.005")))
+        return web.Response(text="profiler started\n")
+
+    async def profiler_stop(request: web.Request) -> web.Response:
+        return web.Response(text=profiler.stop() + "\n")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    if METRICS_PROFILER:
+        app.router.add_post("/debug/profiler/start", profiler_start)
+        app.router.add_post("/debug/profiler/stop", profiler_stop)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Serving metrics on %s:%s/metrics", host, port)
+    return runner
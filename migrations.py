@@ -0,0 +1,135 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, List
+
+from sqlalchemy import Integer, insert, inspect, select, text
+from sqlalchemy.engine import Connection
+
+from models import (BudgetModel, DigestRunModel, ExpenseArchiveModel,
+                    ExpenseModel, ExpenseRollupModel, FSMStateModel,
+                    SchemaMigrationModel)
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_xact_lock key, so bot workers starting together migrate one at a time.
+MIGRATION_LOCK_KEY = 7140021
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _create_base_tables(connection: Connection) -> None:
+    tables = [
+        ExpenseModel.__table__,
+        ExpenseRollupModel.__table__,
+        FSMStateModel.__table__,
+        DigestRunModel.__table__,
+    ]
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+
+def _rebuild_sqlite_table(connection: Connection, table, column: str) -> None:
+    """SQLite cannot change a column type, so copy the rows into a new table."""
+    old_name = f"_{table.name}_float"
+    for index in inspect(connection).get_indexes(table.name):
+        connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+    connection.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"'))
+    table.create(connection)
+    names = [item.name for item in table.columns]
+    values = [
+        f'CAST(ROUND("{name}" * 100) AS INTEGER)' if name == column else f'"{name}"'
+        for name in names
+    ]
+    connection.execute(
+        text(
+            f'INSERT INTO "{table.name}" ({", ".join(names)}) '
+            f'SELECT {", ".join(values)} FROM "{old_name}"'
+        )
+    )
+    connection.execute(text(f'DROP TABLE "{old_name}"'))
+
+
+def _convert_money_to_kopecks(connection: Connection) -> None:
+    """Turn float ruble columns into BIGINT kopecks."""
+    inspector = inspect(connection)
+    for table, column in (
+        (ExpenseModel.__table__, "amount"),
+        (ExpenseRollupModel.__table__, "total"),
+    ):
+        current = {item["name"]: item["type"] for item in inspector.get_columns(table.name)}
+        if isinstance(current[column], Integer):
+            continue
+        if connection.dialect.name == "postgresql":
+            connection.execute(
+                text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column}" TYPE BIGINT '
+                    f'USING round("{column}" * 100)::bigint'
+                )
+            )
+        else:
+            _rebuild_sqlite_table(connection, table, column)
+        logger.info("Converted %s.%s to kopecks", table.name, column)
+
+
+def _add_expense_user_date_index(connection: Connection) -> None:
+    """Replace the id and (user_id, date, id) indexes with the covering one."""
+    existing = {index["name"] for index in inspect(connection).get_indexes("expenses")}
+    for name in ("ix_expenses_id", "ix_expenses_user_date_id"):
+        if name in existing:
+            connection.execute(text(f'DROP INDEX "{name}"'))
+    if "ix_expenses_user_date" not in existing:
+        for index in ExpenseModel.__table__.indexes:
+            index.create(connection)
+
+
+def _create_archive_table(connection: Connection) -> None:
+    ExpenseArchiveModel.__table__.create(connection, checkfirst=True)
+
+
+def _create_budgets_table(connection: Connection) -> None:
+    BudgetModel.__table__.create(connection, checkfirst=True)
+
+
+# Databases created before migrations existed have no schema_migrations rows,
+# so every step inspects the schema and only changes what is missing. Append
+# new steps; never renumber or edit applied ones.
+MIGRATIONS = [
+    Migration(1, "create base tables", _create_base_tables),
+    Migration(2, "store money as integer kopecks", _convert_money_to_kopecks),
+    Migration(3, "covering (user_id, date) index on expenses", _add_expense_user_date_index),
+    Migration(4, "expense archive table", _create_archive_table),
+    Migration(5, "category budgets", _create_budgets_table),
+]
+
+
+def run_migrations(connection: Connection) -> List[Migration]:
+    """Apply pending migrations in order and return them.
+
+    Run it with ``AsyncConnection.run_sync`` inside ``engine.begin()`` so a
+    failing step leaves no partial changes behind (SQLite and PostgreSQL
+    both have transactional DDL).
+    """
+    if connection.dialect.name == "postgresql":
+        connection.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY}
+        )
+    SchemaMigrationModel.__table__.create(connection, checkfirst=True)
+    applied = set(connection.execute(select(SchemaMigrationModel.version)).scalars())
+    pending = [item for item in MIGRATIONS if item.version not in applied]
+    for migration in pending:
+        logger.info("Applying migration %d: %s", migration.version, migration.description)
+        migration.apply(connection)
+        connection.execute(
+            insert(SchemaMigrationModel).values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow(),
+            )
+        )
+    return pending
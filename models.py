@@ -1,6 +1,7 @@
 from datetime import datetime
 
-from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, String
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Index, Integer,
+                        String, Text)
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -9,8 +10,102 @@ Base = declarative_base()
 class ExpenseModel(Base):
     __tablename__ = "expenses"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(BigInteger, nullable=False)
     category = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(BigInteger, nullable=False)  # kopecks
     date = Column(DateTime, default=datetime.utcnow)
+
+    # Serves user + date range queries and keyset pages of the history view.
+    # On PostgreSQL it also carries category and amount, so summaries and
+    # exports are answered by index-only scans.
+    __table_args__ = (
+        Index(
+            "ix_expenses_user_date",
+            "user_id",
+            "date",
+            "id",
+            postgresql_include=["category", "amount"],
+        ),
+    )
+
+
+class ExpenseArchiveModel(Base):
+    """Expenses of closed months moved out of the hot table.
+
+    Their totals stay in ``expense_rollups``, which answers summaries for
+    archived months.
+    """
+
+    __tablename__ = "expenses_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(BigInteger, nullable=False)
+    category = Column(String, nullable=False)
+    amount = Column(BigInteger, nullable=False)  # kopecks
+    date = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_expenses_archive_user_date", "user_id", "date"),)
+
+
+class ExpenseRollupModel(Base):
+    """Pre-aggregated expense sums per user, day and category."""
+
+    __tablename__ = "expense_rollups"
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    category = Column(String, primary_key=True)
+    total = Column(BigInteger, nullable=False, default=0)  # kopecks
+    count = Column(Integer, nullable=False, default=0)
+
+
+class BudgetModel(Base):
+    """A monthly budget per user and category with its running month total.
+
+    ``spent`` is the sum for ``month`` and is updated in the same
+    transaction as every expense, so checking a budget is one row read.
+    """
+
+    __tablename__ = "budgets"
+
+    user_id = Column(BigInteger, primary_key=True)
+    category = Column(String, primary_key=True)
+    monthly_limit = Column(BigInteger, nullable=False)  # kopecks
+    month = Column(Date, nullable=False)
+    spent = Column(BigInteger, nullable=False, default=0)  # kopecks
+
+
+class FSMStateModel(Base):
+    """Conversation state of one chat member, shared between bot workers."""
+
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=False, default="{}")
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class DigestRunModel(Base):
+    """Progress of one scheduled digest, so a restart resumes instead of resending."""
+
+    __tablename__ = "digest_runs"
+
+    kind = Column(String, primary_key=True)
+    period_start = Column(Date, primary_key=True)
+    last_user_id = Column(BigInteger, nullable=True)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    locked_until = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SchemaMigrationModel(Base):
+    """Schema migrations applied to this database."""
+
+    __tablename__ = "schema_migrations"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.utcnow)
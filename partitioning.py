@@ -0,0 +1,163 @@
+import logging
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+from config import EXPENSE_PARTITION_MONTHS_AHEAD
+
+logger = logging.getLogger(__name__)
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def partition_name(month: date) -> str:
+    return f"expenses_y{month:%Y}m{month:%m}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    """Whether ``expenses`` is a range-partitioned PostgreSQL table."""
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(
+        connection.execute(
+            text(
+                "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                "WHERE partrelid = to_regclass('expenses'))"
+            )
+        ).scalar()
+    )
+
+
+def partition_exists(connection: Connection, month: date) -> bool:
+    return (
+        connection.execute(
+            text("SELECT to_regclass(:name)"), {"name": partition_name(month)}
+        ).scalar()
+        is not None
+    )
+
+
+def create_month_partition(connection: Connection, month: date) -> bool:
+    """Create the partition holding ``month``; False if it already exists."""
+    if partition_exists(connection, month):
+        return False
+    connection.execute(
+        text(
+            f'CREATE TABLE "{partition_name(month)}" PARTITION OF expenses '
+            f"FOR VALUES FROM ('{month}') TO ('{next_month(month)}')"
+        )
+    )
+    logger.info("Created partition %s", partition_name(month))
+    return True
+
+
+def ensure_expense_partitions(
+    connection: Connection,
+    today: Optional[date] = None,
+    months_ahead: int = EXPENSE_PARTITION_MONTHS_AHEAD,
+) -> List[str]:
+    """Create partitions for this month and ``months_ahead`` more.
+
+    Does nothing unless ``expenses`` is partitioned. Runs on bot start, so
+    new rows land in their own month instead of the default partition.
+    """
+    if not is_partitioned(connection):
+        return []
+    created = []
+    month = month_start(today or date.today())
+    for _ in range(months_ahead + 1):
+        if create_month_partition(connection, month):
+            created.append(partition_name(month))
+        month = next_month(month)
+    return created
+
+
+def partition_expenses(connection: Connection, today: Optional[date] = None) -> List[str]:
+    """Convert ``expenses`` into a table range-partitioned by month.
+
+    Copies every row under an exclusive lock, so run it in a quiet window.
+    The primary key becomes (id, date) because PostgreSQL requires the
+    partition key in unique constraints; ids still come from the same
+    sequence. Rows outside every monthly partition go to
+    ``expenses_default``. Returns the partitions created.
+    """
+    if connection.dialect.name != "postgresql":
+        raise RuntimeError("Partitioning expenses needs PostgreSQL")
+    if is_partitioned(connection):
+        return ensure_expense_partitions(connection, today)
+
+    connection.execute(text("LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE"))
+    first, missing_dates = connection.execute(
+        text("SELECT min(date), count(*) - count(date) FROM expenses")
+    ).one()
+    if missing_dates:
+        raise RuntimeError(
+            f"{missing_dates} expenses have no date; set one before partitioning"
+        )
+
+    for index in inspect(connection).get_indexes("expenses"):
+        connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+    connection.execute(text("ALTER TABLE expenses RENAME TO expenses_unpartitioned"))
+    connection.execute(
+        text(
+            "ALTER TABLE expenses_unpartitioned "
+            "RENAME CONSTRAINT expenses_pkey TO expenses_unpartitioned_pkey"
+        )
+    )
+    connection.execute(
+        text(
+            "CREATE TABLE expenses ("
+            "id INTEGER NOT NULL DEFAULT nextval('expenses_id_seq'), "
+            "user_id BIGINT NOT NULL, "
+            "category VARCHAR NOT NULL, "
+            "amount BIGINT NOT NULL, "
+            "date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+            "PRIMARY KEY (id, date)"
+            ") PARTITION BY RANGE (date)"
+        )
+    )
+    # Dropping the old table would take an owned sequence with it.
+    connection.execute(text("ALTER SEQUENCE expenses_id_seq OWNED BY expenses.id"))
+    connection.execute(text("CREATE TABLE expenses_default PARTITION OF expenses DEFAULT"))
+    connection.execute(
+        text(
+            "CREATE INDEX ix_expenses_user_date ON expenses (user_id, date, id) "
+            "INCLUDE (category, amount)"
+        )
+    )
+
+    created = []
+    current = month_start(today or date.today())
+    month = month_start(first.date()) if first is not None else current
+    while month < current:
+        create_month_partition(connection, month)
+        created.append(partition_name(month))
+        month = next_month(month)
+    created.extend(ensure_expense_partitions(connection, today))
+
+    connection.execute(
+        text(
+            "INSERT INTO expenses (id, user_id, category, amount, date) "
+            "SELECT id, user_id, category, amount, date FROM expenses_unpartitioned"
+        )
+    )
+    connection.execute(text("DROP TABLE expenses_unpartitioned"))
+    connection.execute(text("ANALYZE expenses"))
+    return created
+
+
+def drop_month_partition(connection: Connection, month: date) -> bool:
+    """Drop the partition holding ``month`` once its rows were archived."""
+    if not is_partitioned(connection) or not partition_exists(connection, month):
+        return False
+    connection.execute(text(f'DROP TABLE "{partition_name(month)}"'))
+    logger.info("Dropped partition %s", partition_name(month))
+    return True
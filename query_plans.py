@@ -0,0 +1,136 @@
+import json
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from analytics import load_expense_history
+from cache import get_summary_cache
+from services import (build_summary_periods, export_expenses_to_csv,
+                      get_existing_expense_keys, get_expense_page,
+                      get_period_summary, get_summaries)
+
+# Tables a per-user hot-path query must never read in full.
+HOT_TABLES = {"expenses", "expenses_archive", "expense_rollups"}
+
+
+@dataclass
+class QueryPlan:
+    name: str
+    statement: str
+    plan: List[str]
+    full_scans: List[str] = field(default_factory=list)
+
+
+def _is_hot_table(name: str) -> bool:
+    # Monthly partitions (expenses_y2024m05) and the default one count too.
+    return name in HOT_TABLES or name.startswith("expenses_y") or name == "expenses_default"
+
+
+def _sqlite_full_scans(plan: List[str]) -> List[str]:
+    scans = []
+    for detail in plan:
+        words = detail.split()
+        if len(words) >= 2 and words[0] == "SCAN" and _is_hot_table(words[1]):
+            scans.append(words[1])
+    return scans
+
+
+def _postgresql_full_scans(node: dict) -> List[str]:
+    scans = []
+    if node.get("Node Type") == "Seq Scan" and _is_hot_table(node.get("Relation Name", "")):
+        scans.append(node["Relation Name"])
+    for child in node.get("Plans", []):
+        scans.extend(_postgresql_full_scans(child))
+    return scans
+
+
+def _postgresql_plan_lines(node: dict, depth: int = 0) -> List[str]:
+    relation = node.get("Relation Name")
+    index = node.get("Index Name")
+    line = "  " * depth + node["Node Type"]
+    if relation:
+        line += f" on {relation}"
+    if index:
+        line += f" using {index}"
+    lines = [line]
+    for child in node.get("Plans", []):
+        lines.extend(_postgresql_plan_lines(child, depth + 1))
+    return lines
+
+
+def _hot_path_calls(
+    db: AsyncSession, user_id: int, now: datetime
+) -> Dict[str, Callable[[], Awaitable]]:
+    async def export_month():
+        export = await export_expenses_to_csv(db, user_id, now - timedelta(days=31), now)
+        export.file.close()
+
+    return {
+        "intra-day period summary": lambda: get_period_summary(
+            db, user_id, now - timedelta(hours=3), now
+        ),
+        "period summaries": lambda: get_summaries(db, user_id, build_summary_periods()),
+        "history first page": lambda: get_expense_page(db, user_id),
+        "history next page": lambda: get_expense_page(db, user_id, before=(now, 0)),
+        "history previous page": lambda: get_expense_page(
+            db, user_id, after=(now - timedelta(days=30), 0)
+        ),
+        "CSV export": export_month,
+        "import duplicate check": lambda: get_existing_expense_keys(db, user_id, [now]),
+        "analytics history": lambda: load_expense_history(db, user_id),
+    }
+
+
+async def explain_hot_paths(db: AsyncSession, user_id: int = 1) -> List[QueryPlan]:
+    """EXPLAIN every statement the per-user read paths issue and flag full scans.
+
+    On PostgreSQL sequential scans are disabled for the EXPLAIN, so a
+    reported scan means no index can serve the query at all, not that the
+    planner preferred a scan of a small table.
+    """
+    sync_engine = db.bind.sync_engine
+    dialect = sync_engine.dialect.name
+    captured: List[Tuple[str, str, tuple]] = []
+    current = [""]
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return
+        captured.append((current[0], statement, parameters))
+
+    await get_summary_cache().clear()
+    event.listen(sync_engine, "before_cursor_execute", capture)
+    try:
+        for name, call in _hot_path_calls(db, user_id, datetime.utcnow()).items():
+            current[0] = name
+            await call()
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", capture)
+        await db.rollback()
+
+    plans = []
+    connection = await db.connection()
+    if dialect == "postgresql":
+        await connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    for name, statement, parameters in captured:
+        if dialect == "postgresql":
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            document = result.scalar()
+            root = (json.loads(document) if isinstance(document, str) else document)[0]["Plan"]
+            plan = QueryPlan(
+                name, statement, _postgresql_plan_lines(root), _postgresql_full_scans(root)
+            )
+        else:
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            details = [row[-1] for row in result]
+            plan = QueryPlan(name, statement, details, _sqlite_full_scans(details))
+        plans.append(plan)
+    await db.rollback()
+    return plans
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+from datetime import date
+from typing import Optional
+
+from chart_cache import (ChartCache, chart_cache, chart_cache_key,
+                         normalize_totals)
+from config import (CHART_QUEUE_SIZE, CHART_QUEUE_WAIT, CHART_TIMEOUT,
+                    CHART_WORKERS)
+from metrics import CHART_PNG_BYTES, CHART_RENDER_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+class ChartRenderError(Exception):
+    """Raised when a chart could not be rendered in time."""
+
+
+class ChartRendererBusy(ChartRenderError):
+    """Raised when the render queue is full."""
+
+
+def _warm_up_worker() -> None:
+    """Load matplotlib, the Agg backend and the font cache once per worker."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib import font_manager
+    from matplotlib import pyplot as plt
+
+    font_manager.findfont(font_manager.FontProperties())
+    fig, _ = plt.subplots(figsize=(1, 1))
+    plt.close(fig)
+
+    import charts  # noqa: F401
+
+
+def _ping() -> None:
+    return None
+
+
+def _timed_render(func, *args) -> tuple[bytes, float]:
+    started = time.perf_counter()
+    png = func(*args)
+    return png, time.perf_counter() - started
+
+
+def _render_category_pie(category_totals: list[tuple[str, float]], title: str) -> bytes:
+    from charts import build_category_pie_chart
+
+    return build_category_pie_chart(category_totals, title).getvalue()
+
+
+def _render_period_snapshot(today_total: float, month_total: float) -> bytes:
+    from charts import build_period_snapshot_chart
+
+    return build_period_snapshot_chart(today_total, month_total).getvalue()
+
+
+def _render_trend(
+    first_day: date, daily: list[float], rolling_7: list[float], rolling_30: list[float]
+) -> bytes:
+    from charts import build_trend_chart
+
+    return build_trend_chart(first_day, daily, rolling_7, rolling_30).getvalue()
+
+
+def _render_month_over_month(deltas: list[tuple[str, float, float]]) -> bytes:
+    from charts import build_month_over_month_chart
+
+    return build_month_over_month_chart(deltas).getvalue()
+
+
+def _render_weekday(averages: list[float], labels: list[str]) -> bytes:
+    from charts import build_weekday_chart
+
+    return build_weekday_chart(averages, labels).getvalue()
+
+
+def _round_series(values: list[float]) -> list[float]:
+    return [round(float(value), 2) for value in values]
+
+
+class ChartRenderer:
+    """Render charts in a process pool so matplotlib never blocks the event loop.
+
+    At most ``workers + queue_size`` jobs are in flight. Callers wait up to
+    ``queue_wait`` seconds for a slot and get ``ChartRendererBusy`` after
+    that, so handlers can fall back to a text-only reply.
+    """
+
+    def __init__(
+        self,
+        workers: int = CHART_WORKERS,
+        queue_size: int = CHART_QUEUE_SIZE,
+        queue_wait: float = CHART_QUEUE_WAIT,
+        timeout: float = CHART_TIMEOUT,
+        cache: Optional[ChartCache] = chart_cache,
+    ):
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+        self.queue_wait = queue_wait
+        self.timeout = timeout
+        self.cache = cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._warm_up: list[Future] = []
+
+    def start(self) -> None:
+        """Start and pre-warm the worker processes."""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up_worker,
+        )
+        self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+        # The pool spawns processes lazily; queue one no-op per worker so they
+        # all start warming up now rather than on the first user request.
+        self._warm_up = [self._executor.submit(_ping) for _ in range(self.workers)]
+
+    async def wait_until_ready(self) -> None:
+        """Start the pool if needed and wait until the workers have warmed up."""
+        self.start()
+        executor = self._executor
+        try:
+            await asyncio.gather(*(asyncio.wrap_future(future) for future in self._warm_up))
+        except BrokenExecutor as exc:
+            self._discard_broken(executor)
+            raise ChartRenderError("Chart render pool failed to start") from exc
+
+    def shutdown(self) -> None:
+        """Stop the worker processes, dropping queued jobs."""
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._slots = None
+        self._warm_up = []
+
+    def _discard_broken(self, executor: Optional[ProcessPoolExecutor]) -> None:
+        """Drop a pool whose worker died, so the next job starts a fresh one."""
+        if executor is None or executor is not self._executor:
+            return
+        logger.error("Chart render pool is broken, restarting it")
+        self.shutdown()
+
+    async def _submit(self, func, *args):
+        self.start()
+        executor = self._executor
+        slots = self._slots
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_wait)
+        except asyncio.TimeoutError:
+            raise ChartRendererBusy("Chart render queue is full") from None
+
+        loop = asyncio.get_running_loop()
+        try:
+            future: Future = executor.submit(func, *args)
+        except Exception as exc:
+            slots.release()
+            if isinstance(exc, BrokenExecutor):
+                self._discard_broken(executor)
+            raise ChartRenderError("Chart render pool is unavailable") from exc
+
+        def release_slot(_: Future) -> None:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(slots.release)
+
+        # A timed-out job keeps its worker busy, so the slot is released only
+        # when the worker actually finishes.
+        future.add_done_callback(release_slot)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Chart job timed out after %.1fs", self.timeout)
+            raise ChartRenderError("Chart rendering timed out") from None
+        except BrokenExecutor as exc:
+            # A worker died (OOM, segfault); the pool refuses every later job.
+            self._discard_broken(executor)
+            raise ChartRenderError("Chart render worker died") from exc
+
+    async def _render_cached(self, key: str, kind: str, func, *args) -> bytes:
+        if self.cache is not None:
+            png = await self.cache.get(key)
+            if png is not None:
+                return png
+        png, elapsed = await self._submit(_timed_render, func, *args)
+        CHART_RENDER_LATENCY.observe(elapsed, kind)
+        CHART_PNG_BYTES.observe(len(png), kind)
+        if self.cache is not None:
+            await self.cache.put(key, png)
+        return png
+
+    async def render_category_pie(
+        self, category_totals: list[tuple[str, float]], title: str
+    ) -> bytes:
+        """Render a category pie chart and return PNG bytes."""
+        totals = normalize_totals(category_totals)
+        key = chart_cache_key("category_pie", title, totals)
+        return await self._render_cached(key, "category_pie", _render_category_pie, totals, title)
+
+    async def render_period_snapshot(self, today_total: float, month_total: float) -> bytes:
+        """Render the today/month comparison chart and return PNG bytes."""
+        totals = normalize_totals([("today", today_total), ("month", month_total)])
+        key = chart_cache_key("period_snapshot", "", totals)
+        return await self._render_cached(
+            key, "period_snapshot", _render_period_snapshot, totals[0][1], totals[1][1]
+        )
+
+    async def render_trend(
+        self,
+        first_day: date,
+        daily: list[float],
+        rolling_7: list[float],
+        rolling_30: list[float],
+    ) -> bytes:
+        """Render daily spending with rolling averages and return PNG bytes."""
+        daily, rolling_7, rolling_30 = (
+            _round_series(daily), _round_series(rolling_7), _round_series(rolling_30)
+        )
+        totals = [(str(index), value) for index, value in enumerate(daily)]
+        key = chart_cache_key(
+            "trend",
+            first_day.isoformat(),
+            totals,
+            {"rolling_7": rolling_7, "rolling_30": rolling_30},
+        )
+        return await self._render_cached(
+            key, "trend", _render_trend, first_day, daily, rolling_7, rolling_30
+        )
+
+    async def render_month_over_month(self, deltas: list[tuple[str, float, float]]) -> bytes:
+        """Render per-category (current, previous) month totals and return PNG bytes."""
+        current = normalize_totals([(category, value) for category, value, _ in deltas])
+        previous = normalize_totals([(category, value) for category, _, value in deltas])
+        key = chart_cache_key("month_over_month", "", current, {"previous": previous})
+        deltas = [
+            (category, value, previous_value)
+            for (category, value), (_, previous_value) in zip(current, previous)
+        ]
+        return await self._render_cached(
+            key, "month_over_month", _render_month_over_month, deltas
+        )
+
+    async def render_weekday(self, averages: list[float], labels: list[str]) -> bytes:
+        """Render average spend per weekday and return PNG bytes."""
+        totals = normalize_totals(list(zip(labels, averages)))
+        key = chart_cache_key("weekday", "", totals)
+        return await self._render_cached(
+            key, "weekday", _render_weekday, [value for _, value in totals], labels
+        )
+
+
+chart_renderer = ChartRenderer()
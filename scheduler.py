@@ -0,0 +1,279 @@
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from config import (DIGEST_CHECK_INTERVAL, DIGEST_CHUNK_SIZE,
+                    DIGEST_LEASE_SECONDS, DIGEST_MONTHLY_CATCH_UP_DAYS,
+                    DIGEST_RENDER_CONCURRENCY, DIGEST_SEND_HOUR)
+from database import ShardRouter, async_session, shard_router
+from models import DigestRunModel
+from rendering import ChartRenderer, ChartRenderError, chart_renderer
+from schemas import CategorySummarySchema, Money
+from services import get_category_totals_by_user
+
+logger = logging.getLogger(__name__)
+
+DAILY = "daily"
+MONTHLY = "monthly"
+
+
+@dataclass
+class Digest:
+    user_id: int
+    kind: str
+    text: str
+    chart: Optional[bytes] = None
+
+
+@dataclass(frozen=True)
+class DigestPeriod:
+    kind: str
+    first_day: date
+    last_day: date
+
+
+def period_for(kind: str, first_day: date) -> DigestPeriod:
+    """The daily or monthly period starting on ``first_day``."""
+    if kind == DAILY:
+        return DigestPeriod(kind, first_day, first_day)
+    next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return DigestPeriod(kind, first_day, next_month - timedelta(days=1))
+
+
+def due_periods(
+    now: datetime,
+    send_hour: int = DIGEST_SEND_HOUR,
+    catch_up_days: int = DIGEST_MONTHLY_CATCH_UP_DAYS,
+) -> List[DigestPeriod]:
+    """Periods whose digests are due at ``now``.
+
+    Yesterday's daily digest goes out from ``send_hour`` on. The monthly
+    digest for the previous month is due during the first
+    ``catch_up_days`` days of a month, so a bot that was down on the 1st
+    still sends it; the ``digest_runs`` checkpoint keeps it from going out
+    twice, and deploying mid-month does not send a stale report.
+    """
+    send_day = now.date() if now.hour >= send_hour else now.date() - timedelta(days=1)
+    periods = [period_for(DAILY, send_day - timedelta(days=1))]
+    if send_day.day <= max(catch_up_days, 1):
+        previous_month = (send_day.replace(day=1) - timedelta(days=1)).replace(day=1)
+        periods.append(period_for(MONTHLY, previous_month))
+    return periods
+
+
+def format_digest(period: DigestPeriod, categories: List[CategorySummarySchema]) -> str:
+    total = Money(sum(item.total for item in categories))
+    if period.kind == DAILY:
+        header = f"Итоги дня {period.first_day:%d.%m.%Y}: {total:.2f} ₽"
+    else:
+        header = f"Итоги месяца {period.first_day:%m.%Y}: {total:.2f} ₽"
+    lines = [header]
+    lines.extend(f"• {item.category}: {item.total:.2f} ₽" for item in categories)
+    return "\n".join(lines)
+
+
+class DigestScheduler:
+    """Send daily and monthly digests to every user with expenses in the period.
+
+    Users are walked in ``user_id`` order, ``chunk_size`` per grouped query.
+    Progress is checkpointed in ``digest_runs`` after every delivered digest.
+    The row doubles as a lease, so one bot worker runs a period at a time
+    and another one resumes it if that worker dies. Runs are kept on the
+    home shard; every chunk is read from all shards and merged by user id.
+    """
+
+    def __init__(
+        self,
+        deliver: Callable[[Digest], Awaitable[None]],
+        session_factory=async_session,
+        router: ShardRouter = shard_router,
+        renderer: Optional[ChartRenderer] = chart_renderer,
+        chunk_size: int = DIGEST_CHUNK_SIZE,
+        render_concurrency: int = DIGEST_RENDER_CONCURRENCY,
+        lease_seconds: int = DIGEST_LEASE_SECONDS,
+    ):
+        self.deliver = deliver
+        self.session_factory = session_factory
+        self.router = router
+        self.renderer = renderer
+        self.chunk_size = max(chunk_size, 1)
+        self.render_concurrency = max(render_concurrency, 1)
+        self.lease = timedelta(seconds=lease_seconds)
+
+    async def _claim(self, period: DigestPeriod) -> Optional[Tuple[Optional[int], int, int]]:
+        """Take the lease on a period and return its (cursor, sent, failed) progress."""
+        now = datetime.utcnow()
+        key = [
+            DigestRunModel.kind == period.kind,
+            DigestRunModel.period_start == period.first_day,
+        ]
+        async with self.session_factory() as db:
+            db.add(
+                DigestRunModel(
+                    kind=period.kind,
+                    period_start=period.first_day,
+                    sent=0,
+                    failed=0,
+                    locked_until=now + self.lease,
+                )
+            )
+            try:
+                await db.commit()
+                return None, 0, 0
+            except IntegrityError:
+                await db.rollback()
+
+            result = await db.execute(
+                update(DigestRunModel)
+                .where(
+                    *key,
+                    DigestRunModel.finished_at.is_(None),
+                    or_(
+                        DigestRunModel.locked_until.is_(None),
+                        DigestRunModel.locked_until < now,
+                    ),
+                )
+                .values(locked_until=now + self.lease)
+            )
+            await db.commit()
+            if result.rowcount != 1:
+                return None
+            row = (
+                await db.execute(
+                    select(
+                        DigestRunModel.last_user_id,
+                        DigestRunModel.sent,
+                        DigestRunModel.failed,
+                    ).where(*key)
+                )
+            ).one()
+            return row.last_user_id, row.sent, row.failed
+
+    async def _save_progress(self, period: DigestPeriod, finished: bool, **values) -> None:
+        now = datetime.utcnow()
+        if finished:
+            values.update(finished_at=now, locked_until=None)
+        else:
+            values.update(locked_until=now + self.lease)
+        async with self.session_factory() as db:
+            await db.execute(
+                update(DigestRunModel)
+                .where(
+                    DigestRunModel.kind == period.kind,
+                    DigestRunModel.period_start == period.first_day,
+                )
+                .values(**values)
+            )
+            await db.commit()
+
+    async def _build_digest(
+        self,
+        period: DigestPeriod,
+        user_id: int,
+        categories: List[CategorySummarySchema],
+        render_slots: asyncio.Semaphore,
+    ) -> Digest:
+        digest = Digest(user_id, period.kind, format_digest(period, categories))
+        totals = [
+            (item.category, float(item.total.rubles))
+            for item in categories
+            if item.total > 0
+        ]
+        if self.renderer is None or not totals:
+            return digest
+        title = "Категории трат за день" if period.kind == DAILY else "Категории трат за месяц"
+        async with render_slots:
+            try:
+                digest.chart = await self.renderer.render_category_pie(totals, title)
+            except (ValueError, ChartRenderError):
+                logger.warning("Sending digest for user %s without a chart", user_id)
+        return digest
+
+    async def _next_chunk(
+        self, period: DigestPeriod, cursor: Optional[int]
+    ) -> List[Tuple[int, List[CategorySummarySchema]]]:
+        # Each shard's chunk is sorted by user id and shards share no users,
+        # so the first chunk_size merged users are the next chunk overall.
+        chunks = await self.router.fan_out(
+            get_category_totals_by_user,
+            period.first_day,
+            period.last_day,
+            cursor,
+            self.chunk_size,
+        )
+        merged = heapq.merge(*chunks.values(), key=lambda item: item[0])
+        return list(merged)[: self.chunk_size]
+
+    async def run_period(self, period: DigestPeriod) -> int:
+        """Deliver a period's digests, resuming after the last checkpoint.
+
+        Returns the number of digests delivered by this call, or 0 when the
+        period is finished or leased by another worker.
+        """
+        progress = await self._claim(period)
+        if progress is None:
+            return 0
+        cursor, sent, failed = progress
+        delivered = 0
+        render_slots = asyncio.Semaphore(self.render_concurrency)
+        while True:
+            chunk = await self._next_chunk(period, cursor)
+            if not chunk:
+                break
+            digests = await asyncio.gather(
+                *(
+                    self._build_digest(period, user_id, categories, render_slots)
+                    for user_id, categories in chunk
+                )
+            )
+            for digest in digests:
+                try:
+                    await self.deliver(digest)
+                    sent += 1
+                    delivered += 1
+                except Exception:
+                    logger.exception("Could not deliver digest to user %s", digest.user_id)
+                    failed += 1
+                cursor = digest.user_id
+                await self._save_progress(
+                    period, False, last_user_id=cursor, sent=sent, failed=failed
+                )
+        await self._save_progress(period, True)
+        logger.info(
+            "Finished %s digest for %s: %d sent, %d failed",
+            period.kind,
+            period.first_day,
+            sent,
+            failed,
+        )
+        return delivered
+
+    async def run_due(self, now: Optional[datetime] = None) -> int:
+        """Run every due period plus any unfinished run left by a restart."""
+        periods = due_periods(now or datetime.now())
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(DigestRunModel.kind, DigestRunModel.period_start).where(
+                    DigestRunModel.finished_at.is_(None)
+                )
+            )
+            unfinished = [period_for(row.kind, row.period_start) for row in result]
+        delivered = 0
+        for period in dict.fromkeys(unfinished + periods):
+            delivered += await self.run_period(period)
+        return delivered
+
+    async def run(self, interval: int = DIGEST_CHECK_INTERVAL) -> None:
+        """Check for due digests every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await self.run_due()
+            except Exception:
+                logger.exception("Digest run failed")
+            await asyncio.sleep(interval)
@@ -1,7 +1,99 @@
 from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 from enum import Enum
+from typing import Any, Optional, Union
 
-from pydantic import BaseModel
+from pydantic import BaseModel, GetCoreSchemaHandler
+from pydantic_core import core_schema
+
+
+# Largest amount a BIGINT kopeck column can hold.
+MAX_KOPECKS = 2**63 - 1
+
+
+class Money(int):
+    """An exact amount in kopecks that prints as rubles.
+
+    ``f"{total:.2f}"`` gives ``"1234.50"`` for ``Money(123450)``. Adding,
+    subtracting or negating Money gives Money; any other arithmetic gives
+    a plain ``int`` of kopecks that has to be wrapped in ``Money`` again
+    before formatting.
+    """
+
+    @classmethod
+    def from_rubles(cls, value: Union[str, int, float, Decimal]) -> "Money":
+        """Convert rubles to kopecks, rounding half up."""
+        try:
+            kopecks = int((Decimal(str(value)) * 100).quantize(Decimal(1), ROUND_HALF_UP))
+        except ArithmeticError:
+            raise ValueError(f"not an amount: {value!r}") from None
+        if abs(kopecks) > MAX_KOPECKS:
+            raise ValueError(f"amount too large: {value!r}")
+        return cls(kopecks)
+
+    @classmethod
+    def parse(cls, text: str) -> "Money":
+        """Parse user input such as "1 234,50", "1234.5", "1,234.50" or "1 234 ₽"."""
+        cleaned = "".join(text.replace("₽", "").split())
+        if "," in cleaned and "." in cleaned:
+            # The later separator is the decimal one; the other groups thousands.
+            thousands = "," if cleaned.rfind(".") > cleaned.rfind(",") else "."
+            cleaned = cleaned.replace(thousands, "")
+        cleaned = cleaned.replace(",", ".")
+        try:
+            value = Decimal(cleaned)
+        except InvalidOperation:
+            raise ValueError(f"not an amount: {text!r}") from None
+        if not value.is_finite():
+            raise ValueError(f"not an amount: {text!r}")
+        try:
+            if abs(value) * 100 > MAX_KOPECKS:
+                raise ValueError(f"amount too large: {text!r}")
+            if value.quantize(Decimal("0.01")) != value:
+                raise ValueError(f"more than two decimal places: {text!r}")
+        except ArithmeticError:
+            raise ValueError(f"not an amount: {text!r}") from None
+        return cls.from_rubles(value)
+
+    def __add__(self, other):
+        result = int.__add__(self, other)
+        return Money(result) if isinstance(other, int) else result
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        result = int.__sub__(self, other)
+        return Money(result) if isinstance(other, int) else result
+
+    def __rsub__(self, other):
+        result = int.__rsub__(self, other)
+        return Money(result) if isinstance(other, int) else result
+
+    def __neg__(self) -> "Money":
+        return Money(-int(self))
+
+    @property
+    def rubles(self) -> Decimal:
+        return Decimal(int(self)).scaleb(-2)
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self.rubles, format_spec)
+
+    def __str__(self) -> str:
+        return str(self.rubles)
+
+    def __repr__(self) -> str:
+        return f"Money({int(self)})"
+
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source: Any, handler: GetCoreSchemaHandler
+    ) -> core_schema.CoreSchema:
+        return core_schema.no_info_after_validator_function(
+            cls,
+            core_schema.int_schema(),
+            serialization=core_schema.plain_serializer_function_ser_schema(int),
+        )
 
 
 class CategoryENUM(str, Enum):
@@ -23,34 +115,80 @@ class CategoryENUM(str, Enum):
     SUBSCRIPTIONS = "подписки"
 
 
+class BudgetStatusSchema(BaseModel):
+    category: str
+    limit: Money
+    spent: Money
+    # Highest warning threshold (share of the limit) the last expense crossed
+    crossed: Optional[float] = None
+
+    @property
+    def remaining(self) -> Money:
+        return Money(self.limit - self.spent)
+
+
 class ExpenseCreateSchema(BaseModel):
     user_id: int
     category: CategoryENUM
-    amount: float
+    amount: Money
+    date: Optional[datetime] = None
 
 
 class ExpenseSchema(BaseModel):
     id: int
     user_id: int
     category: CategoryENUM
-    amount: float
+    amount: Money
     date: datetime
+    # Budget of the expense's category after it was added, if one is set
+    budget: Optional[BudgetStatusSchema] = None
 
     class Config:
         from_attributes = True
 
 
+class ExpenseHistoryItemSchema(BaseModel):
+    id: int
+    category: str
+    amount: Money
+    date: datetime
+
+
+class ExpensePageSchema(BaseModel):
+    """One page of expenses, newest first."""
+
+    items: list[ExpenseHistoryItemSchema]
+    has_older: bool
+    has_newer: bool
+
+
 class ExpenseDaySchema(BaseModel):
     date: date
-    total: float
+    total: Money
 
 
 class CategorySummarySchema(BaseModel):
     category: str
-    total: float
+    total: Money
 
 
 class ExpensePeriodSummarySchema(BaseModel):
-    total: float
+    total: Money
     daily_totals: list[ExpenseDaySchema]
     category_breakdown: list[CategorySummarySchema]
+
+
+class UsageTotalsSchema(BaseModel):
+    users: int
+    expenses: int
+    total: Money
+
+
+class RollupMismatchSchema(BaseModel):
+    user_id: int
+    day: date
+    category: str
+    expected_total: Money
+    actual_total: Money
+    expected_count: int
+    actual_count: int
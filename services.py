@@ -1,26 +1,340 @@
-from datetime import date, datetime
-from typing import List, Tuple
-
-from models import ExpenseModel
-from schemas import (CategorySummarySchema, ExpenseCreateSchema,
-                     ExpenseDaySchema, ExpensePeriodSummarySchema,
-                     ExpenseSchema)
-from sqlalchemy import func, select
+import csv
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from io import StringIO
+from tempfile import SpooledTemporaryFile
+from typing import Dict, List, Optional, Tuple
+
+from cache import get_summary_cache
+from config import (ARCHIVE_AFTER_MONTHS, BUDGET_WARNING_THRESHOLDS,
+                    CSV_EXPORT_BATCH_SIZE, CSV_SPOOL_THRESHOLD,
+                    HISTORY_PAGE_SIZE)
+from metrics import CSV_EXPORT_BYTES, CSV_EXPORT_ROWS
+from models import (BudgetModel, ExpenseArchiveModel, ExpenseModel,
+                    ExpenseRollupModel)
+from partitioning import drop_month_partition, month_start, next_month
+from schemas import (BudgetStatusSchema, CategoryENUM,
+                     CategorySummarySchema, ExpenseCreateSchema,
+                     ExpenseDaySchema, ExpenseHistoryItemSchema,
+                     ExpensePageSchema, ExpensePeriodSummarySchema,
+                     ExpenseSchema, Money, RollupMismatchSchema,
+                     UsageTotalsSchema)
+from sqlalchemy import (Date, and_, bindparam, case, cast, delete, func,
+                        insert, literal, null, or_, select, tuple_, union_all,
+                        update)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 
+def _build_expense_row(expense: ExpenseCreateSchema, now: datetime) -> dict:
+    return {
+        "user_id": expense.user_id,
+        "category": expense.category.value,
+        "amount": int(expense.amount),
+        "date": expense.date or now,
+    }
+
+
 async def add_expense(db: AsyncSession, expense: ExpenseCreateSchema) -> ExpenseSchema:
     """Add a new expense to the database."""
-    db_expense = ExpenseModel(
-        user_id=expense.user_id,
-        category=expense.category.value,
-        amount=expense.amount,
-        date=datetime.utcnow(),
-    )
+    row = _build_expense_row(expense, datetime.utcnow())
+    db_expense = ExpenseModel(**row)
     db.add(db_expense)
+    await db.execute(_build_rollup_upsert(db), _build_rollup_params([row]))
+    budgets = await _update_budgets(db, [row])
     await db.commit()
+    await get_summary_cache().invalidate_user(expense.user_id)
     await db.refresh(db_expense)
-    return ExpenseSchema.from_orm(db_expense)
+    return ExpenseSchema.from_orm(db_expense).model_copy(update={"budget": budgets[0]})
+
+
+async def add_expenses(
+    db: AsyncSession, expenses: List[ExpenseCreateSchema]
+) -> List[ExpenseSchema]:
+    """Add several expenses with one multi-row INSERT and a single commit."""
+    if not expenses:
+        return []
+    now = datetime.utcnow()
+    rows = [_build_expense_row(expense, now) for expense in expenses]
+    result = await db.execute(
+        insert(ExpenseModel).returning(ExpenseModel, sort_by_parameter_order=True), rows
+    )
+    created = result.scalars().all()
+    await db.execute(_build_rollup_upsert(db), _build_rollup_params(rows))
+    budgets = await _update_budgets(db, rows)
+    await db.commit()
+    await _invalidate_users({row["user_id"] for row in rows})
+    return [
+        ExpenseSchema.from_orm(expense).model_copy(update={"budget": budget})
+        for expense, budget in zip(created, budgets)
+    ]
+
+
+async def import_expenses(db: AsyncSession, expenses: List[ExpenseCreateSchema]) -> int:
+    """Bulk-load expenses without returning rows, using COPY on PostgreSQL."""
+    if not expenses:
+        return 0
+    now = datetime.utcnow()
+    rows = [_build_expense_row(expense, now) for expense in expenses]
+    # The rollup upsert goes first so that COPY runs inside the transaction
+    # it opens on the same connection.
+    await db.execute(_build_rollup_upsert(db), _build_rollup_params(rows))
+    if _dialect_name(db) == "postgresql":
+        connection = await db.connection()
+        raw_connection = await connection.get_raw_connection()
+        columns = ["user_id", "category", "amount", "date"]
+        await raw_connection.driver_connection.copy_records_to_table(
+            ExpenseModel.__tablename__,
+            records=[tuple(row[column] for column in columns) for row in rows],
+            columns=columns,
+        )
+    else:
+        await db.execute(insert(ExpenseModel.__table__), rows)
+    await _update_budgets(db, rows)
+    await db.commit()
+    await _invalidate_users({row["user_id"] for row in rows})
+    return len(rows)
+
+
+# Timestamp ranges per duplicate lookup, keeping statements far below the
+# bind parameter limits of the drivers
+EXISTING_KEY_RANGES_PER_QUERY = 200
+
+
+async def get_existing_expense_keys(
+    db: AsyncSession, user_id: int, dates: List[datetime]
+) -> Counter:
+    """Count a user's expenses per (date, category, amount) at the given times.
+
+    Dates are truncated to whole seconds, the precision of CSV exports.
+    Only those seconds are read, adjacent ones merged into one range, so a
+    file that is not sorted by date does not re-read the history between
+    its rows.
+    """
+    ranges: List[List[datetime]] = []
+    for second in sorted({value.replace(microsecond=0) for value in dates}):
+        if ranges and ranges[-1][1] == second:
+            ranges[-1][1] = second + timedelta(seconds=1)
+        else:
+            ranges.append([second, second + timedelta(seconds=1)])
+    counts: Counter = Counter()
+    for offset in range(0, len(ranges), EXISTING_KEY_RANGES_PER_QUERY):
+        chunk = ranges[offset : offset + EXISTING_KEY_RANGES_PER_QUERY]
+        queries = []
+        for model in (ExpenseModel, ExpenseArchiveModel):
+            in_ranges = [and_(model.date >= start, model.date < end) for start, end in chunk]
+            queries.append(
+                select(model.date, model.category, model.amount).where(
+                    model.user_id == user_id, or_(*in_ranges)
+                )
+            )
+        result = await db.execute(union_all(*queries))
+        counts.update(
+            (row.date.replace(microsecond=0), row.category, row.amount) for row in result
+        )
+    return counts
+
+
+async def _invalidate_users(user_ids) -> None:
+    cache = get_summary_cache()
+    for user_id in user_ids:
+        await cache.invalidate_user(user_id)
+
+
+def _build_rollup_upsert(db: AsyncSession):
+    """Build an upsert adding amounts to their (user, day, category) rollups."""
+    dialect_insert = pg_insert if _dialect_name(db) == "postgresql" else sqlite_insert
+    statement = dialect_insert(ExpenseRollupModel)
+    return statement.on_conflict_do_update(
+        index_elements=[
+            ExpenseRollupModel.user_id,
+            ExpenseRollupModel.day,
+            ExpenseRollupModel.category,
+        ],
+        set_={
+            "total": ExpenseRollupModel.total + statement.excluded.total,
+            "count": ExpenseRollupModel.count + statement.excluded.count,
+        },
+    )
+
+
+def _build_rollup_params(rows: List[dict]) -> List[dict]:
+    totals = {}
+    for row in rows:
+        key = (row["user_id"], row["date"].date(), row["category"])
+        total, count = totals.get(key, (0, 0))
+        totals[key] = (total + row["amount"], count + 1)
+    return [
+        {"user_id": user_id, "day": day, "category": category, "total": total, "count": count}
+        for (user_id, day, category), (total, count) in totals.items()
+    ]
+
+
+def _build_budget_update():
+    """Add an amount to a budget's running total, or rebuild it for a new month.
+
+    Runs after the rollup upsert, so the rebuild sums the month's rollups
+    including the new expenses. Expenses dated before the tracked month
+    leave the budget alone.
+    """
+    month = bindparam("budget_month", type_=Date)
+    month_total = (
+        select(func.coalesce(func.sum(ExpenseRollupModel.total), 0))
+        .where(
+            ExpenseRollupModel.user_id == BudgetModel.user_id,
+            ExpenseRollupModel.category == BudgetModel.category,
+            ExpenseRollupModel.day >= month,
+            ExpenseRollupModel.day < bindparam("budget_next_month", type_=Date),
+        )
+        .scalar_subquery()
+    )
+    return (
+        update(BudgetModel)
+        .where(
+            BudgetModel.user_id == bindparam("budget_user_id"),
+            BudgetModel.category == bindparam("budget_category"),
+            BudgetModel.month <= month,
+        )
+        .values(
+            spent=case(
+                (BudgetModel.month == month, BudgetModel.spent + bindparam("added")),
+                else_=month_total,
+            ),
+            month=month,
+        )
+        .returning(BudgetModel.monthly_limit, BudgetModel.spent)
+    )
+
+
+def _budget_status(
+    category: str, limit: int, spent: int, added: int
+) -> BudgetStatusSchema:
+    previous = spent - added
+    crossed = [
+        threshold
+        for threshold in BUDGET_WARNING_THRESHOLDS
+        if previous < threshold * limit <= spent
+    ]
+    return BudgetStatusSchema(
+        category=category,
+        limit=Money(limit),
+        spent=Money(spent),
+        crossed=max(crossed, default=None),
+    )
+
+
+async def _update_budgets(
+    db: AsyncSession, rows: List[dict]
+) -> List[Optional[BudgetStatusSchema]]:
+    """Apply expense rows to their budgets; return each row's budget status.
+
+    One UPDATE per (user, category, month) in the batch, each touching a
+    single budget row, so the write path never re-aggregates expenses.
+    """
+    groups: Dict[Tuple[int, str, date], List[int]] = {}
+    for index, row in enumerate(rows):
+        key = (row["user_id"], row["category"], month_start(row["date"].date()))
+        groups.setdefault(key, []).append(index)
+
+    statuses: List[Optional[BudgetStatusSchema]] = [None] * len(rows)
+    statement = _build_budget_update()
+    for (user_id, category, month), indexes in groups.items():
+        added = sum(rows[index]["amount"] for index in indexes)
+        budget = (
+            await db.execute(
+                statement,
+                {
+                    "budget_user_id": user_id,
+                    "budget_category": category,
+                    "budget_month": month,
+                    "budget_next_month": next_month(month),
+                    "added": added,
+                },
+            )
+        ).one_or_none()
+        if budget is None:
+            continue
+        # Spread the batch total back over its rows in order.
+        spent = budget.spent - added
+        for index in indexes:
+            amount = rows[index]["amount"]
+            spent += amount
+            statuses[index] = _budget_status(category, budget.monthly_limit, spent, amount)
+    return statuses
+
+
+async def set_budget(
+    db: AsyncSession, user_id: int, category: CategoryENUM, limit: Money
+) -> Optional[BudgetStatusSchema]:
+    """Set a category's monthly budget; a zero limit removes it."""
+    if limit <= 0:
+        await db.execute(
+            delete(BudgetModel).where(
+                BudgetModel.user_id == user_id, BudgetModel.category == category.value
+            )
+        )
+        await db.commit()
+        return None
+    month = month_start(date.today())
+    month_total = (
+        select(func.coalesce(func.sum(ExpenseRollupModel.total), 0))
+        .where(
+            ExpenseRollupModel.user_id == user_id,
+            ExpenseRollupModel.category == category.value,
+            ExpenseRollupModel.day >= month,
+            ExpenseRollupModel.day < next_month(month),
+        )
+        .scalar_subquery()
+    )
+    dialect_insert = pg_insert if _dialect_name(db) == "postgresql" else sqlite_insert
+    statement = dialect_insert(BudgetModel).values(
+        user_id=user_id,
+        category=category.value,
+        monthly_limit=int(limit),
+        month=month,
+        spent=month_total,
+    )
+    # The month's total is summed by the upsert itself, and a budget that
+    # already tracks this month keeps the running total expense writes
+    # maintain, so an expense saved meanwhile is never lost.
+    spent = (
+        await db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[BudgetModel.user_id, BudgetModel.category],
+                set_={
+                    "monthly_limit": statement.excluded.monthly_limit,
+                    "month": statement.excluded.month,
+                    "spent": case(
+                        (BudgetModel.month == statement.excluded.month, BudgetModel.spent),
+                        else_=statement.excluded.spent,
+                    ),
+                },
+            ).returning(BudgetModel.spent)
+        )
+    ).scalar_one()
+    await db.commit()
+    return BudgetStatusSchema(category=category.value, limit=limit, spent=Money(spent))
+
+
+async def get_budgets(db: AsyncSession, user_id: int) -> List[BudgetStatusSchema]:
+    """A user's budgets with this month's spending."""
+    month = month_start(date.today())
+    result = await db.execute(
+        select(BudgetModel)
+        .where(BudgetModel.user_id == user_id)
+        .order_by(BudgetModel.category)
+    )
+    return [
+        BudgetStatusSchema(
+            category=budget.category,
+            limit=Money(budget.monthly_limit),
+            # A budget without expenses this month still holds an older total.
+            spent=Money(budget.spent if budget.month == month else 0),
+        )
+        for budget in result.scalars()
+    ]
 
 
 def _today_bounds() -> Tuple[datetime, datetime]:
@@ -37,92 +351,128 @@ def _month_bounds() -> Tuple[datetime, datetime]:
     return start, end
 
 
-async def _fetch_total_value(
-    db: AsyncSession, user_id: int, start: datetime, end: datetime
-) -> float:
-    query = select(func.coalesce(func.sum(ExpenseModel.amount), 0)).where(
-        ExpenseModel.user_id == user_id,
-        ExpenseModel.date >= start,
-        ExpenseModel.date <= end,
-    )
-    total = await db.scalar(query)
-    return float(total or 0)
-
-
-async def _fetch_daily_totals(
-    db: AsyncSession, user_id: int, start: datetime, end: datetime
-) -> List[ExpenseDaySchema]:
-    day_column = _build_daily_group_expr(db).label("day")
-    query = (
-        select(day_column, func.sum(ExpenseModel.amount).label("total"))
-        .where(
-            ExpenseModel.user_id == user_id,
-            ExpenseModel.date >= start,
-            ExpenseModel.date <= end,
-        )
-        .group_by(day_column)
-        .order_by(day_column)
-    )
-    result = await db.execute(query)
-    rows = result.all()
-    return [
-        ExpenseDaySchema(date=_normalize_day_value(row.day), total=float(row.total))
-        for row in rows
-    ]
+# GROUPING() bitmask values for the (day, category) grouping sets.
+_GROUP_DAY = 1
+_GROUP_CATEGORY = 2
+_GROUP_TOTAL = 3
 
 
-def _build_daily_group_expr(db: AsyncSession):
+def _dialect_name(db: AsyncSession) -> Optional[str]:
     bind = getattr(db, "bind", None)
-    dialect_name = None
     if bind is not None and getattr(bind, "dialect", None) is not None:
-        dialect_name = bind.dialect.name
+        return bind.dialect.name
+    return None
+
+
+def _build_daily_group_expr(db: AsyncSession, column=ExpenseModel.date):
+    dialect_name = _dialect_name(db)
     if dialect_name == "sqlite":
-        return func.strftime("%Y-%m-%d", ExpenseModel.date)
+        return func.strftime("%Y-%m-%d", column)
     if dialect_name == "postgresql":
-        return func.date_trunc("day", ExpenseModel.date)
-    return func.date(ExpenseModel.date)
+        return cast(column, Date)
+    return func.date(column)
 
 
 def _normalize_day_value(value):
-    if isinstance(value, date):
-        return value
     if isinstance(value, datetime):
         return value.date()
+    if isinstance(value, date):
+        return value
     if isinstance(value, str):
         return datetime.strptime(value, "%Y-%m-%d").date()
     return value
 
 
-async def _fetch_category_breakdown(
-    db: AsyncSession, user_id: int, start: datetime, end: datetime
-) -> list[CategorySummarySchema]:
-    query = (
+def _build_grouping_sets_query(day_column, category_column, sum_columns, conditions):
+    """Aggregate total, per-day and per-category sums with GROUPING SETS."""
+    return (
         select(
-            ExpenseModel.category,
-            func.sum(ExpenseModel.amount).label("total"),
+            func.grouping(day_column, category_column).label("kind"),
+            day_column.label("day"),
+            category_column.label("category"),
+            *(func.sum(column).label(label) for label, column in sum_columns.items()),
         )
-        .where(
-            ExpenseModel.user_id == user_id,
-            ExpenseModel.date >= start,
-            ExpenseModel.date <= end,
+        .where(*conditions)
+        .group_by(
+            func.grouping_sets(tuple_(day_column), tuple_(category_column), tuple_())
         )
-        .group_by(ExpenseModel.category)
-        .order_by(func.sum(ExpenseModel.amount).desc())
     )
-    result = await db.execute(query)
-    rows = result.all()
-    return [
-        CategorySummarySchema(category=row.category or "Неизвестная", total=float(row.total))
-        for row in rows
-    ]
 
 
-async def get_period_summary(
-    db: AsyncSession, user_id: int, start: datetime, end: datetime
+def _build_union_rollup_query(day_column, category_column, sum_columns, conditions):
+    """Emulate GROUPING SETS with one scan grouped by (day, category).
+
+    The fine-grained groups are folded into the three result sets with
+    UNION ALL, so the source table is still read only once.
+    """
+    groups = (
+        select(
+            day_column.label("day"),
+            category_column.label("category"),
+            *(func.sum(column).label(label) for label, column in sum_columns.items()),
+        )
+        .where(*conditions)
+        .group_by(day_column, category_column)
+        .cte("groups")
+    )
+    sums = [func.sum(groups.c[label]).label(label) for label in sum_columns]
+    return union_all(
+        select(
+            literal(_GROUP_TOTAL).label("kind"),
+            null().label("day"),
+            null().label("category"),
+            *sums,
+        ),
+        select(
+            literal(_GROUP_DAY).label("kind"),
+            groups.c.day,
+            null().label("category"),
+            *sums,
+        ).group_by(groups.c.day),
+        select(
+            literal(_GROUP_CATEGORY).label("kind"),
+            null().label("day"),
+            groups.c.category,
+            *sums,
+        ).group_by(groups.c.category),
+    )
+
+
+def _build_summary_query(db: AsyncSession, day_column, category_column, sum_columns, conditions):
+    """Build the (total, per-day, per-category) query for labelled sum columns."""
+    if _dialect_name(db) == "postgresql":
+        return _build_grouping_sets_query(day_column, category_column, sum_columns, conditions)
+    return _build_union_rollup_query(day_column, category_column, sum_columns, conditions)
+
+
+def _is_day_aligned(start: datetime, end: datetime) -> bool:
+    return start.time() == time.min and end.time() == time.max
+
+
+def _split_summary_rows(
+    rows, column: str = "total", skip_empty: bool = False
 ) -> ExpensePeriodSummarySchema:
-    total = await _fetch_total_value(db, user_id, start, end)
-    daily_totals = await _fetch_daily_totals(db, user_id, start, end)
-    category_breakdown = await _fetch_category_breakdown(db, user_id, start, end)
+    total = Money(0)
+    daily_totals: List[ExpenseDaySchema] = []
+    category_breakdown: List[CategorySummarySchema] = []
+    for row in rows:
+        value = Money(getattr(row, column) or 0)
+        if row.kind == _GROUP_TOTAL:
+            total = value
+        elif skip_empty and not value:
+            continue
+        elif row.kind == _GROUP_DAY:
+            daily_totals.append(
+                ExpenseDaySchema(date=_normalize_day_value(row.day), total=value)
+            )
+        elif row.kind == _GROUP_CATEGORY:
+            category_breakdown.append(
+                CategorySummarySchema(
+                    category=row.category or "Неизвестная", total=value
+                )
+            )
+    daily_totals.sort(key=lambda item: item.date)
+    category_breakdown.sort(key=lambda item: item.total, reverse=True)
     return ExpensePeriodSummarySchema(
         total=total,
         daily_totals=daily_totals,
@@ -130,78 +480,482 @@ async def get_period_summary(
     )
 
 
+async def get_period_summary(
+    db: AsyncSession, user_id: int, start: datetime, end: datetime
+) -> ExpensePeriodSummarySchema:
+    """Get total, daily and category sums for a period in one query.
+
+    Whole-day periods are answered from the rollup table; periods with
+    intra-day bounds fall back to aggregating raw expenses.
+    """
+    if _is_day_aligned(start, end):
+        query = _build_summary_query(
+            db,
+            ExpenseRollupModel.day,
+            ExpenseRollupModel.category,
+            {"total": ExpenseRollupModel.total},
+            [
+                ExpenseRollupModel.user_id == user_id,
+                ExpenseRollupModel.day >= start.date(),
+                ExpenseRollupModel.day <= end.date(),
+            ],
+        )
+    else:
+        query = _build_summary_query(
+            db,
+            _build_daily_group_expr(db),
+            ExpenseModel.category,
+            {"total": ExpenseModel.amount},
+            [
+                ExpenseModel.user_id == user_id,
+                ExpenseModel.date >= start,
+                ExpenseModel.date <= end,
+            ],
+        )
+    result = await db.execute(query)
+    return _split_summary_rows(result.all())
+
+
+async def get_summaries(
+    db: AsyncSession, user_id: int, periods: Dict[str, Tuple[datetime, datetime]]
+) -> Dict[str, ExpensePeriodSummarySchema]:
+    """Get summaries for several periods with one scan over their union.
+
+    Every period becomes a ``SUM(CASE ...)`` column of a single grouped
+    query, so asking for five windows costs the same round trip as one.
+    Days and categories with nothing spent in a period are left out of it.
+    """
+    if not periods:
+        return {}
+    first = min(start for start, _ in periods.values())
+    last = max(end for _, end in periods.values())
+    if all(_is_day_aligned(start, end) for start, end in periods.values()):
+        day_column = ExpenseRollupModel.day
+        sum_columns = {
+            f"total_{index}": case(
+                (day_column.between(start.date(), end.date()), ExpenseRollupModel.total),
+                else_=0,
+            )
+            for index, (start, end) in enumerate(periods.values())
+        }
+        query = _build_summary_query(
+            db,
+            day_column,
+            ExpenseRollupModel.category,
+            sum_columns,
+            [
+                ExpenseRollupModel.user_id == user_id,
+                day_column >= first.date(),
+                day_column <= last.date(),
+            ],
+        )
+    else:
+        sum_columns = {
+            f"total_{index}": case(
+                (ExpenseModel.date.between(start, end), ExpenseModel.amount), else_=0
+            )
+            for index, (start, end) in enumerate(periods.values())
+        }
+        query = _build_summary_query(
+            db,
+            _build_daily_group_expr(db),
+            ExpenseModel.category,
+            sum_columns,
+            [
+                ExpenseModel.user_id == user_id,
+                ExpenseModel.date >= first,
+                ExpenseModel.date <= last,
+            ],
+        )
+    rows = (await db.execute(query)).all()
+    return {
+        name: _split_summary_rows(rows, column, skip_empty=True)
+        for name, column in zip(periods, sum_columns)
+    }
+
+
+def build_summary_periods(today: Optional[date] = None) -> Dict[str, Tuple[datetime, datetime]]:
+    """Today, this week, this month, last month and this year as datetime bounds."""
+    today = today or date.today()
+    end = datetime.combine(today, time.max)
+    month_start = today.replace(day=1)
+    last_month_end = month_start - timedelta(days=1)
+    return {
+        "today": (datetime.combine(today, time.min), end),
+        "week": (datetime.combine(today - timedelta(days=today.weekday()), time.min), end),
+        "month": (datetime.combine(month_start, time.min), end),
+        "last_month": (
+            datetime.combine(last_month_end.replace(day=1), time.min),
+            datetime.combine(last_month_end, time.max),
+        ),
+        "year": (datetime.combine(today.replace(month=1, day=1), time.min), end),
+    }
+
+
+async def _get_cached_summary(
+    db: AsyncSession, user_id: int, period: str, start: datetime, end: datetime
+) -> ExpensePeriodSummarySchema:
+    cache = get_summary_cache()
+    key = (user_id, period, end.date())
+    summary = await cache.get(key)
+    if summary is None:
+        generation = await cache.generation(user_id)
+        summary = await get_period_summary(db, user_id, start, end)
+        # A lagging replica may miss the write that last invalidated this
+        # key, so only primary reads are kept for SUMMARY_CACHE_TTL.
+        if not db.info.get("replica"):
+            await cache.set(key, summary, generation)
+    return summary
+
+
 async def get_today_summary(
     db: AsyncSession, user_id: int
 ) -> ExpensePeriodSummarySchema:
     start, end = _today_bounds()
-    return await get_period_summary(db, user_id, start, end)
+    return await _get_cached_summary(db, user_id, "today", start, end)
 
 
 async def get_month_summary(
     db: AsyncSession, user_id: int
 ) -> ExpensePeriodSummarySchema:
     start, end = _month_bounds()
-    return await get_period_summary(db, user_id, start, end)
+    return await _get_cached_summary(db, user_id, "month", start, end)
 
 
-async def get_today_expenses(db: AsyncSession, user_id: int) -> List[ExpenseSchema]:
-    """Get expenses for today."""
-    today = date.today()
-    start = datetime.combine(today, datetime.min.time())
-    end = datetime.combine(today, datetime.max.time())
-    query = select(ExpenseModel).where(
-        ExpenseModel.user_id == user_id,
-        ExpenseModel.date >= start,
-        ExpenseModel.date <= end,
+async def get_category_totals_by_user(
+    db: AsyncSession,
+    first_day: date,
+    last_day: date,
+    after_user_id: Optional[int] = None,
+    limit: int = 200,
+) -> List[Tuple[int, List[CategorySummarySchema]]]:
+    """Category breakdowns of the next ``limit`` users with expenses in a period.
+
+    Users come in ``user_id`` order after ``after_user_id``, so callers can
+    walk every user chunk by chunk with one grouped query per chunk.
+    """
+    in_period = [
+        ExpenseRollupModel.day >= first_day,
+        ExpenseRollupModel.day <= last_day,
+        ExpenseRollupModel.total != 0,
+    ]
+    if after_user_id is not None:
+        in_period.append(ExpenseRollupModel.user_id > after_user_id)
+    users = (
+        select(ExpenseRollupModel.user_id)
+        .where(*in_period)
+        .group_by(ExpenseRollupModel.user_id)
+        .order_by(ExpenseRollupModel.user_id)
+        .limit(limit)
+    )
+    query = (
+        select(
+            ExpenseRollupModel.user_id,
+            ExpenseRollupModel.category,
+            func.sum(ExpenseRollupModel.total).label("total"),
+        )
+        .where(*in_period, ExpenseRollupModel.user_id.in_(users.scalar_subquery()))
+        .group_by(ExpenseRollupModel.user_id, ExpenseRollupModel.category)
+        .order_by(ExpenseRollupModel.user_id)
+    )
+    result = await db.execute(query)
+    breakdowns: List[Tuple[int, List[CategorySummarySchema]]] = []
+    for row in result:
+        if not breakdowns or breakdowns[-1][0] != row.user_id:
+            breakdowns.append((row.user_id, []))
+        breakdowns[-1][1].append(
+            CategorySummarySchema(category=row.category, total=Money(row.total))
+        )
+    for _, categories in breakdowns:
+        categories.sort(key=lambda item: item.total, reverse=True)
+    return breakdowns
+
+
+async def _get_expenses_between(
+    db: AsyncSession, user_id: int, start: datetime, end: datetime
+) -> List[ExpenseSchema]:
+    query = (
+        select(
+            ExpenseModel.id,
+            ExpenseModel.user_id,
+            ExpenseModel.category,
+            ExpenseModel.amount,
+            ExpenseModel.date,
+        )
+        .where(
+            ExpenseModel.user_id == user_id,
+            ExpenseModel.date >= start,
+            ExpenseModel.date <= end,
+        )
+        .order_by(ExpenseModel.date, ExpenseModel.id)
     )
     result = await db.execute(query)
-    expenses = result.scalars().all()
-    return [ExpenseSchema.from_orm(exp) for exp in expenses]
+    return [ExpenseSchema(**row._mapping) for row in result]
+
+
+async def get_today_expenses(db: AsyncSession, user_id: int) -> List[ExpenseSchema]:
+    """Get expenses for today."""
+    return await _get_expenses_between(db, user_id, *_today_bounds())
 
 
 async def get_month_expenses(db: AsyncSession, user_id: int) -> List[ExpenseSchema]:
     """Get expenses from the start of the month to today."""
-    today = date.today()
-    start = datetime(today.year, today.month, 1)
-    end = datetime.combine(today, datetime.max.time())
-    query = select(ExpenseModel).where(
-        ExpenseModel.user_id == user_id,
-        ExpenseModel.date >= start,
-        ExpenseModel.date <= end,
+    return await _get_expenses_between(db, user_id, *_month_bounds())
+
+
+HistoryCursor = Tuple[datetime, int]
+
+
+def _build_page_query(
+    model,
+    user_id: int,
+    before: Optional[HistoryCursor],
+    after: Optional[HistoryCursor],
+    limit: int,
+):
+    key = tuple_(model.date, model.id)
+    query = select(model.id, model.category, model.amount, model.date).where(
+        model.user_id == user_id
     )
-    result = await db.execute(query)
-    expenses = result.scalars().all()
-    return [ExpenseSchema.from_orm(exp) for exp in expenses]
+    if after is not None:
+        query = query.where(key > tuple_(*after)).order_by(model.date, model.id)
+    else:
+        if before is not None:
+            query = query.where(key < tuple_(*before))
+        query = query.order_by(model.date.desc(), model.id.desc())
+    return query.limit(limit)
 
 
-async def export_expenses_to_csv(
-    db: AsyncSession, user_id: int, start: datetime, end: datetime
-) -> str:
-    """Export expenses to CSV format and return CSV content as string."""
-    import csv
-    from io import StringIO
+async def get_expense_page(
+    db: AsyncSession,
+    user_id: int,
+    before: Optional[HistoryCursor] = None,
+    after: Optional[HistoryCursor] = None,
+    limit: int = HISTORY_PAGE_SIZE,
+) -> ExpensePageSchema:
+    """Return up to ``limit`` expenses, newest first, by keyset on (date, id).
+
+    ``before`` gives the page of older expenses than that (date, id) cursor,
+    ``after`` the page of newer ones; with neither the newest page is
+    returned. The page is merged from one range scan of
+    ``ix_expenses_user_date`` and one of the archive's index, so deep
+    pages cost the same as the first one and the history goes on past
+    the archive cutoff. Archived rows keep their ids, so (date, id) stays
+    unique across both tables.
+    """
+    rows = []
+    for model in (ExpenseModel, ExpenseArchiveModel):
+        query = _build_page_query(model, user_id, before, after, limit + 1)
+        rows.extend((await db.execute(query)).all())
+    rows.sort(key=lambda row: (row.date or datetime.min, row.id), reverse=after is None)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    items = [ExpenseHistoryItemSchema(**row._mapping) for row in rows]
+    if after is not None:
+        return ExpensePageSchema(items=items, has_older=True, has_newer=has_more)
+    return ExpensePageSchema(items=items, has_older=has_more, has_newer=before is not None)
+
+
+@dataclass
+class CsvExport:
+    """CSV report spooled to memory or, past a threshold, to a temporary file."""
+
+    file: SpooledTemporaryFile
+    rows: int
+    size: int
+
 
+async def export_expenses_to_csv(
+    db: AsyncSession,
+    user_id: int,
+    start: datetime,
+    end: datetime,
+    spool_threshold: int = CSV_SPOOL_THRESHOLD,
+) -> CsvExport:
+    """Stream expenses into a UTF-8 (with BOM) CSV file rewound for reading."""
     query = (
-        select(ExpenseModel)
+        select(ExpenseModel.date, ExpenseModel.category, ExpenseModel.amount)
         .where(
             ExpenseModel.user_id == user_id,
             ExpenseModel.date >= start,
             ExpenseModel.date <= end,
         )
         .order_by(ExpenseModel.date.desc())
+        .execution_options(yield_per=CSV_EXPORT_BATCH_SIZE)
     )
-    result = await db.execute(query)
-    expenses = result.scalars().all()
-
-    output = StringIO()
-    writer = csv.writer(output)
+    output = SpooledTemporaryFile(max_size=spool_threshold, mode="w+b")
+    buffer = StringIO()
+    writer = csv.writer(buffer)
     writer.writerow(["Date", "Category", "Amount"])
-    for expense in expenses:
-        writer.writerow(
-            [
-                expense.date.strftime("%Y-%m-%d %H:%M:%S"),
-                expense.category,
-                f"{expense.amount:.2f}",
-            ]
+    output.write(buffer.getvalue().encode("utf-8-sig"))
+    rows = 0
+
+    # A failed or cancelled read must not leave a spilled file behind.
+    try:
+        result = await db.stream(query)
+        async for partition in result.partitions():
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                [
+                    expense_date.strftime("%Y-%m-%d %H:%M:%S"),
+                    category,
+                    f"{Money(amount):.2f}",
+                ]
+                for expense_date, category, amount in partition
+            )
+            output.write(buffer.getvalue().encode("utf-8"))
+            rows += len(partition)
+    except BaseException:
+        output.close()
+        raise
+
+    size = output.tell()
+    output.seek(0)
+    CSV_EXPORT_BYTES.observe(size)
+    CSV_EXPORT_ROWS.inc(amount=rows)
+    return CsvExport(file=output, rows=rows, size=size)
+
+
+def _build_raw_rollup_select(db: AsyncSession, user_id: Optional[int] = None):
+    """Per-day totals of hot and archived expenses, as stored in rollups."""
+    sources = []
+    for model in (ExpenseModel, ExpenseArchiveModel):
+        source = select(model.user_id, model.date, model.category, model.amount)
+        if user_id is not None:
+            source = source.where(model.user_id == user_id)
+        sources.append(source)
+    expenses = union_all(*sources).subquery()
+    day_column = _build_daily_group_expr(db, expenses.c.date)
+    return select(
+        expenses.c.user_id,
+        day_column.label("day"),
+        expenses.c.category,
+        func.sum(expenses.c.amount).label("total"),
+        func.count().label("count"),
+    ).group_by(expenses.c.user_id, day_column, expenses.c.category)
+
+
+async def rebuild_expense_rollups(db: AsyncSession, user_id: Optional[int] = None) -> int:
+    """Recompute rollup rows from raw expenses for one user or for everyone."""
+    delete_query = delete(ExpenseRollupModel)
+    if user_id is not None:
+        delete_query = delete_query.where(ExpenseRollupModel.user_id == user_id)
+    await db.execute(delete_query)
+    result = await db.execute(
+        insert(ExpenseRollupModel).from_select(
+            ["user_id", "day", "category", "total", "count"],
+            _build_raw_rollup_select(db, user_id),
+        )
+    )
+    await db.commit()
+    cache = get_summary_cache()
+    if user_id is None:
+        await cache.clear()
+    else:
+        await cache.invalidate_user(user_id)
+    return result.rowcount
+
+
+async def check_expense_rollups(
+    db: AsyncSession, user_id: Optional[int] = None
+) -> List[RollupMismatchSchema]:
+    """Compare rollup rows with raw expenses and list every disagreement."""
+    expected = {}
+    result = await db.execute(_build_raw_rollup_select(db, user_id))
+    for row in result.all():
+        key = (row.user_id, _normalize_day_value(row.day), row.category)
+        expected[key] = (int(row.total), int(row.count))
+
+    actual = {}
+    rollup_query = select(ExpenseRollupModel)
+    if user_id is not None:
+        rollup_query = rollup_query.where(ExpenseRollupModel.user_id == user_id)
+    result = await db.execute(rollup_query)
+    for rollup in result.scalars():
+        key = (rollup.user_id, _normalize_day_value(rollup.day), rollup.category)
+        actual[key] = (int(rollup.total), int(rollup.count))
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        expected_total, expected_count = expected.get(key, (0, 0))
+        actual_total, actual_count = actual.get(key, (0, 0))
+        if expected_count != actual_count or expected_total != actual_total:
+            mismatches.append(
+                RollupMismatchSchema(
+                    user_id=key[0],
+                    day=key[1],
+                    category=key[2],
+                    expected_total=expected_total,
+                    actual_total=actual_total,
+                    expected_count=expected_count,
+                    actual_count=actual_count,
+                )
+            )
+    return mismatches
+
+
+async def get_usage_totals(db: AsyncSession) -> UsageTotalsSchema:
+    """Users, expenses and money recorded in the database behind ``db``."""
+    row = (
+        await db.execute(
+            select(
+                func.count(func.distinct(ExpenseRollupModel.user_id)),
+                func.coalesce(func.sum(ExpenseRollupModel.count), 0),
+                func.coalesce(func.sum(ExpenseRollupModel.total), 0),
+            )
+        )
+    ).one()
+    return UsageTotalsSchema(users=row[0], expenses=row[1], total=row[2])
+
+
+def archive_cutoff(months: int = ARCHIVE_AFTER_MONTHS, today: Optional[date] = None) -> date:
+    """First day of the oldest month that stays in the hot table."""
+    month = month_start(today or date.today())
+    for _ in range(months):
+        month = month_start(month - timedelta(days=1))
+    return month
+
+
+async def archive_expenses(db: AsyncSession, before: date) -> int:
+    """Move expenses dated before ``before`` into ``expenses_archive``.
+
+    Works one month per transaction, oldest first. Rollups are left alone,
+    so summaries, analytics and digests for archived months stay exact;
+    only the detail rows leave the hot table and its index. On a
+    partitioned table the emptied month partition is dropped instead of
+    deleting its rows one by one. Returns the number of rows moved.
+    """
+    oldest = (await db.execute(select(func.min(ExpenseModel.date)))).scalar()
+    if oldest is None:
+        return 0
+    moved = 0
+    month = month_start(oldest.date())
+    while month < before:
+        end = min(next_month(month), before)
+        start_at = datetime.combine(month, time.min)
+        end_at = datetime.combine(end, time.min)
+        in_month = (ExpenseModel.date >= start_at, ExpenseModel.date < end_at)
+        result = await db.execute(
+            insert(ExpenseArchiveModel).from_select(
+                ["id", "user_id", "category", "amount", "date"],
+                select(
+                    ExpenseModel.id,
+                    ExpenseModel.user_id,
+                    ExpenseModel.category,
+                    ExpenseModel.amount,
+                    ExpenseModel.date,
+                ).where(*in_month),
+            )
         )
-    return output.getvalue()
+        if end == next_month(month):
+            connection = await db.connection()
+            await connection.run_sync(drop_month_partition, month)
+        # Also catches rows that sat in the default partition.
+        await db.execute(delete(ExpenseModel).where(*in_month))
+        await db.commit()
+        moved += result.rowcount
+        month = end
+    return moved
@@ -0,0 +1,148 @@
+import logging
+from dataclasses import dataclass
+from typing import List
+
+from sqlalchemy import delete, func, insert, select, union, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import IMPORT_BATCH_SIZE
+from database import Shard, ShardRouter
+from models import (BudgetModel, ExpenseArchiveModel, ExpenseModel,
+                    ExpenseRollupModel)
+
+logger = logging.getLogger(__name__)
+
+# Every table whose rows belong to one user and live on that user's shard.
+USER_TABLES = (ExpenseModel, ExpenseArchiveModel, ExpenseRollupModel, BudgetModel)
+
+
+class UserMoveConflict(Exception):
+    """Raised when the target shard already holds other rows of the user."""
+
+
+@dataclass(frozen=True)
+class UserMove:
+    user_id: int
+    source: str
+    target: str
+
+
+async def get_shard_user_ids(db: AsyncSession) -> List[int]:
+    """Every user with rows on the shard behind ``db``."""
+    query = union(*(select(model.user_id) for model in USER_TABLES))
+    return sorted((await db.execute(query)).scalars())
+
+
+async def find_misplaced_users(router: ShardRouter) -> List[UserMove]:
+    """Users stored on a shard the hash ring no longer maps them to."""
+    moves = []
+    for name, user_ids in (await router.fan_out(get_shard_user_ids)).items():
+        for user_id in user_ids:
+            target = router.shard_for(user_id).name
+            if target != name:
+                moves.append(UserMove(user_id, name, target))
+    return moves
+
+
+async def _copy_rows(source: AsyncSession, target: AsyncSession, query, model) -> int:
+    copied = 0
+    result = await source.stream(query.execution_options(yield_per=IMPORT_BATCH_SIZE))
+    async for rows in result.mappings().partitions():
+        await target.execute(insert(model), [dict(row) for row in rows])
+        copied += len(rows)
+    return copied
+
+
+def _user_expenses(user_id: int, *columns: str):
+    return union_all(
+        *(
+            select(*(getattr(model, name) for name in columns)).where(
+                model.user_id == user_id
+            )
+            for model in (ExpenseModel, ExpenseArchiveModel)
+        )
+    )
+
+
+async def _user_fingerprint(db: AsyncSession, user_id: int) -> tuple:
+    """Row counts and sums of a user's data, to recognise an earlier copy."""
+    expenses = _user_expenses(user_id, "amount").subquery()
+    queries = (
+        select(func.count(), func.coalesce(func.sum(expenses.c.amount), 0)),
+        select(
+            func.count(),
+            func.coalesce(func.sum(ExpenseRollupModel.total), 0),
+            func.coalesce(func.sum(ExpenseRollupModel.count), 0),
+        ).where(ExpenseRollupModel.user_id == user_id),
+        select(
+            func.count(),
+            func.coalesce(func.sum(BudgetModel.monthly_limit), 0),
+            func.coalesce(func.sum(BudgetModel.spent), 0),
+        ).where(BudgetModel.user_id == user_id),
+    )
+    return tuple([tuple((await db.execute(query)).one()) for query in queries])
+
+
+async def move_user(source: Shard, target: Shard, user_id: int, force: bool = False) -> int:
+    """Copy a user's rows to ``target``, then delete them on ``source``.
+
+    Rows the target already holds for the user are replaced only when they
+    are the copy of a move interrupted between the two commits, which is
+    then simply run again. Anything else, such as expenses written on the
+    target after DATABASE_SHARDS changed, raises UserMoveConflict unless
+    ``force`` is set. Expenses get new ids on the target, and archived
+    ones land in its hot table until the next archive-expenses run; the
+    rollups carry over unchanged.
+    """
+    expenses = _user_expenses(user_id, "user_id", "category", "amount", "date")
+    async with source.session_factory() as source_db, target.session_factory() as target_db:
+        if not force:
+            existing = await _user_fingerprint(target_db, user_id)
+            if existing[0][0] or existing[1][0] or existing[2][0]:
+                if existing != await _user_fingerprint(source_db, user_id):
+                    raise UserMoveConflict(
+                        f"Shard {target.name} already holds other rows of user {user_id}"
+                    )
+        for model in USER_TABLES:
+            await target_db.execute(delete(model).where(model.user_id == user_id))
+        copied = await _copy_rows(source_db, target_db, expenses, ExpenseModel)
+        for model in (ExpenseRollupModel, BudgetModel):
+            await _copy_rows(
+                source_db,
+                target_db,
+                select(model.__table__).where(model.user_id == user_id),
+                model,
+            )
+        await target_db.commit()
+        await source_db.rollback()
+
+        for model in USER_TABLES:
+            await source_db.execute(delete(model).where(model.user_id == user_id))
+        await source_db.commit()
+    logger.info(
+        "Moved user %s from shard %s to %s (%d expenses)",
+        user_id,
+        source.name,
+        target.name,
+        copied,
+    )
+    return copied
+
+
+async def rebalance_shards(
+    router: ShardRouter, dry_run: bool = False, force: bool = False
+) -> List[UserMove]:
+    """Move every misplaced user to the shard the hash ring maps them to.
+
+    Run it after changing ``DATABASE_SHARDS`` while the bot is stopped;
+    until a user is moved, the bot already looks for their rows on the new
+    shard and finds none. ``force`` overwrites what a target shard already
+    holds for a moved user.
+    """
+    moves = await find_misplaced_users(router)
+    if not dry_run:
+        for move in moves:
+            await move_user(
+                router.shards[move.source], router.shards[move.target], move.user_id, force
+            )
+    return moves
@@ -0,0 +1,54 @@
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from cache import get_summary_cache
+from migrations import run_migrations
+
+# PostgreSQL variants run only against a database they may create schemas in.
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL", "")
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def database(request, tmp_path):
+    """Open a session on a freshly migrated database of each dialect.
+
+    Use it as ``async with database() as db``. PostgreSQL tests get a
+    throwaway schema that is dropped afterwards.
+    """
+    schema = None
+    options = {}
+    if request.param == "sqlite":
+        url = f"sqlite+aiosqlite:///{tmp_path / 'test.db'}"
+    elif TEST_POSTGRES_URL:
+        url = TEST_POSTGRES_URL
+        schema = f"test_{uuid.uuid4().hex[:12]}"
+        options["connect_args"] = {"server_settings": {"search_path": schema}}
+    else:
+        pytest.skip("TEST_POSTGRES_URL is not set")
+
+    @asynccontextmanager
+    async def open_database():
+        engine = create_async_engine(url, **options)
+        try:
+            if schema is not None:
+                async with engine.begin() as conn:
+                    await conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+            async with engine.begin() as conn:
+                await conn.run_sync(run_migrations)
+            await get_summary_cache().clear()
+            factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+            async with factory() as db:
+                yield db
+        finally:
+            if schema is not None:
+                async with engine.begin() as conn:
+                    await conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+            await engine.dispose()
+
+    return open_database
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from query_plans import explain_hot_paths
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import add_expenses, archive_expenses, get_expense_page
+
+USER_ID = 7
+FIRST_DAY = datetime(2023, 1, 1, 12)
+
+
+def seed_expenses(days: int = 120):
+    expenses = []
+    for day in range(days):
+        for user_id in (USER_ID, USER_ID + 1):
+            expenses.append(
+                ExpenseCreateSchema(
+                    user_id=user_id,
+                    category=CategoryENUM.FOOD,
+                    amount=Money(100 + day),
+                    date=FIRST_DAY + timedelta(days=day),
+                )
+            )
+    return expenses
+
+
+def test_hot_paths_use_indexes(database):
+    async def scenario():
+        async with database() as db:
+            await add_expenses(db, seed_expenses())
+            await archive_expenses(db, date(2023, 3, 1))
+            plans = await explain_hot_paths(db, USER_ID)
+        assert plans
+        assert [(plan.name, plan.full_scans) for plan in plans if plan.full_scans] == []
+
+    asyncio.run(scenario())
+
+
+def test_history_pages_continue_into_the_archive(database):
+    async def scenario():
+        async with database() as db:
+            await add_expenses(db, seed_expenses())
+            archived = await archive_expenses(db, date(2023, 3, 1))
+            assert archived
+
+            keys = []
+            page = await get_expense_page(db, USER_ID, limit=7)
+            while True:
+                keys.extend((item.date, item.id) for item in page.items)
+                if not page.has_older:
+                    break
+                last = page.items[-1]
+                page = await get_expense_page(db, USER_ID, before=(last.date, last.id), limit=7)
+            assert len(keys) == 120
+            assert keys == sorted(keys, reverse=True)
+            assert keys[-1][0] == FIRST_DAY
+
+            oldest = page.items[-1]
+            newer = await get_expense_page(db, USER_ID, after=(oldest.date, oldest.id), limit=7)
+            assert [item.date for item in newer.items] == [
+                FIRST_DAY + timedelta(days=day) for day in range(7, 0, -1)
+            ]
+            assert newer.has_newer
+
+    asyncio.run(scenario())
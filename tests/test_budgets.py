@@ -0,0 +1,38 @@
+import asyncio
+from datetime import datetime
+
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import add_expense, get_budgets, set_budget
+
+USER_ID = 7
+
+
+def expense(kopecks: int) -> ExpenseCreateSchema:
+    return ExpenseCreateSchema(
+        user_id=USER_ID,
+        category=CategoryENUM.FOOD,
+        amount=Money(kopecks),
+        date=datetime.now(),
+    )
+
+
+def test_set_budget_counts_the_month_and_keeps_the_running_total(database):
+    async def scenario():
+        async with database() as db:
+            await add_expense(db, expense(10000))
+            budget = await set_budget(db, USER_ID, CategoryENUM.FOOD, Money(100000))
+            assert budget.spent == Money(10000)
+
+            saved = await add_expense(db, expense(5000))
+            assert saved.budget.spent == Money(15000)
+
+            budget = await set_budget(db, USER_ID, CategoryENUM.FOOD, Money(200000))
+            assert (budget.limit, budget.spent) == (Money(200000), Money(15000))
+            assert [(item.limit, item.spent) for item in await get_budgets(db, USER_ID)] == [
+                (Money(200000), Money(15000))
+            ]
+
+            assert await set_budget(db, USER_ID, CategoryENUM.FOOD, Money(0)) is None
+            assert await get_budgets(db, USER_ID) == []
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+import asyncio
+from datetime import datetime
+
+import services
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import add_expense, get_today_summary
+
+USER_ID = 7
+
+
+def expense() -> ExpenseCreateSchema:
+    return ExpenseCreateSchema(
+        user_id=USER_ID, category=CategoryENUM.FOOD, amount=Money(5000), date=datetime.now()
+    )
+
+
+def test_summary_read_racing_a_write_is_not_cached(database, monkeypatch):
+    async def scenario():
+        async with database() as db:
+            compute = services.get_period_summary
+
+            async def summary_then_write(*args):
+                summary = await compute(*args)
+                # A write commits and invalidates after the read finished
+                # but before its result reaches the cache.
+                await add_expense(db, expense())
+                return summary
+
+            await add_expense(db, expense())
+            monkeypatch.setattr(services, "get_period_summary", summary_then_write)
+            stale = await get_today_summary(db, USER_ID)
+            monkeypatch.setattr(services, "get_period_summary", compute)
+
+            assert stale.total == Money(5000)
+            assert (await get_today_summary(db, USER_ID)).total == Money(10000)
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from delivery import DeliveryQueue
+
+
+def test_burst_to_one_chat_does_not_hold_other_chats():
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append((method.chat_id, method.text, time.monotonic()))
+        return method.text
+
+    async def scenario():
+        delivery = DeliveryQueue(
+            global_rate=1000, global_burst=1000, chat_rate=10, chat_burst=1, concurrency=2
+        )
+        started = time.monotonic()
+        burst = [
+            asyncio.create_task(
+                delivery.submit(make_request, None, SendMessage(chat_id=1, text=str(index)))
+            )
+            for index in range(10)
+        ]
+        await asyncio.sleep(0)
+        other = await asyncio.gather(
+            *(
+                delivery.submit(make_request, None, SendMessage(chat_id=chat, text="hi"))
+                for chat in (2, 3)
+            )
+        )
+        other_done = time.monotonic() - started
+        await asyncio.gather(*burst)
+        burst_done = time.monotonic() - started
+        await delivery.close()
+        return other, other_done, burst_done
+
+    other, other_done, burst_done = asyncio.run(scenario())
+    assert other == ["hi", "hi"]
+    assert other_done < 0.3
+    assert burst_done >= 0.8
+    assert [text for chat, text, _ in sent if chat == 1] == [str(index) for index in range(10)]
+
+
+def test_retry_after_keeps_chat_order_without_blocking_workers():
+    calls = []
+
+    async def make_request(bot, method):
+        calls.append(method.text)
+        if method.text == "first" and calls.count("first") == 1:
+            raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=0.2)
+        return method.text
+
+    async def scenario():
+        delivery = DeliveryQueue(
+            global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=10, concurrency=1
+        )
+        results = await asyncio.gather(
+            delivery.submit(make_request, None, SendMessage(chat_id=1, text="first")),
+            delivery.submit(make_request, None, SendMessage(chat_id=1, text="second")),
+            delivery.submit(make_request, None, SendMessage(chat_id=2, text="other")),
+        )
+        stats = delivery.stats
+        await delivery.close()
+        return results, stats
+
+    results, stats = asyncio.run(scenario())
+    assert results == ["first", "second", "other"]
+    assert calls == ["first", "other", "first", "second"]
+    assert stats.retried == 1
+    assert stats.queued == 0
@@ -0,0 +1,43 @@
+import asyncio
+from datetime import datetime
+from tempfile import SpooledTemporaryFile
+
+import pytest
+
+import services
+from services import export_expenses_to_csv
+
+
+class FailingStream:
+    async def partitions(self):
+        yield [(datetime(2024, 3, 1, 12), "еда", 15000)] * 50
+        raise TimeoutError("statement timeout")
+
+
+class FailingSession:
+    async def stream(self, query):
+        return FailingStream()
+
+
+def test_failed_export_closes_its_spool_file(monkeypatch):
+    spools = []
+
+    def track(*args, **kwargs):
+        spools.append(SpooledTemporaryFile(*args, **kwargs))
+        return spools[-1]
+
+    monkeypatch.setattr(services, "SpooledTemporaryFile", track)
+
+    async def scenario():
+        with pytest.raises(TimeoutError):
+            await export_expenses_to_csv(
+                FailingSession(),
+                7,
+                datetime(2024, 3, 1),
+                datetime(2024, 4, 1),
+                spool_threshold=64,
+            )
+
+    asyncio.run(scenario())
+    assert len(spools) == 1
+    assert spools[0].closed
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from fsm_storage import SQLStorage
+from migrations import run_migrations
+from models import FSMStateModel
+
+KEY = StorageKey(bot_id=1, chat_id=7, user_id=7)
+
+
+def test_writing_to_an_expired_row_starts_from_scratch(tmp_path):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'fsm.db'}")
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(run_migrations)
+            storage = SQLStorage(engine, cache_ttl=0)
+            await storage.set_state(KEY, "BudgetStates:waiting_limit")
+            await storage.set_data(KEY, {"budget_category": "еда"})
+
+            async with engine.begin() as conn:
+                await conn.execute(
+                    update(FSMStateModel).values(
+                        expires_at=datetime.utcnow() - timedelta(seconds=1)
+                    )
+                )
+            await storage.set_state(KEY, "ExpenseStates:waiting_amount")
+            assert await storage.get_data(KEY) == {}
+
+            await storage.set_data(KEY, {"category": "еда"})
+            assert await storage.get_state(KEY) == "ExpenseStates:waiting_amount"
+
+            async with engine.begin() as conn:
+                await conn.execute(
+                    update(FSMStateModel).values(
+                        expires_at=datetime.utcnow() - timedelta(seconds=1)
+                    )
+                )
+            await storage.set_data(KEY, {"category": "еда"})
+            assert await storage.get_state(KEY) is None
+            assert await storage.get_data(KEY) == {"category": "еда"}
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+import asyncio
+import io
+
+import services
+from importer import import_csv
+
+USER_ID = 7
+
+CSV = (
+    "Date,Category,Amount\n"
+    "2024-03-01 12:00:00,еда,150.00\n"
+    "2024-03-01 12:00:00,еда,150.00\n"
+    "2024-03-01 18:30:00,транспорт,60.00\n"
+    "2024-03-01 12:00:00,еда,150.00\n"
+)
+
+
+def test_identical_rows_in_one_file_are_all_imported(database):
+    async def scenario():
+        async with database() as db:
+            first = await import_csv(db, USER_ID, io.BytesIO(CSV.encode()), batch_size=2)
+            again = await import_csv(db, USER_ID, io.BytesIO(CSV.encode()), batch_size=2)
+        assert (first.imported, first.duplicates) == (4, 0)
+        assert (again.imported, again.duplicates) == (0, 4)
+
+    asyncio.run(scenario())
+
+
+def test_longer_file_imports_only_the_extra_repeats(database):
+    async def scenario():
+        async with database() as db:
+            head = CSV.split("\n", 2)
+            await import_csv(db, USER_ID, io.BytesIO("\n".join(head[:2]).encode()))
+            progress = await import_csv(db, USER_ID, io.BytesIO(CSV.encode()))
+        assert (progress.imported, progress.duplicates) == (3, 1)
+
+    asyncio.run(scenario())
+
+
+def test_unsorted_file_is_deduplicated_across_lookup_chunks(database, monkeypatch):
+    monkeypatch.setattr(services, "EXISTING_KEY_RANGES_PER_QUERY", 2)
+    rows = [
+        f"2024-0{month}-1{day} 08:00:0{second},еда,{month}{day}.00"
+        for month in (5, 1, 3)
+        for day in (2, 1)
+        for second in (1, 0)
+    ]
+    text = "Date,Category,Amount\n" + "\n".join(rows) + "\n"
+
+    async def scenario():
+        async with database() as db:
+            first = await import_csv(db, USER_ID, io.BytesIO(text.encode()), batch_size=5)
+            again = await import_csv(db, USER_ID, io.BytesIO(text.encode()), batch_size=5)
+        assert (first.imported, first.duplicates) == (12, 0)
+        assert (again.imported, again.duplicates) == (0, 12)
+
+    asyncio.run(scenario())
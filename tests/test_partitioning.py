@@ -0,0 +1,56 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, text
+
+from models import ExpenseArchiveModel
+from partitioning import is_partitioned, partition_exists, partition_expenses
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import (add_expense, add_expenses, archive_expenses,
+                      check_expense_rollups)
+
+USER_ID = 7
+
+
+def expense(when: datetime) -> ExpenseCreateSchema:
+    return ExpenseCreateSchema(
+        user_id=USER_ID, category=CategoryENUM.FOOD, amount=Money(2500), date=when
+    )
+
+
+@pytest.mark.parametrize("database", ["postgresql"], indirect=True)
+def test_partitioned_expenses_keep_ids_and_archive_by_dropping_months(database):
+    async def scenario():
+        async with database() as db:
+            first = datetime(2023, 11, 1, 12)
+            seeded = [expense(first + timedelta(days=day)) for day in range(0, 100, 5)]
+            seeded.append(expense(datetime.now()))
+            await add_expenses(db, seeded)
+
+            connection = await db.connection()
+            created = await connection.run_sync(partition_expenses)
+            await db.commit()
+            connection = await db.connection()
+            assert await connection.run_sync(is_partitioned)
+            assert "expenses_y2023m11" in created
+
+            saved = await add_expense(db, expense(datetime.now()))
+            last_value = (
+                await db.execute(text("SELECT last_value FROM expenses_id_seq"))
+            ).scalar()
+            assert saved.id == last_value == len(seeded) + 1
+
+            moved = await archive_expenses(db, date(2024, 1, 1))
+            assert moved == sum(item.date < datetime(2024, 1, 1) for item in seeded)
+            connection = await db.connection()
+            for month in (date(2023, 11, 1), date(2023, 12, 1)):
+                assert not await connection.run_sync(partition_exists, month)
+            assert await connection.run_sync(partition_exists, date(2024, 1, 1))
+            archived = (
+                await db.execute(select(func.count()).select_from(ExpenseArchiveModel))
+            ).scalar()
+            assert archived == moved
+            assert await check_expense_rollups(db, USER_ID) == []
+
+    asyncio.run(scenario())
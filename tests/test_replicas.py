@@ -0,0 +1,52 @@
+import asyncio
+from datetime import datetime
+
+from cache import get_summary_cache
+from database import ShardRouter
+from migrations import run_migrations
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import add_expense, get_today_summary
+
+USER_ID = 7
+
+
+def test_replica_reads_do_not_fill_the_summary_cache(tmp_path):
+    async def scenario():
+        router = ShardRouter(
+            {"default": f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"},
+            {"default": [f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"]},
+            pin_seconds=0,
+        )
+        replica = router.home.replicas[0]
+        try:
+            await router.run_sync(run_migrations)
+            async with replica.engine.begin() as conn:
+                await conn.run_sync(run_migrations)
+            await get_summary_cache().clear()
+
+            # The replica never receives this write, like one lagging behind.
+            async with router.session(USER_ID) as db:
+                await add_expense(
+                    db,
+                    ExpenseCreateSchema(
+                        user_id=USER_ID,
+                        category=CategoryENUM.FOOD,
+                        amount=Money(10000),
+                        date=datetime.now(),
+                    ),
+                )
+            stale = await router.read(get_today_summary, USER_ID)
+            assert stale.total == 0
+
+            replica.down_until = float("inf")
+            fresh = await router.read(get_today_summary, USER_ID)
+            assert fresh.total == Money(10000)
+
+            replica.down_until = 0.0
+            cached = await router.read(get_today_summary, USER_ID)
+            assert cached.total == Money(10000)
+            assert router.read_stats["replica"] == 2
+        finally:
+            await router.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,60 @@
+import asyncio
+from datetime import date, datetime
+
+from database import ShardRouter
+from migrations import run_migrations
+from scheduler import MONTHLY, DigestScheduler, due_periods
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import add_expenses
+
+
+def monthly(now: datetime, catch_up_days: int = 3):
+    return [
+        period.first_day
+        for period in due_periods(now, send_hour=9, catch_up_days=catch_up_days)
+        if period.kind == MONTHLY
+    ]
+
+
+def test_monthly_digest_is_due_during_the_catch_up_window():
+    assert monthly(datetime(2024, 3, 1, 10)) == [date(2024, 2, 1)]
+    assert monthly(datetime(2024, 3, 3, 23)) == [date(2024, 2, 1)]
+    # Before the send hour on the 1st the previous month is not over yet.
+    assert monthly(datetime(2024, 3, 1, 8)) == []
+    assert monthly(datetime(2024, 3, 4, 10)) == []
+    assert monthly(datetime(2024, 1, 2, 10)) == [date(2023, 12, 1)]
+    assert monthly(datetime(2024, 3, 2, 10), catch_up_days=1) == []
+
+
+def test_missed_monthly_digest_is_sent_once_on_a_later_day(tmp_path):
+    async def scenario():
+        router = ShardRouter({"default": f"sqlite+aiosqlite:///{tmp_path / 'digests.db'}"})
+        delivered = []
+
+        async def deliver(digest):
+            delivered.append((digest.kind, digest.user_id))
+
+        try:
+            await router.run_sync(run_migrations)
+            async with router.session(7) as db:
+                await add_expenses(
+                    db,
+                    [
+                        ExpenseCreateSchema(
+                            user_id=7,
+                            category=CategoryENUM.FOOD,
+                            amount=Money(5000),
+                            date=datetime(2024, 2, 10, 12),
+                        )
+                    ],
+                )
+            scheduler = DigestScheduler(
+                deliver, session_factory=router.session, router=router, renderer=None
+            )
+            await scheduler.run_due(datetime(2024, 3, 2, 10))
+            await scheduler.run_due(datetime(2024, 3, 3, 10))
+        finally:
+            await router.dispose()
+        assert delivered == [(MONTHLY, 7)]
+
+    asyncio.run(scenario())
@@ -0,0 +1,117 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from database import HashRing, ShardRouter
+from migrations import run_migrations
+from schemas import CategoryENUM, ExpenseCreateSchema, Money
+from services import (add_expenses, archive_expenses, check_expense_rollups,
+                      get_usage_totals)
+from sharding import (UserMoveConflict, find_misplaced_users,
+                      get_shard_user_ids, move_user, rebalance_shards)
+
+USERS = range(1, 41)
+
+
+def user_expenses(user_id: int):
+    return [
+        ExpenseCreateSchema(
+            user_id=user_id,
+            category=list(CategoryENUM)[day % len(CategoryENUM)],
+            amount=Money(1000 * user_id + day),
+            date=datetime(2023, 11, 1, 12) + timedelta(days=day * 20),
+        )
+        for day in range(4)
+    ]
+
+
+def make_router(tmp_path, names) -> ShardRouter:
+    return ShardRouter({name: f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in names})
+
+
+async def seed(router: ShardRouter) -> None:
+    await router.run_sync(run_migrations)
+    for user_id in USERS:
+        async with router.session(user_id) as db:
+            await add_expenses(db, user_expenses(user_id))
+    await router.fan_out(archive_expenses, date(2024, 1, 1))
+
+
+async def totals(router: ShardRouter):
+    results = (await router.fan_out(get_usage_totals)).values()
+    return (
+        sum(item.users for item in results),
+        sum(item.expenses for item in results),
+        sum(item.total for item in results),
+    )
+
+
+def test_hash_ring_only_moves_users_onto_an_added_shard():
+    before = HashRing(["a", "b"])
+    after = HashRing(["a", "b", "c"])
+    moved = [
+        user_id
+        for user_id in range(10000)
+        if before.shard_for(user_id) != after.shard_for(user_id)
+    ]
+    assert all(after.shard_for(user_id) == "c" for user_id in moved)
+    assert 2000 < len(moved) < 4700
+
+
+def test_rebalance_moves_users_onto_the_new_shard_and_keeps_totals(tmp_path):
+    async def scenario():
+        old = make_router(tmp_path, ["a", "b"])
+        new = make_router(tmp_path, ["a", "b", "c"])
+        try:
+            await seed(old)
+            expected = await totals(old)
+            await new.run_sync(run_migrations)
+
+            moves = await rebalance_shards(new)
+            assert moves
+            assert {move.target for move in moves} == {"c"}
+            for name, user_ids in (await new.fan_out(get_shard_user_ids)).items():
+                assert all(new.shard_for(user_id).name == name for user_id in user_ids)
+            assert await totals(new) == expected
+            mismatches = await new.fan_out(check_expense_rollups)
+            assert all(items == [] for items in mismatches.values())
+
+            assert await rebalance_shards(new) == []
+        finally:
+            await old.dispose()
+            await new.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_rebalance_refuses_to_overwrite_other_rows_on_the_target(tmp_path):
+    async def scenario():
+        old = make_router(tmp_path, ["a", "b"])
+        new = make_router(tmp_path, ["a", "b", "c"])
+        try:
+            await seed(old)
+            expected = await totals(old)
+            await new.run_sync(run_migrations)
+            copied, written = (await find_misplaced_users(new))[:2]
+
+            # The first user's rows reached the target before an interrupted
+            # move; the second one wrote an expense there after the switch.
+            async with new.shards["c"].session_factory() as db:
+                await add_expenses(db, user_expenses(copied.user_id))
+                await archive_expenses(db, date(2024, 1, 1))
+                await add_expenses(db, user_expenses(written.user_id)[:1])
+
+            await move_user(new.shards[copied.source], new.shards["c"], copied.user_id)
+            with pytest.raises(UserMoveConflict):
+                await rebalance_shards(new)
+            assert written in await find_misplaced_users(new)
+
+            await rebalance_shards(new, force=True)
+            assert await find_misplaced_users(new) == []
+            assert await totals(new) == expected
+        finally:
+            await old.dispose()
+            await new.dispose()
+
+    asyncio.run(scenario())
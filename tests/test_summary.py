@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql
+
+from models import ExpenseModel
+from schemas import (CategoryENUM, ExpenseCreateSchema, ExpenseDaySchema,
+                     ExpensePeriodSummarySchema, Money)
+from services import (_build_daily_group_expr, _build_grouping_sets_query,
+                      _normalize_day_value, add_expenses, get_period_summary)
+
+USER_ID = 1
+OTHER_USER_ID = 2
+DAY = datetime(2024, 5, 14)
+
+
+async def three_query_summary(db, user_id, start, end) -> ExpensePeriodSummarySchema:
+    """The total, per-day and per-category queries get_period_summary replaced."""
+    conditions = [
+        ExpenseModel.user_id == user_id,
+        ExpenseModel.date >= start,
+        ExpenseModel.date <= end,
+    ]
+    total = await db.scalar(
+        select(func.coalesce(func.sum(ExpenseModel.amount), 0)).where(*conditions)
+    )
+    day_column = _build_daily_group_expr(db).label("day")
+    result = await db.execute(
+        select(day_column, func.sum(ExpenseModel.amount).label("total"))
+        .where(*conditions)
+        .group_by(day_column)
+        .order_by(day_column)
+    )
+    daily = [
+        ExpenseDaySchema(date=_normalize_day_value(row.day), total=row.total)
+        for row in result
+    ]
+    result = await db.execute(
+        select(ExpenseModel.category, func.sum(ExpenseModel.amount).label("total"))
+        .where(*conditions)
+        .group_by(ExpenseModel.category)
+    )
+    categories = [{"category": row.category, "total": row.total} for row in result]
+    return ExpensePeriodSummarySchema(
+        total=total, daily_totals=daily, category_breakdown=categories
+    )
+
+
+def category_totals(summary: ExpensePeriodSummarySchema) -> Dict[str, Money]:
+    return {item.category: item.total for item in summary.category_breakdown}
+
+
+def seed_expenses() -> List[ExpenseCreateSchema]:
+    expenses = []
+    for day in range(3):
+        for hour, category, amount in (
+            (9, CategoryENUM.FOOD, 12050),
+            (13, CategoryENUM.TRANSPORT, 6000),
+            (13, CategoryENUM.FOOD, 999),
+            (23, CategoryENUM.RESTAURANTS, 45001),
+        ):
+            expenses.append(
+                ExpenseCreateSchema(
+                    user_id=USER_ID,
+                    category=category,
+                    amount=Money(amount + day),
+                    date=DAY + timedelta(days=day, hours=hour, minutes=59),
+                )
+            )
+    expenses.append(
+        ExpenseCreateSchema(
+            user_id=OTHER_USER_ID,
+            category=CategoryENUM.FOOD,
+            amount=Money(100000),
+            date=DAY + timedelta(hours=12),
+        )
+    )
+    return expenses
+
+
+PERIODS = {
+    "whole days": (DAY, DAY + timedelta(days=2, hours=23, minutes=59, seconds=59.999999)),
+    "intra-day": (DAY + timedelta(hours=10), DAY + timedelta(days=1, hours=14)),
+    "empty": (DAY - timedelta(days=10), DAY - timedelta(days=9)),
+}
+
+
+def test_period_summary_matches_three_queries(database):
+    async def scenario():
+        async with database() as db:
+            await add_expenses(db, seed_expenses())
+            for name, (start, end) in PERIODS.items():
+                expected = await three_query_summary(db, USER_ID, start, end)
+                actual = await get_period_summary(db, USER_ID, start, end)
+                assert actual.total == expected.total, name
+                assert actual.daily_totals == expected.daily_totals, name
+                assert category_totals(actual) == category_totals(expected), name
+                totals = [item.total for item in actual.category_breakdown]
+                assert totals == sorted(totals, reverse=True), name
+
+    asyncio.run(scenario())
+
+
+def test_grouping_sets_query_compiles_for_postgresql():
+    day_column = func.date(ExpenseModel.date)
+    query = _build_grouping_sets_query(
+        day_column,
+        ExpenseModel.category,
+        {"total": ExpenseModel.amount},
+        [ExpenseModel.user_id == USER_ID],
+    )
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "GROUPING SETS" in sql
+    assert sql.count("FROM expenses") == 1
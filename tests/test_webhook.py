@@ -0,0 +1,62 @@
+import asyncio
+import queue
+from collections import defaultdict
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmarks.fake_bot import callback_update, message_update
+from webhook import create_ingress_app
+
+
+def user_of(payload: dict) -> int:
+    event = payload.get("message") or payload.get("callback_query")
+    return event["from"]["id"]
+
+
+def test_ingress_keeps_each_user_on_one_worker_in_order():
+    queues = [queue.Queue() for _ in range(3)]
+    payloads = []
+    for step in range(3):
+        for user_id in range(1, 11):
+            update_id = len(payloads) + 1
+            if step == 1:
+                payloads.append(callback_update(update_id, user_id, "category_еда"))
+            else:
+                payloads.append(message_update(update_id, user_id, str(step)))
+
+    async def scenario():
+        async with TestClient(TestServer(create_ingress_app(queues, secret="s"))) as client:
+            unauthorized = await client.post("/webhook", json=payloads[0])
+            assert unauthorized.status == 401
+            for payload in payloads:
+                response = await client.post(
+                    "/webhook",
+                    json=payload,
+                    headers={"X-Telegram-Bot-Api-Secret-Token": "s"},
+                )
+                assert response.status == 200
+
+    asyncio.run(scenario())
+    workers = defaultdict(set)
+    for index, worker_queue in enumerate(queues):
+        received = list(worker_queue.queue)
+        for payload in received:
+            workers[user_of(payload)].add(index)
+        for user_id in {user_of(payload) for payload in received}:
+            ids = [payload["update_id"] for payload in received if user_of(payload) == user_id]
+            assert ids == sorted(ids)
+            assert len(ids) == 3
+    assert all(len(indexes) == 1 for indexes in workers.values())
+    assert len(workers) == 10
+
+
+def test_ingress_rejects_updates_when_the_worker_queue_is_full():
+    queues = [queue.Queue(maxsize=1)]
+
+    async def scenario():
+        async with TestClient(TestServer(create_ingress_app(queues, secret=""))) as client:
+            first = await client.post("/webhook", json=message_update(1, 1, "a"))
+            second = await client.post("/webhook", json=message_update(2, 1, "b"))
+            return first.status, second.status
+
+    assert asyncio.run(scenario()) == (200, 503)
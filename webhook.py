@@ -0,0 +1,281 @@
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import queue
+from typing import Callable, List, Optional
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+from pydantic import ValidationError
+
+from config import (WEBHOOK_HOST, WEBHOOK_LANE_SIZE, WEBHOOK_LANES,
+                    WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET, WEBHOOK_URL,
+                    WEBHOOK_WORKER_QUEUE_SIZE)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def routing_key(update: types.Update) -> int:
+    """Pick the id that must be processed in order: the user, else the chat."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat is not None:
+        return chat.id
+    return update.update_id
+
+
+class UpdateProcessor:
+    """Feed updates to the dispatcher concurrently, one lane per group of users.
+
+    Updates with the same routing key always land in the same lane and are
+    processed one after another, so a user's FSM steps never race. Lanes are
+    bounded; ``submit`` returns False when the target lane is full.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        lanes: int = WEBHOOK_LANES,
+        lane_size: int = WEBHOOK_LANE_SIZE,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self._queues: List[asyncio.Queue] = [
+            asyncio.Queue(maxsize=lane_size) for _ in range(max(lanes, 1))
+        ]
+        self._workers: List[asyncio.Task] = []
+        self.processed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._run_lane(queue)) for queue in self._queues]
+
+    async def stop(self) -> None:
+        """Finish queued updates, then stop the lane workers."""
+        await self.join()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self) -> None:
+        """Wait until every submitted update has been processed."""
+        for queue in self._queues:
+            await queue.join()
+
+    def _lane(self, update: types.Update) -> asyncio.Queue:
+        return self._queues[routing_key(update) % len(self._queues)]
+
+    def submit(self, update: types.Update) -> bool:
+        try:
+            self._lane(update).put_nowait(update)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        return True
+
+    async def put(self, update: types.Update) -> None:
+        """Queue an update, waiting while its lane is full."""
+        await self._lane(update).put(update)
+
+    async def _run_lane(self, queue: asyncio.Queue) -> None:
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception:
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+
+def _is_authorized(request: web.Request, secret: str) -> bool:
+    return not secret or hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret)
+
+
+def create_app(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    secret: str = WEBHOOK_SECRET,
+    path: str = WEBHOOK_PATH,
+    processor: Optional[UpdateProcessor] = None,
+) -> web.Application:
+    """Build the aiohttp application that receives Telegram updates."""
+    app = web.Application()
+    processor = processor or UpdateProcessor(dispatcher, bot)
+    app["processor"] = processor
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not _is_authorized(request, secret):
+            return web.Response(status=401)
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": bot})
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        if not processor.submit(update):
+            # Telegram redelivers the update later.
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(_: web.Application) -> None:
+        processor.start()
+
+    async def on_cleanup(_: web.Application) -> None:
+        await processor.stop()
+
+    app.router.add_post(path, handle_update)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def register_webhook(dispatcher: Dispatcher, bot: Bot) -> None:
+    await bot.set_webhook(
+        f"{WEBHOOK_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, register: bool = True) -> None:
+    """Serve the webhook in this process until cancelled."""
+    if register:
+        await register_webhook(dispatcher, bot)
+    runner = web.AppRunner(create_app(dispatcher, bot))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Listening for updates on %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()
+
+
+def create_ingress_app(
+    queues: List[multiprocessing.Queue],
+    secret: str = WEBHOOK_SECRET,
+    path: str = WEBHOOK_PATH,
+) -> web.Application:
+    """Build the application that forwards updates to worker processes.
+
+    Updates with the same routing key always go to the same worker, in the
+    order they arrived, so a user's FSM steps stay ordered across workers.
+    """
+    app = web.Application()
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if not _is_authorized(request, secret):
+            return web.Response(status=401)
+        try:
+            payload = await request.json()
+            update = types.Update.model_validate(payload)
+        except (ValueError, ValidationError):
+            return web.Response(status=400)
+        try:
+            queues[routing_key(update) % len(queues)].put_nowait(payload)
+        except queue.Full:
+            # Telegram redelivers the update later.
+            return web.Response(status=503)
+        return web.Response()
+
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def run_ingress(queues: List[multiprocessing.Queue]) -> None:
+    """Receive webhook updates until cancelled, then tell the workers to stop."""
+    runner = web.AppRunner(create_ingress_app(queues))
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info(
+        "Forwarding updates on %s:%s%s to %d workers",
+        WEBHOOK_HOST,
+        WEBHOOK_PORT,
+        WEBHOOK_PATH,
+        len(queues),
+    )
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        for worker_queue in queues:
+            worker_queue.put(None)
+
+
+async def consume_updates(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    updates: multiprocessing.Queue,
+    register: bool = True,
+) -> None:
+    """Process updates forwarded by the ingress process until it sends None."""
+    if register:
+        await register_webhook(dispatcher, bot)
+    processor = UpdateProcessor(dispatcher, bot)
+    processor.start()
+
+    def next_payload():
+        # Poll with a timeout so a cancelled worker does not leave a thread
+        # blocked on the queue.
+        try:
+            return updates.get(timeout=1)
+        except queue.Empty:
+            return False
+
+    try:
+        while True:
+            payload = await asyncio.to_thread(next_payload)
+            if payload is None:
+                break
+            if payload is not False:
+                await processor.put(types.Update.model_validate(payload, context={"bot": bot}))
+    finally:
+        await processor.stop()
+        await bot.session.close()
+
+
+def run_worker_processes(
+    target: Callable[[int, multiprocessing.Queue], None],
+    workers: int,
+    queue_size: int = WEBHOOK_WORKER_QUEUE_SIZE,
+) -> None:
+    """Serve the webhook here and process updates in ``workers`` processes.
+
+    This process only parses updates and forwards each one to the worker
+    ``routing_key(update) % workers`` over its own queue; ``target(index,
+    queue)`` runs the bot in every worker. A user always lands on the same
+    worker, so per-user ordering holds and even in-memory FSM storage works.
+    """
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(maxsize=max(queue_size, 1)) for _ in range(workers)]
+    processes = [
+        context.Process(target=target, args=(index, queues[index])) for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(run_ingress(queues))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.join(timeout=30)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from config import EXPENSE_WRITE_BATCH_DELAY, EXPENSE_WRITE_BATCH_SIZE
+from database import Shard, ShardRouter, shard_router
+from schemas import ExpenseCreateSchema, ExpenseSchema
+from services import add_expenses
+
+logger = logging.getLogger(__name__)
+
+
+class ExpenseWriteError(Exception):
+    """Raised to every caller whose expense was part of a failed batch."""
+
+
+@dataclass
+class WriteBufferStats:
+    batches: int = 0
+    written: int = 0
+    failed: int = 0
+
+
+class ExpenseWriteBuffer:
+    """Group concurrent add_expense calls into one INSERT and one commit.
+
+    A batch is flushed when ``max_batch`` expenses are waiting or
+    ``max_delay`` seconds after the first one arrived, whichever is first.
+    A batch spanning several shards is written as one batch per shard.
+    """
+
+    def __init__(
+        self,
+        router: ShardRouter = shard_router,
+        max_batch: int = EXPENSE_WRITE_BATCH_SIZE,
+        max_delay: float = EXPENSE_WRITE_BATCH_DELAY,
+    ):
+        self.router = router
+        self.max_batch = max(max_batch, 1)
+        self.max_delay = max_delay
+        self.stats = WriteBufferStats()
+        self._pending: List[Tuple[ExpenseCreateSchema, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: set[asyncio.Task] = set()
+        self._closed = False
+
+    async def add(self, expense: ExpenseCreateSchema) -> ExpenseSchema:
+        """Queue an expense and wait until its batch is committed."""
+        if self._closed:
+            raise ExpenseWriteError("Expense write buffer is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Timestamp on arrival so batching never shifts the expense date.
+        if expense.date is None:
+            expense = expense.model_copy(update={"date": datetime.utcnow()})
+        self._pending.append((expense, future))
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._start_flush)
+        return await future
+
+    def _start_flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._flush(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _flush(self, batch: List[Tuple[ExpenseCreateSchema, asyncio.Future]]) -> None:
+        shards: Dict[str, list] = defaultdict(list)
+        for item in batch:
+            shards[self.router.shard_for(item[0].user_id).name].append(item)
+        await asyncio.gather(
+            *(self._write(self.router.shards[name], items) for name, items in shards.items())
+        )
+
+    async def _write(
+        self, shard: Shard, batch: List[Tuple[ExpenseCreateSchema, asyncio.Future]]
+    ) -> None:
+        try:
+            async with shard.session_factory() as db:
+                created = await add_expenses(db, [expense for expense, _ in batch])
+        except Exception as exc:
+            self.stats.failed += len(batch)
+            logger.exception("Failed to write a batch of %d expenses", len(batch))
+            for _, future in batch:
+                if not future.done():
+                    error = ExpenseWriteError("Expense could not be saved")
+                    error.__cause__ = exc
+                    future.set_exception(error)
+            return
+        self.stats.batches += 1
+        self.stats.written += len(created)
+        for (_, future), result in zip(batch, created):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """Stop accepting expenses and wait until everything queued is written."""
+        self._closed = True
+        self._start_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)